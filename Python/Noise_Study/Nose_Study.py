@@ -1,331 +1,458 @@
+import os
+import time
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import scipy.signal as signal
-from itertools import cycle
-from scipy.signal import butter, filtfilt, firwin, filtfilt, savgol_filter
+from itertools import cycle, product
+from joblib import Parallel, delayed
+from scipy.fft import rfft, irfft, next_fast_len
+from scipy.signal import butter, filtfilt, firwin, savgol_filter
 from scipy.stats import zscore
 
-darkdata = 'D:/Noise/AB_OFF_04-01_CALYX/1_S3_Alpha1_DARK AB OFF.xlsx';
-BSdata = 'D:/Noise/AB_OFF_04-01_CALYX/1_TRL05-MLL-04-01_FBU-04_V-2_Calyx5_S Filtered_20240906T103646.csv';
-#BSdata='D:/Noise/1_BS-2 Traget With 200 um Fiber  Xenon_S Filtered_20241009T143601.csv';
-
-# Read data from files
-tempdata = pd.read_excel(darkdata, header=None, usecols='B', skiprows=6, nrows=101).values.flatten()
-avg = np.mean(tempdata)
-
 # Define a list of colors (you can use color palettes like 'tab10', 'viridis', etc.)
 color_cycle = cycle(plt.cm.tab20.colors)
 
-# Read the BS data
-# Read BSdata with appropriate options - make sure this is a pandas DataFrame
-dataread = pd.read_csv(BSdata, skiprows=5, nrows=2068)
-# Select the column to adjust (assuming it's the second column in CSV, index 1)
-dataselect = dataread.iloc[:, 1].astype(str)  # Convert to string if it's not already
 
-# Convert string to float using pd.to_numeric
-dataselect = pd.to_numeric(dataselect, errors='coerce')  # This will turn any non-numeric values into NaN
+def read_dark_average(darkdata):
+    """
+    Read the dark reference file and return its average intensity.
 
-# Exclude rows with NaN values in the second column
-dataread_clean = dataread[~dataselect.isna()]
-#print(dataread_clean)
+    Parameters:
+    darkdata (str): Path of the dark reference Excel file.
 
-dataread_clean = dataread_clean.dropna()
+    Returns:
+    float: The average dark intensity.
+    """
+    tempdata = pd.read_excel(darkdata, header=None, usecols='B', skiprows=6, nrows=101).values.flatten()
+    return np.mean(tempdata)
 
-# If dataread_clean is a DataFrame, convert the relevant column to numeric
-dataread_clean = pd.to_numeric(dataread_clean.iloc[:, 0], errors='coerce')
 
-adjusted = dataselect - avg
+def load_noise_data(BSdata, avg, signal_range=(470, 680), noise_range=(800, 900)):
+    """
+    Read a BS file, subtract the dark average and select the signal and noise regions.
 
-# Convert dataread to a numpy array (first column)
-dataread_array = dataread.iloc[:, 0].to_numpy()
+    Parameters:
+    BSdata (str): Path of the BS csv file.
+    avg (float): Average dark intensity (see read_dark_average).
+    signal_range (tuple): Wavelength range (nm) of the signal region.
+    noise_range (tuple): Wavelength range (nm) of the noise region.
 
-# Find the minimum length of the two arrays
-min_length = min(len(dataread_array), len(adjusted))
+    Returns:
+    tuple: cleanWavelength, cleanIntensity, signalIndices, noiseIndices.
+    """
+    # Read BSdata with appropriate options - make sure this is a pandas DataFrame
+    dataread = pd.read_csv(BSdata, skiprows=5, nrows=2068)
+    # Select the column to adjust (assuming it's the second column in CSV, index 1)
+    dataselect = dataread.iloc[:, 1].astype(str)  # Convert to string if it's not already
 
-# Trim the larger array (dataread_array or adjusted) from the end
-dataread_array = dataread_array[:min_length]
-adjusted = adjusted[:min_length]
+    # Convert string to float using pd.to_numeric
+    dataselect = pd.to_numeric(dataselect, errors='coerce')  # This will turn any non-numeric values into NaN
 
-# Now, you can safely combine the two arrays
-data = np.column_stack((dataread_array, adjusted))
+    adjusted = dataselect - avg
 
-# Clean Data
-wavelength = data[:, 0]
-intensity = data[:, 1]
-wavelength = pd.to_numeric(wavelength, errors='coerce')  # Convert to numeric, turning non-numeric into NaN
-intensity = pd.to_numeric(intensity, errors='coerce')    # Convert to numeric, turning non-numeric into NaN
+    # Convert dataread to a numpy array (first column)
+    dataread_array = dataread.iloc[:, 0].to_numpy()
 
-# Check for NaN values (now safe to use np.isnan)
-validIndices = ~np.isnan(wavelength) & ~np.isnan(intensity)
-cleanWavelength = wavelength[validIndices]
-cleanIntensity = intensity[validIndices]
+    # Find the minimum length of the two arrays
+    min_length = min(len(dataread_array), len(adjusted))
 
-signalIndices = (cleanWavelength >= 470) & (cleanWavelength <= 680)
-signalIntensity = cleanIntensity[signalIndices]
+    # Trim the larger array (dataread_array or adjusted) from the end
+    dataread_array = dataread_array[:min_length]
+    adjusted = adjusted[:min_length]
 
-noiseIndices = (cleanWavelength >= 800) & (cleanWavelength <= 900)
-noiseIntensity = cleanIntensity[noiseIndices]
+    # Now, you can safely combine the two arrays
+    data = np.column_stack((dataread_array, adjusted))
 
+    # Clean Data
+    wavelength = pd.to_numeric(data[:, 0], errors='coerce')  # Convert to numeric, turning non-numeric into NaN
+    intensity = pd.to_numeric(data[:, 1], errors='coerce')   # Convert to numeric, turning non-numeric into NaN
 
-def mean_squared_error(original_intensity, filtered_intensity):
-    """
-    Calculate the Mean Squared Error (MSE) between the original and filtered intensity values.
+    # Check for NaN values (now safe to use np.isnan)
+    validIndices = ~np.isnan(wavelength) & ~np.isnan(intensity)
+    cleanWavelength = wavelength[validIndices]
+    cleanIntensity = intensity[validIndices]
+
+    signalIndices = (cleanWavelength >= signal_range[0]) & (cleanWavelength <= signal_range[1])
+    noiseIndices = (cleanWavelength >= noise_range[0]) & (cleanWavelength <= noise_range[1])
 
+    return cleanWavelength, cleanIntensity, signalIndices, noiseIndices
+
+
+def plot_box_plots(original_signal, filtered_signal, phase_shift, misaligned_count):
+    """
+    Plot box plots to visualize the phase shift.
+    
     Parameters:
-    original_intensity (numpy array): The original signal (before filtering)
-    filtered_intensity (numpy array): The filtered signal (after applying a filtering technique)
+    original_signal (numpy array): The original signal.
+    filtered_signal (numpy array): The filtered signal.
+    phase_shift (int): The phase shift (in samples).
+    """
+    # Shift the filtered signal based on the calculated phase shift
+    if phase_shift > 0:
+        shifted_filtered_signal = np.concatenate((np.zeros(phase_shift), filtered_signal))[:len(original_signal)]
+    elif phase_shift < 0:
+        shifted_filtered_signal = filtered_signal[-phase_shift:]
+    else:
+        shifted_filtered_signal = filtered_signal
 
+    # Create a figure for the box plot
+    plt.figure(figsize=(10, 6))
+
+    # Combine original signal and shifted filtered signal for boxplot
+    data = [original_signal, shifted_filtered_signal]
+
+    # Plot the box plot
+    plt.boxplot(data, vert=False, patch_artist=True, labels=['Original signal', 'Filtered data'])
+
+    # Adding labels and title
+    plt.xlabel('Signal Value')
+    plt.title(f'Box Plot of Original and Filtered Signals with Phase Shift of {phase_shift} for {misaligned_count} data points of total 2068')
+
+    # Display the plot
+    plt.grid(True)
+    plt.show()
+
+
+def butter_lowpass_filter(data, fs, cutoff_freq, order):
+    """
+    Apply a low-pass Butterworth filter to the data.
+    
+    Parameters:
+    data (numpy array): The signal data to filter.
+    fs (int or float): The sampling frequency in Hz.
+    cutoff_freq (float): The cutoff frequency in Hz.
+    order (int): The order of the filter.
+    
     Returns:
-    float: The computed MSE value.
+    numpy array: The filtered signal.
     """
-    original_intensity = np.array(original_intensity)
-    filtered_intensity = np.array(filtered_intensity)
+    # Nyquist frequency is half of the sampling rate
+    nyquist = fs / 2.0
+    
+    # Normalize the cutoff frequency by dividing by the Nyquist frequency
+    normalized_cutoff = cutoff_freq / nyquist
     
-    mse = np.mean((original_intensity - filtered_intensity) ** 2)
-    return mse
+    # Design Butterworth filter
+    b, a = butter(order, normalized_cutoff, btype='low')
+    
+    # Apply the filter using zero-phase filtering (filtfilt)
+    return filtfilt(b, a, data)
+
+
+def moving_mean(data, window_size):
+    """Moving mean filter (same length as data)."""
+    return np.convolve(data, np.ones(window_size) / window_size, mode='same')
+
+
+def rolling_median(data, window_size):
+    """Centered rolling median; the edges without a full window are NaN."""
+    return pd.Series(data).rolling(window=window_size, center=True).median().to_numpy()
+
+
+def fir_lowpass(data, sample_rate, cutoff_freq, numtaps):
+    """Zero-phase FIR low-pass filter designed with a Hamming window."""
+    nyquist_rate = sample_rate / 2.0
+    fir_coeffs = firwin(numtaps, cutoff_freq / nyquist_rate, window='hamming')
+    return filtfilt(fir_coeffs, 1.0, data)
 
-def signal_distortion(original_intensity, filtered_intensity):
+
+def savgol(data, frame_length, poly_order):
+    """Savitzky-Golay filter."""
+    return signal.savgol_filter(data, frame_length, poly_order)
+
+
+# Filters of the sweep: name -> (function, parameter names in loop order, plot title)
+FILTERS = {
+    'fir': (fir_lowpass, ('sample_rate', 'cutoff_freq', 'numtaps'),
+            'FIR Filtered Signals for Different Configurations'),
+    'move_mean': (moving_mean, ('window_size',),
+                  'Moving Mean Filtered Signals for Different Window Sizes'),
+    'median': (rolling_median, ('window_size',),
+               'Median Filtered Signals for Different Window Sizes'),
+    'butter': (butter_lowpass_filter, ('fs', 'cutoff_freq', 'order'),
+               'Low-Pass Butterworth Filtered Signals for Different Configurations'),
+    'savgol': (savgol, ('frame_length', 'poly_order'),
+               'Savitzky-Golay Filtered Signals for Different Frame Lengths and Polynomial Orders'),
+}
+
+
+# Columns of score_filtered, in result order
+METRIC_NAMES = ('MSE', 'Signal Distortion', 'SNR', 'SPNR', "Pearson's r", 'Phase Shift', 'Misaligned Samples Count')
+
+
+def config_label(filter_name, params):
+    """Legend label of one filter configuration (same labels as the per-filter plots)."""
+    if filter_name == 'fir':
+        return f"SR={params['sample_rate']}, CF={params['cutoff_freq']}, NT={params['numtaps']}"
+    if filter_name in ('move_mean', 'median'):
+        return f"Window Size {params['window_size']}"
+    if filter_name == 'butter':
+        return f"fs={params['fs']}, cutoff={params['cutoff_freq']}Hz, order={params['order']}"
+    if filter_name == 'savgol':
+        return f"Frame Length {params['frame_length']}, Poly Order {params['poly_order']}"
+    return ", ".join(f"{name}={value}" for name, value in params.items())
+
+
+def parameter_grid(filter_name, param_lists):
     """
-    Calculate the signal distortion metric between the original and filtered intensity values.
-    
-    Signal distortion is calculated as the ratio of the variance between original and filtered signals
-    to the variance of the original signal.
+    Enumerate every configuration of a filter, in the order of the old nested loops.
 
     Parameters:
-    original_intensity (numpy array): The original signal (before filtering)
-    filtered_intensity (numpy array): The filtered signal (after applying a filtering technique)
+    filter_name (str): Key of FILTERS.
+    param_lists (dict): Parameter name -> list of values, e.g. {'window_size': [5, 15]}.
 
     Returns:
-    float: The computed signal distortion value.
+    list: One dict of parameters per configuration.
     """
-    original_intensity = np.array(original_intensity)
-    filtered_intensity = np.array(filtered_intensity)
-    
-    # Variance-based signal distortion (Ratio of variances)
-    distortion = np.var(filtered_intensity - original_intensity) / np.var(original_intensity)
-    return distortion
+    if filter_name not in FILTERS:
+        raise ValueError(f"Invalid filter! Choose one of {tuple(FILTERS)}.")
+    names = FILTERS[filter_name][1]
+    missing = [name for name in names if name not in param_lists]
+    if missing:
+        raise ValueError(f"Missing parameter lists for {filter_name}: {missing}")
+    return [dict(zip(names, values)) for values in product(*(param_lists[name] for name in names))]
+
 
-def calculate_metrics(original_intensity, filtered_intensity, signal_indices, noise_indices):
+def calculate_phase_shift_batch(original_intensity, filtered_stack):
     """
-    Calculate SNR, SPNR, and Pearson's correlation for the given original and filtered intensity signals.
+    Calculate the phase shift between the original signal and many filtered signals at once.
+
+    The phase shift is the lag that maximizes the cross-correlation of the two signals
+    (the argmax of np.correlate(original, filtered, mode='full')). The cross-correlations
+    are computed with FFTs: one of the original signal and one batched FFT of all
+    filtered signals, O(n log n) per signal instead of O(n^2).
 
     Parameters:
-    original_intensity (numpy array): The original signal (before filtering)
-    filtered_intensity (numpy array): The filtered signal (after applying a filtering technique)
-    signal_indices (numpy array): Boolean array of indices representing signal region
-    noise_indices (numpy array): Boolean array of indices representing noise region
+    original_intensity (numpy array): The original signal, shape (n_samples,).
+    filtered_stack (numpy array): The filtered signals, shape (n_signals, n_samples).
 
     Returns:
-    dict: Dictionary containing the calculated metrics.
+    tuple: Phase shift (in samples) and misaligned samples count of every filtered signal (integer arrays).
     """
-    # SNR calculation
-    signal_intensity = filtered_intensity[signal_indices]
-    noise_intensity = filtered_intensity[noise_indices]
-    
-    signal_peak = np.max(signal_intensity)
-    noise_std_dev = np.std(noise_intensity)
-    snr_ratio = signal_peak / noise_std_dev
-    
-    # SPNR calculation
-    noise_peak = np.max(noise_intensity)
-    spnr_ratio = signal_peak / noise_peak
-    
-    # Pearson's correlation coefficient
-    pearsons_r = np.corrcoef(original_intensity, filtered_intensity)[0, 1]
-    
-    return {
-        'SNR': snr_ratio,
-        'SPNR': spnr_ratio,
-        "Pearson's r": pearsons_r
-    }
+    original_intensity = np.asarray(original_intensity, dtype=float)
+    filtered_stack = np.atleast_2d(np.asarray(filtered_stack, dtype=float))
+    n = filtered_stack.shape[1]
 
-import numpy as np
+    # Zero-padding to at least 2n - 1 samples makes the circular correlation equal to the full one
+    size = next_fast_len(2 * n - 1, real=True)
+    spectrum = rfft(original_intensity, size) * np.conj(rfft(filtered_stack, size, axis=1))
+    correlation = irfft(spectrum, size, axis=1)
+
+    # Reorder the lags -(n - 1) .. n - 1 like np.correlate(mode='full')
+    correlation = np.concatenate((correlation[:, size - (n - 1):], correlation[:, :n]), axis=1)
+    phase_shift = np.argmax(correlation, axis=1) - (n - 1)
 
-'''
-def calculate_phase_shift(original_intensity, filtered_intensity):
+    # Samples after the shift are misaligned; none if phase shift is zero
+    misaligned_count = np.where(phase_shift == 0, 0, n - np.abs(phase_shift))
+    return phase_shift, misaligned_count
+
+
+def calculate_metrics_batch(original_intensity, filtered_stack, signal_indices, noise_indices):
     """
-    Calculate the normalized phase shift between the original and filtered intensity signals.
-    This method normalizes the signals and uses cross-correlation for better accuracy.
-    
-    Additionally, the function returns the count of misaligned samples based on the phase shift.
+    Calculate MSE, signal distortion, SNR, SPNR and Pearson's r of many filtered signals at once.
 
     Parameters:
-    original_intensity (numpy array): The original signal (before filtering)
-    filtered_intensity (numpy array): The filtered signal (after applying a filtering technique)
+    original_intensity (numpy array): The original signal, shape (n_samples,).
+    filtered_stack (numpy array): The filtered signals, shape (n_signals, n_samples).
+    signal_indices (numpy array): Boolean array of indices representing signal region
+    noise_indices (numpy array): Boolean array of indices representing noise region
 
     Returns:
-    tuple: The computed phase shift in terms of number of samples and the count of misaligned samples.
+    dict: Metric name -> numpy array with the value of every filtered signal.
     """
-    # Normalize the signals
-    original_norm = (original_intensity - np.mean(original_intensity)) / np.std(original_intensity)
-    filtered_norm = (filtered_intensity - np.mean(filtered_intensity)) / np.std(filtered_intensity)
+    original_intensity = np.asarray(original_intensity, dtype=float)
+    filtered_stack = np.atleast_2d(np.asarray(filtered_stack, dtype=float))
+    residual = filtered_stack - original_intensity
 
-    # Cross-correlation of the normalized signals
-    correlation = np.correlate(original_norm, filtered_norm, mode='full')
+    signal_peak = np.max(filtered_stack[:, signal_indices], axis=1)
+    noise_intensity = filtered_stack[:, noise_indices]
 
-    # Find the index of the maximum correlation
-    max_corr_index = np.argmax(correlation)
+    # Pearson's r of every row against the original signal
+    original_centered = original_intensity - np.mean(original_intensity)
+    filtered_centered = filtered_stack - np.mean(filtered_stack, axis=1, keepdims=True)
+    pearsons_r = (filtered_centered @ original_centered) / np.sqrt(
+        np.sum(filtered_centered ** 2, axis=1) * np.sum(original_centered ** 2))
 
-    # Phase shift is the shift that maximizes correlation
-    phase_shift = max_corr_index - (len(filtered_intensity) - 1)
+    return {
+        'MSE': np.mean(residual ** 2, axis=1),
+        'Signal Distortion': np.var(residual, axis=1) / np.var(original_intensity),
+        'SNR': signal_peak / np.std(noise_intensity, axis=1),
+        'SPNR': signal_peak / np.max(noise_intensity, axis=1),
+        "Pearson's r": np.clip(pearsons_r, -1.0, 1.0)
+    }
 
-    # Calculate the misaligned samples based on the phase shift
-    if phase_shift > 0:
-        # If phase shift is positive, original signal is ahead of filtered signal
-        misaligned_samples = filtered_intensity[phase_shift:]
-    elif phase_shift < 0:
-        # If phase shift is negative, filtered signal is ahead of original signal
-        misaligned_samples = original_intensity[-phase_shift:]
-    else:
-        # If phase shift is zero, there is no misalignment
-        misaligned_samples = np.array([])
 
-    # Count the number of misaligned samples
-    misaligned_count = len(misaligned_samples)
+def _score_stack(scores, rows, data, filtered_stack, signal_indices, noise_indices):
+    # Writes the metrics of every filtered signal of filtered_stack to scores[name][rows]
+    batch = calculate_metrics_batch(data, filtered_stack, signal_indices, noise_indices)
+    batch['Phase Shift'], batch['Misaligned Samples Count'] = calculate_phase_shift_batch(data, filtered_stack)
+    for name in METRIC_NAMES:
+        scores[name][rows] = batch[name]
 
-    return phase_shift, misaligned_count
-'''
-def calculate_phase_shift(original_intensity, filtered_intensity):
+
+def score_filtered_batch(data, filtered_stack, signal_indices, noise_indices):
     """
-    Calculate the phase shift between the original and filtered intensity signals.
-    
-    The phase shift is computed by finding the lag that maximizes the cross-correlation
-    between the two signals.
+    Compute all metrics of many filtered signals of the same original signal.
+
+    Signals without NaN samples are scored together. A signal with NaN samples (e.g. the
+    edges of the rolling median) is scored on its valid samples only, as a batch of one.
 
     Parameters:
-    original_intensity (numpy array): The original signal (before filtering)
-    filtered_intensity (numpy array): The filtered signal (after applying a filtering technique)
+    data (numpy array): The original signal, shape (n_samples,).
+    filtered_stack (numpy array): The filtered signals, shape (n_signals, n_samples).
+    signal_indices (numpy array): Boolean array representing the signal region.
+    noise_indices (numpy array): Boolean array representing the noise region.
 
     Returns:
-    float: The computed phase shift in terms of number of samples.
+    dict: Metric name (METRIC_NAMES) -> numpy array with the value of every filtered signal.
     """
-    # Cross-correlation of the original and filtered signals
-    correlation = np.correlate(original_intensity, filtered_intensity, mode='full')
-    
-    # Find the index of the maximum correlation
-    max_corr_index = np.argmax(correlation)
-    
-    # Phase shift is the shift that maximizes correlation
-    phase_shift = max_corr_index - (len(filtered_intensity) - 1)
-    
-    # Calculate the misaligned samples based on the phase shift
-    if phase_shift > 0:
-        misaligned_samples = filtered_intensity[phase_shift:]
-    elif phase_shift < 0:
-        misaligned_samples = original_intensity[-phase_shift:]
-    else:
-        misaligned_samples = np.array([])  # No misalignment if phase shift is zero
+    data = np.asarray(data, dtype=float)
+    filtered_stack = np.atleast_2d(np.asarray(filtered_stack, dtype=float))
+    scores = {name: np.empty(len(filtered_stack), dtype=int if name in ('Phase Shift', 'Misaligned Samples Count') else float)
+              for name in METRIC_NAMES}
 
-    # Count the number of misaligned samples
-    misaligned_count = len(misaligned_samples)
-   
+    complete = ~np.isnan(filtered_stack).any(axis=1) & ~np.isnan(data).any()
+    if complete.any():
+        _score_stack(scores, complete, data, filtered_stack[complete], signal_indices, noise_indices)
 
-    return phase_shift, misaligned_count
+    for i in np.flatnonzero(~complete):
+        # Remove NaN values from both original and filtered signals for metric calculations
+        valid_indices = ~np.isnan(data) & ~np.isnan(filtered_stack[i])
+        _score_stack(scores, [i], data[valid_indices], filtered_stack[i, valid_indices][np.newaxis],
+                     signal_indices[valid_indices], noise_indices[valid_indices])
+    return scores
 
 
-def plot_box_plots(original_signal, filtered_signal, phase_shift, misaligned_count):
+def score_filtered(data, filtered, signal_indices, noise_indices):
     """
-    Plot box plots to visualize the phase shift.
-    
-    Parameters:
-    original_signal (numpy array): The original signal.
-    filtered_signal (numpy array): The filtered signal.
-    phase_shift (int): The phase shift (in samples).
+    Compute all metrics of one filtered signal (score_filtered_batch with a batch of one).
+
+    Returns:
+    dict: MSE, Signal Distortion, SNR, SPNR, Pearson's r, Phase Shift and Misaligned Samples Count.
     """
-    # Shift the filtered signal based on the calculated phase shift
-    if phase_shift > 0:
-        shifted_filtered_signal = np.concatenate((np.zeros(phase_shift), filtered_signal))[:len(original_signal)]
-    elif phase_shift < 0:
-        shifted_filtered_signal = filtered_signal[-phase_shift:]
-    else:
-        shifted_filtered_signal = filtered_signal
+    scores = score_filtered_batch(data, np.asarray(filtered)[np.newaxis], signal_indices, noise_indices)
+    return {name: values[0] for name, values in scores.items()}
 
-    # Create a figure for the box plot
-    plt.figure(figsize=(10, 6))
 
-    # Combine original signal and shifted filtered signal for boxplot
-    data = [original_signal, shifted_filtered_signal]
+def _sweep_job(file_name, filter_name, params_batch, data, signal_indices, noise_indices, keep_signals):
+    # Filters a batch of configurations and scores them together; runs in a worker process,
+    # so everything it uses is module level
+    filter_function = FILTERS[filter_name][0]
+    filtered_stack = np.vstack([filter_function(data, **params) for params in params_batch])
+    scores = score_filtered_batch(data, filtered_stack, signal_indices, noise_indices)
+    rows = [{'File': file_name, 'Filter': filter_name, **params, **{name: scores[name][i] for name in METRIC_NAMES}}
+            for i, params in enumerate(params_batch)]
+    return rows, (list(filtered_stack) if keep_signals else [None] * len(rows))
 
-    # Plot the box plot
-    plt.boxplot(data, vert=False, patch_artist=True, labels=['Original signal', 'Filtered data'])
 
-    # Adding labels and title
-    plt.xlabel('Signal Value')
-    plt.title(f'Box Plot of Original and Filtered Signals with Phase Shift of {phase_shift} for {misaligned_count} data points of total 2068')
+def run_filter_sweep(signals, sweeps, n_jobs=-1, keep_signals=True, batch_size=16):
+    """
+    Run every filter configuration on every signal on a process pool.
 
-    # Display the plot
-    plt.grid(True)
+    Each job filters one file with a batch of up to batch_size configurations of one
+    filter and scores the stacked outputs together (score_filtered_batch). Nothing is
+    plotted here; pass the returned signals to plot_sweep_results.
+
+    Parameters:
+    signals (dict): File name -> (intensity, signal_indices, noise_indices).
+    sweeps (dict): Filter name (key of FILTERS) -> parameter lists, e.g.
+        {'fir': {'sample_rate': [100, 500], 'cutoff_freq': [10], 'numtaps': [35, 75]}}.
+    n_jobs (int): Number of worker processes (-1 uses all cores).
+    keep_signals (bool): Return the filtered signals for plotting.
+    batch_size (int): Configurations filtered and scored per job.
+
+    Returns:
+    tuple: results DataFrame (one row per file and configuration, in job order) and a
+        list with the filtered signal of every row (None when keep_signals is False).
+    """
+    jobs = []
+    n_configs = 0
+    for file_name, (data, signal_indices, noise_indices) in signals.items():
+        for filter_name, param_lists in sweeps.items():
+            if filter_name == 'savgol':
+                # Ensure frame_length is less than or equal to the length of data
+                for frame_length in param_lists['frame_length']:
+                    if frame_length > len(data):
+                        print(f"Skipping frame length {frame_length} because it's larger than the data size.")
+                param_lists = {**param_lists, 'frame_length': [f for f in param_lists['frame_length'] if f <= len(data)]}
+            grid = parameter_grid(filter_name, param_lists)
+            n_configs += len(grid)
+            for first in range(0, len(grid), batch_size):
+                jobs.append((file_name, filter_name, grid[first:first + batch_size], data, signal_indices,
+                             noise_indices, keep_signals))
+
+    start = time.time()
+    outputs = Parallel(n_jobs=n_jobs)(delayed(_sweep_job)(*job) for job in jobs)
+    print(f"Filter sweep: {n_configs} configurations ({len(jobs)} jobs) on {len(signals)} file(s) in {time.time() - start:.2f}s")
+
+    # File, filter and parameter columns first, then the metrics
+    param_names = list(dict.fromkeys(name for filter_name in sweeps for name in FILTERS[filter_name][1]))
+    results = pd.DataFrame([row for rows, _ in outputs for row in rows],
+                           columns=['File', 'Filter'] + param_names + list(METRIC_NAMES))
+    filtered_signals = [filtered for _, batch in outputs for filtered in batch]
+    return results, filtered_signals
+
+
+def plot_sweep_results(results, filtered_signals, signals, wavelengths, box_plots=()):
+    """
+    Plot a finished sweep: one figure per file and filter with the original and every filtered signal.
+
+    Parameters:
+    results (DataFrame): Results of run_filter_sweep.
+    filtered_signals (list): Filtered signals of run_filter_sweep (keep_signals=True).
+    signals (dict): File name -> (intensity, signal_indices, noise_indices), as passed to run_filter_sweep.
+    wavelengths (dict): File name -> wavelength of the signal.
+    box_plots (tuple): Filter names whose configurations also get a phase shift box plot.
+    """
+    rows = list(results.to_dict('records'))
+    for (file_name, filter_name), group in results.groupby(['File', 'Filter'], sort=False):
+        data, wavelength = signals[file_name][0], wavelengths[file_name]
+        names = FILTERS[filter_name][1]
+
+        plt.figure(figsize=(10, 6))
+        # Plot original signal first as a baseline
+        plt.plot(wavelength, data, label='Original Signal', color='black', linewidth=1.5)
+        for i in group.index:
+            params = {name: rows[i][name] for name in names}
+            plt.plot(wavelength, filtered_signals[i], label=config_label(filter_name, params),
+                     color=next(color_cycle), linewidth=1.5)
+
+        # Adding labels and legend
+        plt.xlabel('Wavelength (nm)')
+        plt.ylabel('Intensity')
+        plt.title(f"{FILTERS[filter_name][2]} ({file_name})")
+        plt.legend(loc='upper right')
+        plt.grid(True)
+
+        if filter_name in box_plots:
+            for i in group.index:
+                plot_box_plots(data, filtered_signals[i], rows[i]['Phase Shift'], rows[i]['Misaligned Samples Count'])
     plt.show()
 
-def fir_filter(data, sample_rates, cutoff_freqs, numtaps_list, signal_indices, noise_indices, wavelength):
+
+def _sweep_one_signal(filter_name, param_lists, data, signal_indices, noise_indices, wavelength, key, box_plots, n_jobs):
+    # Shared body of the per-filter functions: sweep one signal, plot at the end, results keyed like before
+    signals = {'signal': (data, signal_indices, noise_indices)}
+    results, filtered_signals = run_filter_sweep(signals, {filter_name: param_lists}, n_jobs=n_jobs)
+    plot_sweep_results(results, filtered_signals, signals, {'signal': wavelength},
+                       box_plots=(filter_name,) if box_plots else ())
+
+    return {key(row): {name: row[name] for name in METRIC_NAMES} for row in results.to_dict('records')}
+
+
+def fir_filter(data, sample_rates, cutoff_freqs, numtaps_list, signal_indices, noise_indices, wavelength, n_jobs=-1):
     """
     Apply FIR filtering with different sample rates, cutoff frequencies, and numtaps values
     and compute the metrics for each.
     """
-    results = {}
-    plt.figure(figsize=(10, 6))
+    param_lists = {'sample_rate': sample_rates, 'cutoff_freq': cutoff_freqs, 'numtaps': numtaps_list}
+    return _sweep_one_signal('fir', param_lists, data, signal_indices, noise_indices, wavelength,
+                             key=lambda row: (row['sample_rate'], row['cutoff_freq'], row['numtaps']),
+                             box_plots=False, n_jobs=n_jobs)
 
-    # Plot original signal first as a baseline
-    plt.plot(wavelength, data, label='Original Signal', color='black', linewidth=1.5)
-
-    for sample_rate in sample_rates:
-        nyquist_rate = sample_rate / 2.0
-        
-        for cutoff_freq in cutoff_freqs:
-            for numtaps in numtaps_list:
-                # Design the FIR filter using Hamming window
-                fir_coeffs = firwin(numtaps, cutoff_freq / nyquist_rate, window='hamming')
-
-                # Apply zero-phase filtering using filtfilt
-                fir_filtered_intensity = filtfilt(fir_coeffs, 1.0, data)
-
-                # Calculate MSE
-                mse = mean_squared_error(data, fir_filtered_intensity)
-
-                # Calculate signal distortion
-                distortion = signal_distortion(data, fir_filtered_intensity)
-
-                # Calculate other metrics (SNR, SPNR, Pearson's r)
-                metrics = calculate_metrics(data, fir_filtered_intensity, signal_indices, noise_indices)
-
-                # Calculate the phase shift and misaligned samples
-                phase_shift, misaligned_count = calculate_phase_shift(data, fir_filtered_intensity)
-
-                # Plot the box plots for phase shift
-                #plot_box_plots(data, fir_filtered_intensity, phase_shift, misaligned_count)
-
-                # Store metrics in results dictionary
-                results[(sample_rate, cutoff_freq, numtaps)] = {
-                    'MSE': mse,
-                    'Signal Distortion': distortion,
-                    'SNR': metrics['SNR'],
-                    'SPNR': metrics['SPNR'],
-                    "Pearson's r": metrics["Pearson's r"],
-                    'Phase Shift': phase_shift,  
-                    'Misaligned Samples Count': misaligned_count  
-                }
-
-                # Plot the FIR-filtered signal with a different color for each configuration
-                label = f'SR={sample_rate}, CF={cutoff_freq}, NT={numtaps}'
-                # Get the next color in the cycle
-                color = next(color_cycle)
-            
-                # fir_filtered_intensity is the filtered signal, and wavelength is the x-axis
-                plt.plot(wavelength, fir_filtered_intensity, label=label, color=color, linewidth=1.5)
-
-
-    # Adding labels and legend
-    plt.xlabel('Wavelength (nm)')
-    plt.ylabel('Intensity')
-    plt.title('FIR Filtered Signals for Different Configurations')
-    plt.legend(loc='upper right')
-    plt.grid(True)
-    plt.show()
-    
-    return results
 
-def move_mean_filter(data, window_sizes, signal_indices, noise_indices, wavelength):
+def move_mean_filter(data, window_sizes, signal_indices, noise_indices, wavelength, n_jobs=-1):
     """
     Apply moving mean filtering for a list of window sizes and compute metrics for each.
 
@@ -335,60 +462,16 @@ def move_mean_filter(data, window_sizes, signal_indices, noise_indices, waveleng
     signal_indices (numpy array): Boolean array representing the signal region.
     noise_indices (numpy array): Boolean array representing the noise region.
     wavelength (numpy array): The corresponding wavelength data for the signal.
+    n_jobs (int): Number of worker processes of the sweep.
 
     Returns:
     dict: Dictionary with window sizes as keys and corresponding metrics (MSE, SNR, SPNR, etc.) as values.
     """
-    results = {}
-    plt.figure(figsize=(10, 6))
+    return _sweep_one_signal('move_mean', {'window_size': window_sizes}, data, signal_indices, noise_indices,
+                             wavelength, key=lambda row: row['window_size'], box_plots=True, n_jobs=n_jobs)
 
-    # Plot original signal first as a baseline
-    plt.plot(wavelength, data, label='Original Signal', color='black', linewidth=2)
-
-    for window_size in window_sizes:
-        # Apply moving mean filtering
-        denoised_intensity = np.convolve(data, np.ones(window_size) / window_size, mode='same')
-        
-        # Calculate MSE
-        mse = mean_squared_error(data, denoised_intensity)
-        
-        # Calculate signal distortion
-        distortion = signal_distortion(data, denoised_intensity)
-        
-        # Calculate other metrics (SNR, SPNR, Pearson's r)
-        metrics = calculate_metrics(data, denoised_intensity, signal_indices, noise_indices)
-
-        # Calculate the phase shift and misaligned samples
-        phase_shift, misaligned_count = calculate_phase_shift(data, denoised_intensity)
-
-        # Plot the box plots for phase shift
-        plot_box_plots(data,denoised_intensity, phase_shift, misaligned_count)
-        
-        # Store metrics in results dictionary
-        results[window_size] = {
-            'MSE': mse,
-            'Signal Distortion': distortion,
-            'SNR': metrics['SNR'],
-            'SPNR': metrics['SPNR'],
-            "Pearson's r": metrics["Pearson's r"],
-            'Phase Shift': phase_shift,  
-            'Misaligned Samples Count': misaligned_count  
-        }
-        
-        # Plot the denoised signal with a different color for each window size
-        plt.plot(wavelength, denoised_intensity, label=f'Window Size {window_size}', linewidth=2)
-    
-    # Adding labels and legend
-    plt.xlabel('Wavelength (nm)')
-    plt.ylabel('Intensity')
-    plt.title('Moving Mean Filtered Signals for Different Window Sizes')
-    plt.legend()
-    plt.grid(True)
-    plt.show()
-    
-    return results
 
-def median_filter(data, window_sizes, signal_indices, noise_indices, wavelength):
+def median_filter(data, window_sizes, signal_indices, noise_indices, wavelength, n_jobs=-1):
     """
     Apply median filtering for a list of window sizes and compute metrics for each.
 
@@ -398,96 +481,17 @@ def median_filter(data, window_sizes, signal_indices, noise_indices, wavelength)
     signal_indices (numpy array): Boolean array representing the signal region.
     noise_indices (numpy array): Boolean array representing the noise region.
     wavelength (numpy array): The corresponding wavelength data for the signal.
+    n_jobs (int): Number of worker processes of the sweep.
 
     Returns:
     dict: Dictionary with window sizes as keys and corresponding metrics (MSE, SNR, SPNR, etc.) as values.
     """
-    results = {}
-    plt.figure(figsize=(10, 6))
+    return _sweep_one_signal('median', {'window_size': window_sizes}, data, signal_indices, noise_indices,
+                             wavelength, key=lambda row: row['window_size'], box_plots=False, n_jobs=n_jobs)
 
-    # Plot original signal first as a baseline
-    plt.plot(wavelength, data, label='Original Signal', color='black', linewidth=2)
 
-    for window_size in window_sizes:
-        # Apply median filtering (centered)
-        denoised_intensity = pd.Series(data).rolling(window=window_size, center=True).median().to_numpy()
-
-        # Remove NaN values from both original and filtered signals for metric calculations
-        valid_indices = ~np.isnan(data) & ~np.isnan(denoised_intensity)
-        data_cleaned = data[valid_indices]
-        denoised_intensity_cleaned = denoised_intensity[valid_indices]
-
-        # Recalculate signal_indices and noise_indices for cleaned data
-        signal_indices_cleaned = signal_indices[valid_indices]
-        noise_indices_cleaned = noise_indices[valid_indices]
-
-        # Calculate MSE
-        mse = mean_squared_error(data_cleaned, denoised_intensity_cleaned)
-
-        # Calculate signal distortion
-        distortion = signal_distortion(data_cleaned, denoised_intensity_cleaned)
-
-        # Calculate other metrics (SNR, SPNR, Pearson's r)
-        metrics = calculate_metrics(data_cleaned, denoised_intensity_cleaned, signal_indices_cleaned, noise_indices_cleaned)
-
-        phase_shift, misaligned_count = calculate_phase_shift(data_cleaned, denoised_intensity_cleaned)
-
-        #if (phase_shift != 0):
-        #plot_box_plots(data_cleaned, denoised_intensity_cleaned, phase_shift, misaligned_count)
-
-        # Store metrics in results dictionary
-        results[window_size] = {
-            'MSE': mse,
-            'Signal Distortion': distortion,
-            'SNR': metrics['SNR'],
-            'SPNR': metrics['SPNR'],
-            "Pearson's r": metrics["Pearson's r"],
-            'Phase Shift': phase_shift,  
-            'Misaligned Samples Count': misaligned_count  
-        }
-
-        # Plot the median-filtered signal with a different color for each window size
-        label = f'Window Size {window_size}'
-        plt.plot(wavelength, denoised_intensity, label=label, linewidth=2)
-
-    # Adding labels and legend
-    plt.xlabel('Wavelength (nm)')
-    plt.ylabel('Intensity')
-    plt.title('Median Filtered Signals for Different Window Sizes')
-    plt.legend(loc='upper right')
-    plt.grid(True)
-    plt.show()
-
-    return results
-
-
-def butter_lowpass_filter(data, fs, cutoff_freq, order):
-    """
-    Apply a low-pass Butterworth filter to the data.
-    
-    Parameters:
-    data (numpy array): The signal data to filter.
-    fs (int or float): The sampling frequency in Hz.
-    cutoff_freq (float): The cutoff frequency in Hz.
-    order (int): The order of the filter.
-    
-    Returns:
-    numpy array: The filtered signal.
-    """
-    # Nyquist frequency is half of the sampling rate
-    nyquist = fs / 2.0
-    
-    # Normalize the cutoff frequency by dividing by the Nyquist frequency
-    normalized_cutoff = cutoff_freq / nyquist
-    
-    # Design Butterworth filter
-    b, a = butter(order, normalized_cutoff, btype='low')
-    
-    # Apply the filter using zero-phase filtering (filtfilt)
-    return filtfilt(b, a, data)
-
-
-def apply_butter_filter_for_multiple_params(data, fs_list, cutoff_freqs, orders, signal_indices, noise_indices, wavelength):
+def apply_butter_filter_for_multiple_params(data, fs_list, cutoff_freqs, orders, signal_indices, noise_indices,
+                                            wavelength, n_jobs=-1):
     """
     Apply the low-pass Butterworth filter with multiple fs, cutoff frequencies, and orders, and calculate metrics for each combination.
 
@@ -499,67 +503,20 @@ def apply_butter_filter_for_multiple_params(data, fs_list, cutoff_freqs, orders,
     signal_indices (numpy array): Boolean array representing the signal region.
     noise_indices (numpy array): Boolean array representing the noise region.
     wavelength (numpy array): The corresponding wavelength data for the signal.
-    
+    n_jobs (int): Number of worker processes of the sweep.
+
     Returns:
     dict: Dictionary with filter configurations as keys and corresponding metrics as values.
     """
-    results = {}
-    plt.figure(figsize=(10, 6))
+    param_lists = {'fs': fs_list, 'cutoff_freq': cutoff_freqs, 'order': orders}
+    return _sweep_one_signal('butter', param_lists, data, signal_indices, noise_indices, wavelength,
+                             key=lambda row: f"fs={row['fs']}, cutoff={row['cutoff_freq']}Hz, order={row['order']}",
+                             box_plots=True, n_jobs=n_jobs)
 
-    # Plot original signal first as a baseline
-    plt.plot(wavelength, data, label='Original Signal', color='black', linewidth=2)
-
-    # Loop over all combinations of fs, cutoff_freq, and order
-    for fs in fs_list:
-        for cutoff_freq in cutoff_freqs:
-            for order in orders:
-                # Apply Butterworth low-pass filter
-                denoised_intensity = butter_lowpass_filter(data, fs, cutoff_freq, order)
-                
-                # Calculate MSE
-                mse = mean_squared_error(data, denoised_intensity)
-                
-                # Calculate signal distortion
-                distortion = signal_distortion(data, denoised_intensity)
-                
-                # Calculate other metrics (SNR, SPNR, Pearson's r)
-                metrics = calculate_metrics(data, denoised_intensity, signal_indices, noise_indices)
-
-                phase_shift, misaligned_count = calculate_phase_shift(data, denoised_intensity)
-
-                
-                #if (phase_shift != 0):
-                plot_box_plots(data, denoised_intensity, phase_shift, misaligned_count)
-                
-                # Store metrics in results dictionary with configuration as the key
-                filter_config = f"fs={fs}, cutoff={cutoff_freq}Hz, order={order}"
-                results[filter_config] = {
-                    'MSE': mse,
-                    'Signal Distortion': distortion,
-                    'SNR': metrics['SNR'],
-                    'SPNR': metrics['SPNR'],
-                    "Pearson's r": metrics["Pearson's r"],
-                    'Phase Shift': phase_shift,  
-                    'Misaligned Samples Count': misaligned_count 
-                }
-
-                # Plot the denoised signal with a different color for each configuration
-                label = f'fs={fs}, cutoff={cutoff_freq}Hz, order={order}'
-                plt.plot(wavelength, denoised_intensity, label=label, linewidth=2)
-
-    # Adding labels and legend
-    plt.xlabel('Wavelength (nm)')
-    plt.ylabel('Intensity')
-    plt.title('Low-Pass Butterworth Filtered Signals for Different Configurations')
-    plt.legend(loc='upper right')
-    plt.grid(True)
-    plt.show()
 
-    return results
-
-def savgol_filter_fun(data, frame_lengths, poly_orders, signal_indices, noise_indices, wavelength):
+def savgol_filter_fun(data, frame_lengths, poly_orders, signal_indices, noise_indices, wavelength, n_jobs=-1):
     """
-    Apply Savitzky-Golay filtering for a list of frame lengths and polynomial orders, 
+    Apply Savitzky-Golay filtering for a list of frame lengths and polynomial orders,
     and compute metrics for each.
 
     Parameters:
@@ -569,127 +526,54 @@ def savgol_filter_fun(data, frame_lengths, poly_orders, signal_indices, noise_in
     signal_indices (numpy array): Boolean array representing the signal region.
     noise_indices (numpy array): Boolean array representing the noise region.
     wavelength (numpy array): The corresponding wavelength data for the signal.
+    n_jobs (int): Number of worker processes of the sweep.
 
     Returns:
     dict: Dictionary with (frame_length, poly_order) pairs as keys and corresponding metrics (MSE, SNR, SPNR, etc.) as values.
     """
-    results = {}
-    plt.figure(figsize=(10, 6))
-
-    # Plot original signal first as a baseline
-    plt.plot(wavelength, data, label='Original Signal', color='black', linewidth=2)
-
-    for frame_length in frame_lengths:
-                # Ensure frame_length is less than or equal to the length of data
-        if frame_length > len(data):
-            print(f"Skipping frame length {frame_length} because it's larger than the data size.")
-            continue
-        #print(f"Data shape: {data.shape}")
-        for poly_order in poly_orders:
-            # Apply Savitzky-Golay filter to the cleaned intensity data
-            sg_filtered_intensity = signal.savgol_filter(data, frame_length, poly_order)
-
-            # Remove NaN values from both original and filtered signals for metric calculations
-            valid_indices = ~np.isnan(data) & ~np.isnan(sg_filtered_intensity)
-            data_cleaned = data[valid_indices]
-            sg_filtered_intensity_cleaned = sg_filtered_intensity[valid_indices]
-
-            # Recalculate signal_indices and noise_indices for cleaned data
-            signal_indices_cleaned = signal_indices[valid_indices]
-            noise_indices_cleaned = noise_indices[valid_indices]
-
-            # Calculate MSE
-            mse = mean_squared_error(data_cleaned, sg_filtered_intensity_cleaned)
-
-            # Calculate other metrics (SNR, SPNR, Pearson's r)
-            metrics = calculate_metrics(data_cleaned, sg_filtered_intensity_cleaned, signal_indices_cleaned, noise_indices_cleaned)
-
-            # Calculate signal distortion
-            distortion = signal_distortion(data, sg_filtered_intensity_cleaned)
-
-            phase_shift, misaligned_count = calculate_phase_shift(data, sg_filtered_intensity_cleaned)
-
-            #if (phase_shift!=0):
-            #plot_box_plots(data, sg_filtered_intensity_cleaned, phase_shift, misaligned_count)
-
-            # Store metrics in results dictionary
-            results[(frame_length, poly_order)] = {
-                'MSE': mse,
-                'Signal Distortion': distortion,
-                'SNR': metrics['SNR'],
-                'SPNR': metrics['SPNR'],
-                "Pearson's r": metrics["Pearson's r"],
-                'Phase Shift': phase_shift,  
-                'Misaligned Samples Count': misaligned_count 
-            }
-
-            # Plot the Savitzky-Golay filtered signal with a label indicating frame length and polynomial order
-            label = f'Frame Length {frame_length}, Poly Order {poly_order}'
-            plt.plot(wavelength, sg_filtered_intensity, label=label, linewidth=2)
-
-    # Adding labels and legend
-    plt.xlabel('Wavelength (nm)')
-    plt.ylabel('Intensity')
-    plt.title('Savitzky-Golay Filtered Signals for Different Frame Lengths and Polynomial Orders')
-    plt.legend(loc='upper right')
-    plt.grid(True)
-    plt.show()
-
-    return results
-    
-##########################MOVE MEAN####################################
-#window_sizes = [5, 15, 25, 35, 50, 80, 100, 150]  # List of window sizes to apply moving mean filter
-
-# Apply moving mean filter and calculate metrics for each window size
-#metrics_results = move_mean_filter(cleanIntensity, window_sizes, signalIndices, noiseIndices, cleanWavelength)
-
-###############################FIR FILTER#########################
-
-sample_rates = [100, 500, 1000, 2047]  # List of sampling frequencies to test
-cutoff_freqs = [10, 30, 45]     # List of cutoff frequencies (normalized)
-numtaps_list = [35, 75, 100, 150, 200] 
-
-#Apply FIR filter and calculate metrics for different configurations
-metrics_results = fir_filter(cleanIntensity, sample_rates, cutoff_freqs, numtaps_list, signalIndices, noiseIndices, cleanWavelength)
-
-
-##################################MEDIAN FILTER###########################
-#window_sizes = [5, 15, 25, 35, 50, 80, 100, 150]
-
-# Apply median filter and calculate metrics for different window sizes
-
-#metrics_results = median_filter(cleanIntensity, window_sizes, signalIndices, noiseIndices, cleanWavelength)
-
-##################################LPF configurations##############################
-'''
-fs_list = [2048]
-cutoff_freqs = [10]  # Different cutoff frequencies in Hz
-orders = [4]
-
-# Assuming 'cleanIntensity', 'signalIndices', 'noiseIndices', and 'wavelength' are already defined
-metrics_results = apply_butter_filter_for_multiple_params(
-    cleanIntensity, fs_list, cutoff_freqs, orders, signalIndices, noiseIndices, cleanWavelength)
-
-'''
-
-#########################################S Golay Filter###################################
-
-#frame_lengths = [5, 11, 21, 31]  # Example frame lengths
-#poly_orders = [2, 3]  # Example polynomial orders
+    param_lists = {'frame_length': frame_lengths, 'poly_order': poly_orders}
+    return _sweep_one_signal('savgol', param_lists, data, signal_indices, noise_indices, wavelength,
+                             key=lambda row: (row['frame_length'], row['poly_order']), box_plots=False, n_jobs=n_jobs)
+
+
+if __name__ == '__main__':
+    darkdata = 'D:/Noise/AB_OFF_04-01_CALYX/1_S3_Alpha1_DARK AB OFF.xlsx'
+    BSdata = 'D:/Noise/AB_OFF_04-01_CALYX/1_TRL05-MLL-04-01_FBU-04_V-2_Calyx5_S Filtered_20240906T103646.csv'
+    #BSdata='D:/Noise/1_BS-2 Traget With 200 um Fiber  Xenon_S Filtered_20241009T143601.csv'
+
+    # Every BS file of the study is swept with the same dark reference
+    bs_files = [BSdata]
+
+    avg = read_dark_average(darkdata)
+    signals, wavelengths = {}, {}
+    for bs_file in bs_files:
+        cleanWavelength, cleanIntensity, signalIndices, noiseIndices = load_noise_data(bs_file, avg)
+        signals[os.path.basename(bs_file)] = (cleanIntensity, signalIndices, noiseIndices)
+        wavelengths[os.path.basename(bs_file)] = cleanWavelength
+
+    sweeps = {
+        ###############################FIR FILTER#########################
+        'fir': {
+            'sample_rate': [100, 500, 1000, 2047],  # List of sampling frequencies to test
+            'cutoff_freq': [10, 30, 45],            # List of cutoff frequencies (normalized)
+            'numtaps': [35, 75, 100, 150, 200],
+        },
+        ##########################MOVE MEAN####################################
+        #'move_mean': {'window_size': [5, 15, 25, 35, 50, 80, 100, 150]},
+        ##################################MEDIAN FILTER###########################
+        #'median': {'window_size': [5, 15, 25, 35, 50, 80, 100, 150]},
+        ##################################LPF configurations##############################
+        #'butter': {'fs': [2048], 'cutoff_freq': [10], 'order': [4]},
+        #########################################S Golay Filter###################################
+        #'savgol': {'frame_length': [5, 11, 21, 31], 'poly_order': [2, 3]},
+    }
 
-# Call the function
-#metrics_results = savgol_filter_fun(cleanIntensity, frame_lengths, poly_orders, signalIndices, noiseIndices, wavelength)
+    # Filter and score every configuration on the process pool, plot once everything is done
+    metrics_results, filtered_signals = run_filter_sweep(signals, sweeps, n_jobs=-1)
 
+    # Print out the metrics results
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(metrics_results)
+    #metrics_results.to_csv('noise_study_results.csv', index=False)
 
-# Print out the metrics results
-for window_size, metrics in metrics_results.items():
-    print(f"Window Size {window_size} Results:")
-    print(f"  MSE: {metrics['MSE']}")
-    print(f"  Signal Distortion: {metrics['Signal Distortion']}")
-    print(f"  SNR: {metrics['SNR']}")
-    print(f"  SPNR: {metrics['SPNR']}")
-    print(f"  Pearson's r: {metrics['Pearson\'s r']}")
-    print(f"  Phase Shift (samples): {metrics['Phase Shift']}")
-    print(f"  Misaligned Samples Count: {metrics['Misaligned Samples Count']}")
-    print('---')
-    
\ No newline at end of file
+    plot_sweep_results(metrics_results, filtered_signals, signals, wavelengths, box_plots=())
@@ -3,24 +3,32 @@
 import os
 from ops.import_trl5 import Import  # Adjust this import based on your module structure
 import pandas as pd
-from ops.splitn import partition_data_based_on_filenames
-from ml_framework.basePipilineTrain import basePipelineTrain
+from ops.split_cache import SplitManager
+from ops.spectral_store import write_spectral_store, iter_spectra_batches
 from ml_utility.wavelet_transform import wavelet_transform
 from ops.visualize import visualize_data, plot_all_spectra
 from ml_framework.classification import train_models, evaluate_model
 from ml_utility.anovaTest import anova_significant_peaks, plot_significant_peaks, find_significant_wavelengths, plot_spectral_data_with_roi, find_roi_anova
 from ml_utility.pldsa import pls_important_peaks
+from ml_utility.knn import benchmark_knn_algorithms
+from ml_framework.basePipilineTrain import CLASSIFIER_STEP
+from sklearn.pipeline import Pipeline
+from sklearn.neighbors import KNeighborsClassifier
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib
 from sklearn.metrics import confusion_matrix, classification_report
 import torch
 #from ml_utility.cnn_gradcam import compute_grad_cam, preprocess_labels, create_cnn_model
-from ml_utility.cnn import create_cnn_model, preprocess_labels, compute_grad_cam, visualize_feature_importance, compute_saliency_map, plot_saliency_map, compute_grad_cam_for_all, plot_all_grad_cams
+from ml_utility.cnn import create_cnn_model, preprocess_labels, compute_grad_cam, visualize_feature_importance, compute_saliency_map, plot_saliency_map, compute_grad_cam_for_all, plot_all_grad_cams, make_spectral_dataset, make_generator_dataset
 matplotlib.use('TkAgg')  # Switches to a more stable backend for VS Code
 from ml_framework.peakdetection import detect_peaks_across_samples, get_peak_ranges, extract_features_from_ranges, plot_peak_histogram, extract_and_plot_features    # Import functions from peakdetection.py
 from ml_framework.spectralFeatures import extract_features, plot_features, plot_spectrum_with_regions
 from ml_framework.powerRatioFeatures import calculate_spectral_features, plot_power_ratio_histograms
+from ml_framework.bandSearch import search_power_ratio_bands, to_ratio_ranges
+from ml_framework.featurePlan import FeaturePlan
+from ml_framework.rebalance import rebalance, make_sampler
+from ml_framework.onnxExport import export_and_benchmark, reference_onnx_paths
 import seaborn as sns
 from imblearn.over_sampling import SMOTE
 from imblearn.combine import SMOTEENN, SMOTETomek
@@ -33,6 +41,8 @@ def main():
 
     # Define the data location
     ds_location = os.path.join(os.getcwd(), "data", "TRL5-Xenon-AB-OFF")
+    # Light source and AB status of the data in ds_location (names the matching "<SOURCE>_<AB_STATUS>.onnx" model)
+    source, ab_status = "XENON", "AB_OFF"
     #ds_location = os.path.join(os.getcwd(), "data", "Test")
     # Construct the file path
     dark_reference = os.path.join(os.getcwd(), "data", "Dark", "1_S3_Alpha1_DARK AB OFF.xlsx")
@@ -44,8 +54,12 @@ def main():
         "IncludeSubfolders": True  # This needs to be part of the options dictionary
     }
 
+    # Processed files are cached here, so re-running with different model settings skips the import
+    import_cache = os.path.join(os.getcwd(), "data", ".import_cache")
+
     # Create an instance of Import and call the read_csv method
-    data_all, data_summary, wavelength_df = Import.read_csv(ds_location=ds_location, darkReference=dark_reference, options=options, filter_type="fir")
+    data_all, data_summary, wavelength_df = Import.read_csv(ds_location=ds_location, darkReference=dark_reference, options=options, filter_type="fir",
+                                                            n_jobs=-1, cache_dir=import_cache)
    
     # Print the current timestamp
     print(pd.Timestamp.now().strftime('%d/%m/%y-%H:%M'))
@@ -81,8 +95,12 @@ def main():
     # dataTest.loc[dataTest['Response'].isin(["Access Sheath 13/15", "Endoscope", "Tissue-Calyx", "Tissue-Ureter", "BEGO"]), 'Response'] = "Non-Stone"
     # Call the partition function to split data
     train_percent = 80  # Percentage to use for training
-    # Call the partition function
-    data_train, data_test, train_indices, test_indices = partition_data_based_on_filenames(data, train_percent=80)
+    # Grouped split (per TargetType + TargetNumber), seeded and cached per dataset fingerprint
+    split_manager = SplitManager(cache_dir=os.path.join(os.getcwd(), "split_cache"), seed=0)
+    train_indices, test_indices = split_manager.holdout(data, train_percent=train_percent)
+    data_train, data_test = data.iloc[train_indices], data.iloc[test_indices]
+    # Grouped CV folds over the rows of data_train, used by every search in train_models
+    cv_folds = split_manager.cv_folds(data_train, n_splits=5)
     
     print(f"Train size: {len(data_train)}")
     print(f"Test size: {len(data_test)}")
@@ -122,33 +140,46 @@ def main():
   
     # Reshape data to fit the CNN input (assuming 1D spectral data)
     # ---------------------- Train CNN Model and extract Saliency MAP ----------------------
-    wavelengths = wavelength_df # Shape: (num_features, 1)
-    wavelengths = np.tile(wavelengths, (X_train.shape[0], 1))  # Shape: (num_samples, num_features)
-
-  #  Combine intensity and wavelengths into one input array
-    X_train_combined = np.stack((X_train, wavelengths), axis=-1)  # Shape: (num_samples, num_features, 2)
- 
-  
+    wavelengths = np.asarray(wavelength_df, dtype=np.float32).ravel()  # Shape: (num_features,)
 
    # Preprocess labels (convert 'Tissue' and 'Non-tissue' to 1 and 0)
     Y_train_numeric = preprocess_labels(Y_train)
 
-   # Create the CNN model
-    model = create_cnn_model(X_train_combined)
+   # Create the CNN model (input: intensity + wavelength channel)
+    model = create_cnn_model(X_train)
+
+    # The wavelength channel is added per batch by the tf.data pipeline instead of tiling it
+    # for every sample. The last 20% are held out, as validation_split=0.2 did.
+    X_train_array = np.asarray(X_train, dtype=np.float32)
+    split_at = int(len(X_train_array) * 0.8)
+    train_ds = make_spectral_dataset(X_train_array[:split_at], Y_train_numeric[:split_at], wavelengths, batch_size=32, shuffle=True)
+    val_ds = make_spectral_dataset(X_train_array[split_at:], Y_train_numeric[split_at:], wavelengths, batch_size=32)
+
+    # Set to True to stream the training spectra from the Parquet spectral store instead of memory.
+    # The training part is written to the store on the first run; delete the folder after changing the data.
+    train_from_store = False
+    if train_from_store:
+        store_path = os.path.join(os.getcwd(), "data", "spectral_store", "cnn_train")
+        store_filters = {"Source": source, "ABStatus": ab_status}
+        if not os.path.isdir(store_path):
+            write_spectral_store(store_path, X_train_array[:split_at], Y_train.iloc[:split_at], wavelengths, metadata=store_filters)
+        train_ds = make_generator_dataset(
+            lambda: ((spectra, preprocess_labels(labels)) for spectra, labels in iter_spectra_batches(store_path, filters=store_filters)),
+            wavelengths, batch_size=32, shuffle_buffer=10000)
 
     # Train the model
-    history = model.fit(X_train_combined, Y_train_numeric, epochs=10, batch_size=32, validation_split=0.2)
+    history = model.fit(train_ds, validation_data=val_ds, epochs=10)
     
-    saliency_map = compute_saliency_map(model, X_train_combined, Y_train_numeric)
-    plot_saliency_map(saliency_map, wavelengths[0, :],Y_train_numeric, 98)
+    saliency_map = compute_saliency_map(model, X_train_array, Y_train_numeric, batch_size=256, wavelengths=wavelengths)
+    plot_saliency_map(saliency_map, wavelengths,Y_train_numeric, 98)
    
    #-------------------------------------- Grad CAM -----------------------------------------------#
     
     # Compute Grad-CAM for all Tissue and Non-Tissue samples
-   # grad_cams = compute_grad_cam_for_all(model, X_train_combined, Y_train_numeric)
+   # grad_cams = compute_grad_cam_for_all(model, X_train_array, Y_train_numeric, batch_size=256, wavelengths=wavelengths)
 
     # Plot Grad-CAM results
-    #plot_all_grad_cams(grad_cams, wavelengths[0, :])
+    #plot_all_grad_cams(grad_cams, wavelengths)
     # Ensure Model is Called Before Grad-CAM
     # Compute Grad-CAM for Tissue and Non-Tissue
     
@@ -203,15 +234,26 @@ def main():
         #   "Ratio 2": ("550-680", "515-540")
 
       }
+
+    # Set to True to replace the hand-picked bands with the best pairs of an exhaustive band search
+    run_band_search = False
+    if run_band_search:
+        band_results = search_power_ratio_bands(X_train, Y_train, wavelength_df, width_range=(10, 130, 5), step=5, top_k=20)
+        ratio_ranges = to_ratio_ranges(band_results, n_ratios=2)
+        print(f"Using searched ratio ranges: {ratio_ranges}")
     
       
 
+    # Save the feature plan so TS_ModelPrediction (feature_plan in config.yaml) computes the same features
+    feature_plan = FeaturePlan.from_ratio_ranges(ratio_ranges)
+    feature_plan.save(os.path.join(os.getcwd(), "feature_plan.json"))
+
     # Compute power ratio features
-    power_ratios_train = calculate_spectral_features(X_train, Y_train, wavelength_df, ratio_ranges)
+    power_ratios_train = calculate_spectral_features(X_train, Y_train, wavelength_df, plan=feature_plan)
     # Create a figure with two subplots
     #plot_power_ratio_histograms(power_ratios_train)
     
-    power_ratio_features_test = calculate_spectral_features(X_test, Y_test, wavelength_df, ratio_ranges)
+    power_ratio_features_test = calculate_spectral_features(X_test, Y_test, wavelength_df, plan=feature_plan)
     
     # # Step 2: Train the KNN Model on Power Ratio Features
     
@@ -229,8 +271,11 @@ def main():
     # X_train_balanced, y_train_balanced = smote.fit_resample(X_train_knn, y_train_knn)  
     # smote_enn = SMOTEENN(random_state=42)
     # X_train_balanced, y_train_balanced = smote_enn.fit_resample(X_train_knn, y_train_knn) 
-    smote_tomek = SMOTETomek(random_state=42)
-    X_train_balanced, y_train_balanced = smote_tomek.fit_resample(X_train_knn, y_train_knn)
+    # Rebalancing strategy: "smotetomek", "smote", "class_weight", "undersample" or "none"
+    # (fast=True uses kd-tree neighbours and chunked parallel Tomek links; per-stage timings are printed)
+    rebalance_strategy = "smotetomek"
+    # Resampled copy for the histograms below; the searches resample inside every training fold instead
+    X_train_balanced, y_train_balanced = rebalance(X_train_knn, y_train_knn, strategy=rebalance_strategy, random_state=42, fast=True)
         
     
        
@@ -245,10 +290,41 @@ def main():
 
     #     # Train KNN Model
     # Train models & get the best one
-    best_model, best_cv_results, best_model_name, best_cv_score, label_encoder = train_models(X_train_balanced, y_train_balanced)
+    # search="grid" is the exhaustive grid search; search="halving" uses successive halving (faster, may pick another model)
+    # (add concurrent=True, threads_per_task=... to run all families on one shared worker pool)
+    # (normalization="zscore", feature_selection="pca", cache_dir="pipeline_cache" fit the preprocessing per fold, cached)
+    # (knn_index_search=True reuses one kd-tree per fold for all KNN n_neighbors/weights values)
+    # (xgb_early_stopping=True tunes XGBoost with hist trees and early stopping; export with ml_framework.onnxExport)
+    # (both resample each training fold with the sampler below, but not with normalization/feature_selection)
+    # The rows of X_train_knn line up with data_train, so the cached grouped folds apply; the rebalancing
+    # runs on the training part of every fold (make_sampler) and validation uses original rows only
+    best_model, best_cv_results, best_model_name, best_cv_score, label_encoder = train_models(X_train_knn, y_train_knn, search="grid", cv=cv_folds,
+                                                                                             sampler=make_sampler(rebalance_strategy, random_state=42, fast=True),
+                                                                                             class_weight="balanced" if rebalance_strategy == "class_weight" else None)
 
 # Evaluate the best model
     evaluate_model(best_model, X_train_knn, y_train_knn, X_test_knn, y_test_knn, best_cv_score, best_model_name, label_encoder)    
+
+    # Prediction-time latency of the KNN neighbour algorithms (brute vs kd-tree vs ball-tree)
+    best_classifier = best_model.named_steps[CLASSIFIER_STEP] if isinstance(best_model, Pipeline) else best_model
+    if isinstance(best_classifier, KNeighborsClassifier):
+        # Neighbours are searched in the preprocessed feature space of the pipeline (resampling is skipped)
+        X_knn_train, X_knn_query = X_train_balanced, X_test_knn
+        if isinstance(best_model, Pipeline):
+            X_knn_train, X_knn_query = best_model[:-1].transform(X_train_balanced), best_model[:-1].transform(X_test_knn)
+        benchmark_knn_algorithms(X_knn_train, y_train_balanced, X_knn_query, n_neighbors=best_classifier.n_neighbors,
+                                 weights=best_classifier.weights, metric=best_classifier.metric)
+
+    # Set to True to export the best model for TS_ModelPrediction (float_input, label/probabilities),
+    # check sklearn vs ONNX Runtime parity on the test set and compare latency, throughput and size.
+    # The model is written to output/onnx; copy it to TS_ModelPrediction/ONNX Models once it is approved.
+    export_onnx = False
+    if export_onnx:
+        onnx_model_path = os.path.join(os.getcwd(), "output", "onnx", f"{source}_{ab_status}.onnx")
+        # Latency of the shipped model for the same source/AB status next to the new one
+        shipped_onnx_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "TS_ModelPrediction", "ONNX Models")
+        export_and_benchmark(best_model, onnx_model_path, X_test_knn, plan=feature_plan,
+                             reference_paths=reference_onnx_paths(shipped_onnx_dir, source, ab_status))
     
     
     
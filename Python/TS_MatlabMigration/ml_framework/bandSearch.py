@@ -0,0 +1,261 @@
+import time
+import numpy as np
+import pandas as pd
+
+
+def band_power_prefix(x_train, scale=1000):
+    """
+    Builds the cumulative absolute power of every spectrum.
+
+    The spectra are scaled and truncated to integers exactly like
+    calculate_spectral_features, so the power of any band is one subtraction:
+    prefix[:, hi] - prefix[:, lo] == np.abs(sample[lo:hi]).sum().
+
+    Parameters:
+    - x_train: Spectral intensity data (numpy array or DataFrame, samples x wavelengths).
+    - scale (float): Scale factor applied before the integer conversion.
+
+    Returns:
+    - prefix (numpy array): int64 prefix sums (samples x wavelengths + 1), first column 0.
+    """
+    x_train = np.asarray(x_train, dtype=np.float64)
+    x_int = np.abs(np.nan_to_num(x_train * scale, nan=0, posinf=0, neginf=0).astype(np.int64))
+    prefix = np.zeros((x_int.shape[0], x_int.shape[1] + 1), dtype=np.int64)
+    np.cumsum(x_int, axis=1, out=prefix[:, 1:])
+    return prefix
+
+
+def _band_power(prefix, lo, hi):
+    # Power of the bands lo:hi of every sample (samples x bands), from the prefix sums
+    return (prefix[:, hi] - prefix[:, lo]).astype(np.float64)
+
+
+def candidate_bands(wavelengths, width_range=(10, 130, 5), step=5, wl_range=(400, 940)):
+    """
+    Enumerates all candidate bands on the wavelength grid.
+
+    Band edges are whole nanometres so every band can be written as "start-end"
+    in ratio_ranges. A band covers the wavelengths with start <= wl <= end, the
+    same selection calculate_spectral_features uses.
+
+    Parameters:
+    - wavelengths: Wavelength values of the spectrum columns (ascending).
+    - width_range (tuple): (min_width, max_width, width_step) in nm, max inclusive.
+    - step (int): Step between band start positions in nm.
+    - wl_range (tuple): (start, end) in nm that every band must lie in.
+
+    Returns:
+    - bands (DataFrame): One row per band with Band ("start-end"), Start, End, Lo, Hi
+      (column slice lo:hi) and Width columns.
+    """
+    wavelengths = np.asarray(wavelengths, dtype=np.float64).ravel()
+    min_width, max_width, width_step = width_range
+
+    starts, ends = [], []
+    for width in range(int(min_width), int(max_width) + 1, int(width_step)):
+        band_starts = np.arange(int(wl_range[0]), int(wl_range[1]) - width + 1, int(step))
+        starts.append(band_starts)
+        ends.append(band_starts + width)
+    starts = np.concatenate(starts) if starts else np.array([], dtype=int)
+    ends = np.concatenate(ends) if ends else np.array([], dtype=int)
+
+    lo = np.searchsorted(wavelengths, starts, side="left")
+    hi = np.searchsorted(wavelengths, ends, side="right")
+
+    bands = pd.DataFrame({
+        "Band": [f"{s}-{e}" for s, e in zip(starts, ends)],
+        "Start": starts, "End": ends, "Lo": lo, "Hi": hi, "Width": ends - starts,
+    })
+    # Bands that contain no wavelength sample cannot form a ratio
+    return bands[bands["Hi"] > bands["Lo"]].reset_index(drop=True)
+
+
+def _fisher_scores(ratios, onehot):
+    # ratios: samples x candidates, NaN where the denominator was zero
+    valid = np.isfinite(ratios)
+    values = np.where(valid, ratios, 0.0)
+
+    counts = onehot @ valid.astype(np.float64)   # classes x candidates
+    sums = onehot @ values
+    squares = onehot @ (values * values)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        class_means = sums / counts
+        total = counts.sum(axis=0)
+        grand_mean = sums.sum(axis=0) / total
+        between = np.nansum(counts * (class_means - grand_mean) ** 2, axis=0)
+        within = np.nansum(squares - sums * class_means, axis=0)
+        scores = between / within
+
+    # Candidates with an empty class or no spread cannot be ranked
+    usable = (counts > 0).all(axis=0) & (within > 0)
+    return np.where(usable, scores, -np.inf), class_means
+
+
+def search_power_ratio_bands(x_train, y_train, wavelength_df, width_range=(10, 130, 5), step=5,
+                             wl_range=(400, 940), top_k=20, allow_overlap=False, log_ratio=False,
+                             scale=1000, max_batch_mb=256, verbose=True):
+    """
+    Exhaustively scores every (numerator band, denominator band) pair as a power ratio feature.
+
+    Band powers come from one prefix-sum pass over the spectra, and ratios are
+    scored in tiles of numerator bands x denominator bands whose size follows
+    max_batch_mb. The band powers of all bands are kept only if they fit in that
+    budget as well; otherwise each tile takes its band powers from the prefix sums.
+    The score is the Fisher criterion (between-class over within-class scatter) of
+    the ratio across all classes; samples with a zero denominator are ignored like
+    the None ratios of calculate_spectral_features.
+
+    Parameters:
+    - x_train: Spectral intensity data (numpy array or DataFrame).
+    - y_train: Labels corresponding to the data.
+    - wavelength_df: Wavelength values corresponding to spectral data.
+    - width_range (tuple): (min_width, max_width, width_step) of the bands in nm.
+    - step (int): Step between band start positions in nm.
+    - wl_range (tuple): Wavelength window searched in nm.
+    - top_k (int): Number of best pairs returned.
+    - allow_overlap (bool): Also score pairs whose bands overlap (default: False).
+    - log_ratio (bool): Score log(ratio) instead of the ratio itself.
+    - scale (float): Scale factor applied before the integer conversion.
+    - max_batch_mb (int): Approximate memory budget of one scoring tile. A tile holds at
+      least one band pair (samples x 32 bytes); a warning is printed if that exceeds the budget.
+    - verbose (bool): Print progress and timing.
+
+    Returns:
+    - results (DataFrame): Top-k pairs sorted by Score with Numerator, Denominator,
+      Score and the mean ratio of every class.
+    """
+    if hasattr(wavelength_df, "values"):
+        wavelength_df = wavelength_df.values
+    wavelengths = np.asarray(wavelength_df, dtype=np.float64).ravel()
+    y_train = np.asarray(y_train).ravel()
+
+    start_time = time.time()
+    prefix = band_power_prefix(x_train, scale=scale)
+    bands = candidate_bands(wavelengths, width_range=width_range, step=step, wl_range=wl_range)
+    n_bands = len(bands)
+    if n_bands < 2:
+        raise ValueError("Fewer than two candidate bands; widen wl_range or width_range.")
+
+    lo = bands["Lo"].to_numpy()
+    hi = bands["Hi"].to_numpy()
+    n_samples = prefix.shape[0]
+
+    classes, codes = np.unique(y_train, return_inverse=True)
+    onehot = np.zeros((len(classes), len(y_train)), dtype=np.float64)
+    onehot[codes, np.arange(len(y_train))] = 1.0
+
+    # Band pairs per tile so the ratios and their three temporaries (samples x pairs, float64)
+    # stay within the memory budget; denominators are tiled first, then numerators
+    bytes_per_pair = n_samples * 8 * 4
+    pairs_per_batch = int(max_batch_mb * 1024 ** 2 // max(bytes_per_pair, 1))
+    if pairs_per_batch < 1:
+        print(f"[Warning] One band pair of {n_samples} samples needs {bytes_per_pair / 1024 ** 2:.0f} MB, "
+              f"more than max_batch_mb={max_batch_mb}; scoring one pair per tile.")
+        pairs_per_batch = 1
+    den_batch = min(n_bands, pairs_per_batch)
+    # Equal denominator tiles rather than a full tile and a small remainder
+    den_batch = -(-n_bands // -(-n_bands // den_batch))
+    num_batch = max(1, pairs_per_batch // den_batch)
+    # Band powers of all bands (samples x bands) are kept only when they fit in the budget too;
+    # otherwise every tile takes its band powers from the prefix sums
+    power = _band_power(prefix, lo, hi) if n_samples * n_bands * 8 <= max_batch_mb * 1024 ** 2 else None
+
+    best_scores = np.empty(0)
+    best_pairs = np.empty((0, 2), dtype=np.int64)
+    best_means = np.empty((len(classes), 0))
+    n_candidates = 0
+
+    for num_first in range(0, n_bands, num_batch):
+        num_idx = np.arange(num_first, min(num_first + num_batch, n_bands))
+        numerator = power[:, num_idx] if power is not None else _band_power(prefix, lo[num_idx], hi[num_idx])
+
+        for den_first in range(0, n_bands, den_batch):
+            den_idx = np.arange(den_first, min(den_first + den_batch, n_bands))
+            denominator = power[:, den_idx] if power is not None else _band_power(prefix, lo[den_idx], hi[den_idx])
+            denominator[denominator == 0] = np.nan
+
+            # samples x numerators x denominators -> samples x (numerators * denominators)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                ratios = numerator[:, :, np.newaxis] / denominator[:, np.newaxis, :]
+                if log_ratio:
+                    ratios = np.log(np.where(ratios > 0, ratios, np.nan))
+            scores, class_means = _fisher_scores(ratios.reshape(n_samples, -1), onehot)
+            del ratios
+            scores = scores.reshape(len(num_idx), len(den_idx))
+
+            # A band is never its own denominator; optionally drop overlapping pairs too
+            if allow_overlap:
+                excluded = num_idx[:, np.newaxis] == den_idx[np.newaxis, :]
+            else:
+                excluded = (lo[num_idx, np.newaxis] < hi[np.newaxis, den_idx]) & (lo[np.newaxis, den_idx] < hi[num_idx, np.newaxis])
+            scores[excluded] = -np.inf
+            n_candidates += int((~excluded).sum())
+
+            # Merge this tile into the running top-k
+            flat = scores.ravel()
+            keep = min(top_k, flat.size)
+            top = np.argpartition(-flat, keep - 1)[:keep]
+            top = top[np.isfinite(flat[top])]
+            best_scores = np.concatenate([best_scores, flat[top]])
+            best_pairs = np.concatenate([best_pairs, np.column_stack([num_idx[top // len(den_idx)], den_idx[top % len(den_idx)]])])
+            best_means = np.concatenate([best_means, class_means[:, top]], axis=1)
+            if len(best_scores) > top_k:
+                order = np.argsort(-best_scores, kind="stable")[:top_k]
+                best_scores, best_pairs, best_means = best_scores[order], best_pairs[order], best_means[:, order]
+
+    order = np.argsort(-best_scores, kind="stable")
+    results = pd.DataFrame({
+        "Numerator": bands["Band"].to_numpy()[best_pairs[order, 0]],
+        "Denominator": bands["Band"].to_numpy()[best_pairs[order, 1]],
+        "Score": best_scores[order],
+    })
+    for c, label in enumerate(classes):
+        results[f"Mean Ratio {label}"] = best_means[c, order]
+
+    if verbose:
+        print(f"Scored {n_candidates} band pairs from {n_bands} bands in {time.time() - start_time:.1f} s")
+        print(results.head(top_k))
+    return results
+
+
+def to_ratio_ranges(results, n_ratios=2):
+    """
+    Converts the best search results into the ratio_ranges dictionary used by
+    calculate_spectral_features and config.yaml.
+
+    Example: {"Ratio 1": ("465-485", "515-535"), "Ratio 2": (...)}
+    """
+    top = results.head(n_ratios)
+    return {f"Ratio {i+1}": (num, den) for i, (num, den) in enumerate(zip(top["Numerator"], top["Denominator"]))}
+
+
+def search_power_ratio_bands_by_group(data, feature_cols, wavelength_df, label_col="Response",
+                                      group_cols=("Source", "ABStatus"), **search_kwargs):
+    """
+    Runs search_power_ratio_bands separately for every group (e.g. light source and AB status).
+
+    Parameters:
+    - data (DataFrame): Spectra, labels and group columns.
+    - feature_cols (list): Spectrum columns ("Feature 1" ...).
+    - wavelength_df: Wavelength values of the spectrum columns.
+    - label_col (str): Column holding the class labels.
+    - group_cols (tuple): Columns defining the groups.
+    - search_kwargs: Passed on to search_power_ratio_bands.
+
+    Returns:
+    - results (DataFrame): Top-k pairs of every group with the group columns prepended.
+    """
+    group_cols = [col for col in group_cols if col in data.columns]
+    if not group_cols:
+        return search_power_ratio_bands(data[feature_cols], data[label_col], wavelength_df, **search_kwargs)
+
+    all_results = []
+    for keys, group in data.groupby(group_cols):
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        print(f"\nBand search for {dict(zip(group_cols, keys))} ({len(group)} samples)")
+        results = search_power_ratio_bands(group[feature_cols], group[label_col], wavelength_df, **search_kwargs)
+        for col, key in zip(group_cols, keys):
+            results.insert(group_cols.index(col), col, key)
+        all_results.append(results)
+    return pd.concat(all_results, ignore_index=True)
@@ -1,62 +1,129 @@
-import pandas as pd
+from joblib import Memory
+from sklearn.pipeline import Pipeline
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.feature_selection import SelectKBest, chi2
-from sklearn.model_selection import train_test_split
-from ml_utility.baseml import partition
 
-def basePipelineTrain(data, response_col="Response", normalization="zscore", 
-                        feature_selection="pca", feature_extraction="none"):
+# Name of the classifier step; grid parameters are prefixed with "clf__"
+CLASSIFIER_STEP = "clf"
+
+# Name of the optional resampling step (training folds only, skipped at prediction)
+SAMPLER_STEP = "rebalance"
+
+
+def _normalization_step(normalization):
+    if normalization == "zscore":
+        return StandardScaler()
+    if normalization == "range":
+        return MinMaxScaler()
+    if normalization == "none":
+        return "passthrough"
+    raise ValueError("Invalid normalization! Choose 'none', 'zscore', or 'range'.")
+
+
+def _selection_step(feature_selection, pca_variance=0.95, k="all"):
+    if feature_selection == "pca":
+        return PCA(n_components=pca_variance)
+    if feature_selection == "fscchi2":
+        # chi2 needs non-negative features, so combine it with normalization="range" or "none"
+        return SelectKBest(score_func=chi2, k=k)
+    if feature_selection == "none":
+        return "passthrough"
+    raise ValueError("Invalid feature selection! Choose 'none', 'fscchi2', or 'pca'.")
+
+
+def make_memory(cache_dir):
+    """Returns the joblib.Memory used to cache fitted transformers in cache_dir (None disables caching)."""
+    if cache_dir is None or isinstance(cache_dir, Memory):
+        return cache_dir
+    return Memory(location=cache_dir, verbose=0)
+
+
+def build_pipeline(classifier, normalization="zscore", feature_selection="pca", cache_dir=None,
+                   pca_variance=0.95, k="all", sampler=None):
+    """
+    Builds the normalization -> selection -> classifier Pipeline.
+
+    With a cache_dir, every fitted scaler and PCA/selector is memoized on disk, keyed by
+    the transformer parameters and the data it was fitted on. Within a search each fold
+    and preprocessing setting is then fitted once, no matter how many classifier
+    hyperparameters are tried.
+
+    With a sampler (e.g. ml_framework.rebalance.make_sampler) an imblearn Pipeline is
+    returned whose first step resamples the training rows of every fit; prediction
+    skips it.
+
+    Parameters:
+    - classifier: sklearn-compatible classifier (final step, named "clf").
+    - normalization: "none", "zscore", or "range".
+    - feature_selection: "none", "fscchi2", or "pca".
+    - cache_dir (str or joblib.Memory): Folder for the transformer cache (default: no caching).
+    - pca_variance (float): Variance retained by PCA.
+    - k (int or "all"): Number of features kept by the chi2 selection.
+    - sampler: imblearn-compatible sampler run before the preprocessing (default: none).
+
+    Returns:
+    - pipeline (Pipeline): Unfitted pipeline with steps "scaler", "select" and "clf"
+      ("rebalance" first when a sampler is given).
+    """
+    steps = [
+        ("scaler", _normalization_step(normalization)),
+        ("select", _selection_step(feature_selection, pca_variance=pca_variance, k=k)),
+        (CLASSIFIER_STEP, classifier),
+    ]
+    if sampler is None:
+        return Pipeline(steps, memory=make_memory(cache_dir))
+
+    # Samplers need imblearn's Pipeline, which only resamples during fit
+    from imblearn.pipeline import Pipeline as ImbPipeline
+    return ImbPipeline([(SAMPLER_STEP, sampler)] + steps, memory=make_memory(cache_dir))
+
+
+def inference_model(model):
+    """
+    Returns the prediction part of a fitted model: the pipeline without its resampling and
+    "passthrough" steps, or the bare classifier when no preprocessing step is left.
+    """
+    if not isinstance(model, Pipeline):
+        return model
+    steps = [(name, step) for name, step in model.steps if name != SAMPLER_STEP and step not in ("passthrough", None)]
+    return steps[-1][1] if len(steps) == 1 else Pipeline(steps)
+
+
+def pipeline_param_grid(param_grid, step=CLASSIFIER_STEP):
+    """Prefixes classifier hyperparameters for a Pipeline, e.g. {'max_depth': [...]} -> {'clf__max_depth': [...]}."""
+    return {f"{step}__{name}": values for name, values in param_grid.items()}
+
+
+def basePipelineTrain(data, classifier, response_col="Response", normalization="zscore",
+                      feature_selection="pca", feature_extraction="none", cache_dir=None):
     """
     A function to simulate the basePipelineTrain process in MATLAB.
 
+    The preprocessing is no longer fitted on the whole dataset up front; it is part of
+    the returned Pipeline, so cross-validation and grid searches refit it on every
+    training fold only (and reuse cached fits, see build_pipeline).
+
     Parameters:
     - data: pandas DataFrame
+    - classifier: sklearn-compatible classifier used as the final step.
     - response_col: The name of the target column (response).
     - normalization: "none", "zscore", or "range".
     - feature_selection: "none", "fscchi2", or "pca".
     - feature_extraction: Currently not implemented, placeholder for future.
+    - cache_dir (str): Optional folder for the fitted-transformer cache.
 
     Returns:
-    - data_transformed: pandas DataFrame with transformed features and target.
-    - feature_names: List of selected feature names.
+    - pipeline: Unfitted sklearn Pipeline (normalization, selection, classifier).
+    - features: pandas DataFrame with the feature columns.
+    - response: pandas Categorical with the target.
     """
+    if feature_extraction != "none":
+        raise ValueError("feature_extraction is not implemented yet; use 'none'.")
 
-    # Extract feature names and response name
     features = data.drop(columns=[response_col])
-    responsename = data[response_col]
-
-    # Normalize the features
-    if normalization == "zscore":
-        scaler = StandardScaler()
-        features = scaler.fit_transform(features)
-    elif normalization == "range":
-        scaler = MinMaxScaler()
-        features = scaler.fit_transform(features)
+    response = data[response_col].astype("category")
 
-    # Apply feature selection
-    if feature_selection == "pca":
-        pca = PCA(n_components=0.95)  # 95% variance retained
-        features = pca.fit_transform(features)
-        feature_names = [f"PC{i+1}" for i in range(features.shape[1])]
-    elif feature_selection == "fscchi2":
-        selector = SelectKBest(score_func=chi2, k='all')
-        features = selector.fit_transform(features, responsename)
-        feature_names = [f"Feature_{i+1}" for i in range(features.shape[1])]
-    else:
-        feature_names = list(data.drop(columns=[response_col]).columns)
-
-    # Partition the data into training and test sets
-    data = partition(data)
-    
-    # Optionally convert response to categorical for classification tasks
-    data[responsename] = pd.Categorical(data[responsename])
-    
-    # Store features, response, partition info in a dict (mimicking MATLAB custom properties)
-    data.custom_properties = {
-        'Features': featurenames,
-        'Response': responsename,
-        'TrainingObservations': data['Partition'] == 'Train'
-    }
-    
-    return data
+    pipeline = build_pipeline(classifier, normalization=normalization, feature_selection=feature_selection,
+                              cache_dir=cache_dir)
+    return pipeline, features, response
@@ -0,0 +1,192 @@
+import json
+import numpy as np
+import pandas as pd
+from scipy.integrate import trapezoid  # For AUC calculation
+
+# Per-band statistics in output column order (names match calculate_spectral_features)
+BAND_STATISTICS = ("AUC", "Peak_to_Trough", "STD", "Mean_Intensity")
+
+
+def parse_band(band):
+    """Parses a band name such as "465-485" into (start, end)."""
+    start, end = map(int, band.split('-'))
+    return start, end
+
+
+class FeaturePlan:
+    """
+    Declarative description of the power ratio and band statistic features.
+
+    A plan lists the ratios (numerator band / denominator band) and the bands the
+    per-band statistics are computed on. It is compiled once per wavelength grid into
+    deduplicated index windows and a fixed column order, and can be saved to JSON
+    so training and ONNX inference compute identical features.
+
+    Example:
+        plan = FeaturePlan({"Ratio 1": ("465-485", "515-535"), "Ratio 2": ("638-658", "515-535")})
+        features = plan.execute(X, wavelengths)
+    """
+
+    def __init__(self, ratios, stat_bands=None, statistics=BAND_STATISTICS, n_stat_bands=3, scale=1000, ratio_decimals=2):
+        """
+        Parameters:
+        - ratios (dict): Ratio name -> (numerator band, denominator band), e.g. {"Ratio 1": ("460-490", "515-540")}.
+        - stat_bands (list): Bands for the per-band statistics. Defaults to the first n_stat_bands
+          unique bands in the order they appear in ratios.
+        - statistics (tuple): Statistics computed per band (subset of BAND_STATISTICS).
+        - n_stat_bands (int): Number of bands used when stat_bands is not given.
+        - scale (float): Scale factor applied before the integer conversion of the spectra.
+        - ratio_decimals (int): Decimals the ratios are rounded to.
+        """
+        self.ratios = {name: tuple(pair) for name, pair in ratios.items()}
+        for name, pair in self.ratios.items():
+            if len(pair) != 2:
+                raise ValueError(f"Ratio '{name}' must be a (numerator, denominator) pair, got {pair}.")
+
+        unknown = [stat for stat in statistics if stat not in BAND_STATISTICS]
+        if unknown:
+            raise ValueError(f"Unknown statistics {unknown}. Choose from {BAND_STATISTICS}.")
+
+        if stat_bands is None:
+            ordered = list(dict.fromkeys(band for pair in self.ratios.values() for band in pair))
+            stat_bands = ordered[:n_stat_bands]
+        self.stat_bands = list(stat_bands)
+        self.statistics = tuple(statistics)
+        self.scale = scale
+        self.ratio_decimals = ratio_decimals
+        self._compiled = {}
+
+    @classmethod
+    def from_ratio_ranges(cls, ratio_ranges, **kwargs):
+        """Builds the default plan for a ratio_ranges dictionary."""
+        return cls(ratio_ranges, **kwargs)
+
+    @property
+    def bands(self):
+        """All unique bands of the plan in first-use order."""
+        used = [band for pair in self.ratios.values() for band in pair] + self.stat_bands
+        return list(dict.fromkeys(used))
+
+    @property
+    def columns(self):
+        """Output column order: ratios, then every statistic for every statistic band."""
+        columns = list(self.ratios.keys())
+        for stat in self.statistics:
+            columns += [f"{stat}_{j+1}" for j in range(len(self.stat_bands))]
+        return columns
+
+    def compile(self, wavelengths):
+        """
+        Resolves every unique band to a contiguous column window of the wavelength grid.
+
+        Compiled plans are cached per grid, so repeated calls on the same grid are free.
+
+        Parameters:
+        - wavelengths: Wavelength values of the spectrum columns (ascending).
+
+        Returns:
+        - windows (dict): Band -> (lo, hi) so the band covers columns lo:hi.
+        """
+        wavelengths = np.asarray(wavelengths, dtype=np.float64).ravel()
+        key = (len(wavelengths), wavelengths.tobytes())
+        if key in self._compiled:
+            return self._compiled[key]
+
+        if np.any(np.diff(wavelengths) < 0):
+            raise ValueError("Wavelengths must be sorted in ascending order.")
+
+        windows = {}
+        for band in self.bands:
+            start, end = parse_band(band)
+            # Same selection as (wavelengths >= start) & (wavelengths <= end)
+            windows[band] = (int(np.searchsorted(wavelengths, start, side="left")),
+                             int(np.searchsorted(wavelengths, end, side="right")))
+        self._compiled[key] = windows
+        return windows
+
+    def execute(self, x, wavelengths):
+        """
+        Computes all features of the plan for every spectrum at once.
+
+        Parameters:
+        - x: Spectral intensity data (numpy array or DataFrame, samples x wavelengths).
+        - wavelengths: Wavelength values of the spectrum columns.
+
+        Returns:
+        - features (DataFrame): One row per spectrum, columns in plan order. Undefined
+          ratios (zero denominator or zero minimum) are NaN.
+        """
+        windows = self.compile(wavelengths)
+        wavelengths = np.asarray(wavelengths, dtype=np.float64).ravel()
+
+        # Convert spectral data to handle NaN/Inf and scale to integers
+        x = np.nan_to_num(np.asarray(x, dtype=np.float64) * self.scale, nan=0, posinf=0, neginf=0).astype(np.int64)
+        n_samples = x.shape[0]
+
+        # Absolute power of every band from one prefix sum pass
+        prefix = np.zeros((n_samples, x.shape[1] + 1), dtype=np.int64)
+        np.cumsum(np.abs(x), axis=1, out=prefix[:, 1:])
+        power = {band: prefix[:, hi] - prefix[:, lo] for band, (lo, hi) in windows.items()}
+
+        features = {}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for name, (num_band, denom_band) in self.ratios.items():
+                numerator, denominator = power[num_band], power[denom_band]
+                ratio = np.round(numerator / np.where(denominator != 0, denominator, 1), self.ratio_decimals)
+                features[name] = np.where(denominator != 0, ratio, np.nan)
+
+            stats = {stat: [] for stat in self.statistics}
+            for band in self.stat_bands:
+                lo, hi = windows[band]
+                segment = x[:, lo:hi]
+                if segment.shape[1] == 0:
+                    for stat in self.statistics:
+                        stats[stat].append(np.full(n_samples, np.nan))
+                    continue
+                if "AUC" in stats:
+                    stats["AUC"].append(trapezoid(segment, wavelengths[lo:hi], axis=1))
+                if "Peak_to_Trough" in stats:
+                    minimum = segment.min(axis=1)
+                    stats["Peak_to_Trough"].append(np.where(minimum != 0, segment.max(axis=1) / np.where(minimum != 0, minimum, 1), np.nan))
+                if "STD" in stats:
+                    stats["STD"].append(segment.std(axis=1))
+                if "Mean_Intensity" in stats:
+                    stats["Mean_Intensity"].append(segment.mean(axis=1))
+
+        for stat in self.statistics:
+            for j, values in enumerate(stats[stat]):
+                features[f"{stat}_{j+1}"] = values
+
+        return pd.DataFrame(features, columns=self.columns)
+
+    def to_dict(self):
+        """Returns a JSON-serializable description of the plan."""
+        return {
+            "ratios": {name: list(pair) for name, pair in self.ratios.items()},
+            "stat_bands": self.stat_bands,
+            "statistics": list(self.statistics),
+            "scale": self.scale,
+            "ratio_decimals": self.ratio_decimals,
+        }
+
+    @classmethod
+    def from_dict(cls, plan_dict):
+        """Rebuilds a plan from to_dict() output."""
+        return cls(
+            plan_dict["ratios"],
+            stat_bands=plan_dict.get("stat_bands"),
+            statistics=tuple(plan_dict.get("statistics", BAND_STATISTICS)),
+            scale=plan_dict.get("scale", 1000),
+            ratio_decimals=plan_dict.get("ratio_decimals", 2),
+        )
+
+    def save(self, path):
+        """Saves the plan as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a plan saved with save()."""
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,311 @@
+import os
+import glob
+import json
+import time
+import pickle
+import warnings
+from contextlib import contextmanager
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnxmltools import convert_xgboost
+from onnxmltools.convert.common.data_types import FloatTensorType
+from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost as xgboost_operator_converter
+from skl2onnx import convert_sklearn, update_registered_converter, get_latest_tested_opset_version
+from skl2onnx.common.data_types import FloatTensorType as SklearnFloatTensorType
+from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+from sklearn.pipeline import Pipeline
+from xgboost import XGBClassifier
+from ml_framework.basePipilineTrain import inference_model
+
+# Input name of the shipped models ("<SOURCE>_<AB_STATUS>.onnx"), read by processing_module.run_onnx_model
+ONNX_INPUT_NAME = "float_input"
+
+
+def _save_onnx(onnx_model, onnx_path, feature_columns=None):
+    # Feature order is stored in the model metadata so inference can check its columns
+    if feature_columns is not None:
+        onnx.helper.set_model_props(onnx_model, {"feature_columns": json.dumps(list(feature_columns))})
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+    with open(onnx_path, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+
+
+@contextmanager
+def _positional_feature_names(model):
+    # onnxmltools only reads trees split on "f0", "f1", ...; boosters fitted on DataFrames carry the
+    # column names instead, so they are cleared for the conversion and restored afterwards
+    booster = model.get_booster()
+    feature_names = booster.feature_names
+    booster.feature_names = None
+    try:
+        yield
+    finally:
+        booster.feature_names = feature_names
+
+
+def export_xgboost_onnx(model, n_features, onnx_path, input_name=ONNX_INPUT_NAME, target_opset=None, feature_columns=None):
+    """
+    Exports a fitted XGBClassifier to ONNX with onnxmltools.
+
+    The model is exported with all its trees, so early-stopped models should be refitted
+    with their final tree count first (search_xgboost_early_stopping does this).
+
+    Parameters:
+    - model: Fitted XGBClassifier.
+    - n_features (int): Number of input features (e.g. len(plan.columns)).
+    - onnx_path (str): Output .onnx file.
+    - input_name (str): Name of the float32 input tensor.
+    - target_opset (int): ONNX opset (default: onnxmltools default).
+    - feature_columns (list): Optional feature names stored in the model metadata.
+
+    Returns:
+    - onnx_path (str): Path of the written model.
+    """
+    with _positional_feature_names(model):
+        onnx_model = convert_xgboost(model, initial_types=[(input_name, FloatTensorType([None, n_features]))],
+                                     target_opset=target_opset)
+    _save_onnx(onnx_model, onnx_path, feature_columns)
+    print(f"[ONNX] Exported {type(model).__name__} to {onnx_path}")
+    return onnx_path
+
+
+_xgboost_registered = False
+
+def _register_xgboost_converter():
+    # Lets skl2onnx convert XGBClassifier steps inside sklearn Pipelines
+    global _xgboost_registered
+    if not _xgboost_registered:
+        update_registered_converter(
+            XGBClassifier, "XGBoostXGBClassifier", calculate_linear_classifier_output_shapes, xgboost_operator_converter,
+            options={"nocl": [True, False], "zipmap": [True, False, "columns"]})
+        _xgboost_registered = True
+
+
+def export_model_onnx(model, onnx_path, n_features=None, plan=None, input_name=ONNX_INPUT_NAME, target_opset=None):
+    """
+    Exports a fitted model from train_models (estimator or Pipeline) to ONNX.
+
+    The model gets one float32 input named input_name with the feature count of the
+    plan, and "label" (int64) and "probabilities" (float32, samples x classes) outputs
+    like the shipped models. XGBClassifier goes through onnxmltools, everything else
+    through skl2onnx. The plan columns are stored in the model metadata and the plan
+    is saved next to the model.
+
+    Parameters:
+    - model: Fitted classifier or Pipeline (e.g. best_model of train_models).
+    - onnx_path (str): Output .onnx file.
+    - n_features (int): Number of input features (taken from the plan when given).
+    - plan (FeaturePlan): Feature plan the model was trained on.
+    - input_name (str): Name of the input tensor.
+    - target_opset (int): ONNX opset (default: converter default).
+
+    Returns:
+    - onnx_path (str): Path of the written model.
+    """
+    # Resampling steps only act during training
+    model = inference_model(model)
+    feature_columns = plan.columns if plan is not None else None
+    if feature_columns is not None:
+        n_features = len(feature_columns)
+    if n_features is None:
+        raise ValueError("Pass n_features or the feature plan of the model.")
+
+    if isinstance(model, XGBClassifier):
+        export_xgboost_onnx(model, n_features, onnx_path, input_name=input_name, target_opset=target_opset,
+                            feature_columns=feature_columns)
+    else:
+        classifier = model[-1] if isinstance(model, Pipeline) else model
+        if isinstance(classifier, XGBClassifier):
+            _register_xgboost_converter()
+            # The XGBoost converter emits ai.onnx.ml operators skl2onnx supports up to version 3
+            target_opset = target_opset or {"": get_latest_tested_opset_version(), "ai.onnx.ml": 3}
+            with _positional_feature_names(classifier):
+                onnx_model = convert_sklearn(
+                    model, initial_types=[(input_name, SklearnFloatTensorType([None, n_features]))],
+                    options={id(classifier): {"zipmap": False}}, target_opset=target_opset)
+        else:
+            onnx_model = convert_sklearn(
+                model, initial_types=[(input_name, SklearnFloatTensorType([None, n_features]))],
+                options={id(classifier): {"zipmap": False}}, target_opset=target_opset)
+        _save_onnx(onnx_model, onnx_path, feature_columns)
+        print(f"[ONNX] Exported {type(model).__name__} to {onnx_path}")
+
+    if plan is not None:
+        plan.save(os.path.splitext(onnx_path)[0] + ".feature_plan.json")
+    return onnx_path
+
+
+def check_onnx_parity(model, onnx_path, X_holdout, atol=1e-4):
+    """
+    Compares sklearn and ONNX Runtime predictions on a hold-out set.
+
+    sklearn predicts on the data as given, ONNX Runtime on its float32 conversion, so
+    samples on a tree threshold can flip; they are counted as mismatches.
+
+    Returns:
+    - parity (dict): Label agreement, label mismatches and the largest probability difference.
+    """
+    session, input_name, X32 = _session_input(onnx_path, X_holdout)
+    onnx_labels, onnx_proba = session.run(None, {input_name: X32})[:2]
+    sklearn_labels = np.asarray(model.predict(X_holdout))
+    sklearn_proba = model.predict_proba(X_holdout)
+
+    mismatches = int(np.sum(sklearn_labels != onnx_labels))
+    max_proba_diff = float(np.max(np.abs(sklearn_proba - onnx_proba))) if len(X32) else 0.0
+    parity = {
+        "Label agreement": 1 - mismatches / max(len(X32), 1),
+        "Label mismatches": mismatches,
+        "Max probability diff": max_proba_diff,
+    }
+    status = "OK" if mismatches == 0 and max_proba_diff <= atol else "MISMATCH"
+    print(f"[ONNX] Parity {status}: {mismatches}/{len(X32)} label mismatches, max probability diff {max_proba_diff:.2e}")
+    return parity
+
+
+def _session_input(onnx_path, X):
+    # Session and a float32 input matching the model's feature count
+    session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    X = np.ascontiguousarray(np.asarray(X), dtype=np.float32)
+    n_features = model_input.shape[1] if isinstance(model_input.shape[1], int) else X.shape[1]
+    if X.shape[1] != n_features:
+        # Timings on other data than the other models would not be comparable
+        raise ValueError(f"{os.path.basename(onnx_path)} expects {n_features} features, got {X.shape[1]}.")
+    return session, model_input.name, X
+
+
+def _time_calls(predict, rows, batch, n_batches):
+    # Single-row latencies (s) and batch throughput (rows/s) of one predict function
+    predict(rows[:1])  # Warm-up, so initialization is not timed
+    single = np.empty(len(rows))
+    for i in range(len(rows)):
+        start = time.perf_counter()
+        predict(rows[i:i + 1])
+        single[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n_batches):
+        predict(batch)
+    return single, len(batch) * n_batches / (time.perf_counter() - start)
+
+
+def benchmark_onnx_latency(onnx_path, X, n_single=200, batch_size=1024, n_batches=20):
+    """
+    Measures ONNX Runtime latency of one model on the CPU provider.
+
+    Parameters:
+    - onnx_path (str): Path to the .onnx file.
+    - X: Feature matrix the rows are drawn from (float32 conversion is not timed).
+    - n_single (int): Number of single-row runs.
+    - batch_size (int): Rows per batch run.
+    - n_batches (int): Number of batch runs.
+
+    Returns:
+    - result (dict): Model, Single p50 (ms), Single p95 (ms), Batch throughput (rows/s), Size (KB).
+    """
+    session, input_name, X = _session_input(onnx_path, X)
+    rows = X[np.arange(n_single) % len(X)]
+    batch = X[np.arange(batch_size) % len(X)]
+    single, throughput = _time_calls(lambda data: session.run(None, {input_name: data}), rows, batch, n_batches)
+
+    return {
+        "Model": os.path.basename(onnx_path),
+        "Single p50 (ms)": np.percentile(single, 50) * 1000,
+        "Single p95 (ms)": np.percentile(single, 95) * 1000,
+        "Batch throughput (rows/s)": throughput,
+        "Size (KB)": os.path.getsize(onnx_path) / 1024,
+    }
+
+
+def benchmark_sklearn_latency(model, X, n_single=200, batch_size=1024, n_batches=20):
+    """Same measurements as benchmark_onnx_latency for the in-memory model (size = pickled size)."""
+    X = np.asarray(X, dtype=np.float64)
+    rows = X[np.arange(n_single) % len(X)]
+    batch = X[np.arange(batch_size) % len(X)]
+    with warnings.catch_warnings():
+        # Models fitted on DataFrames warn about plain arrays; arrays keep the timing free of pandas overhead
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        single, throughput = _time_calls(model.predict_proba, rows, batch, n_batches)
+
+    return {
+        "Model": f"sklearn {type(model).__name__}",
+        "Single p50 (ms)": np.percentile(single, 50) * 1000,
+        "Single p95 (ms)": np.percentile(single, 95) * 1000,
+        "Batch throughput (rows/s)": throughput,
+        "Size (KB)": len(pickle.dumps(model)) / 1024,
+    }
+
+
+def _print_benchmarks(results):
+    print(f"\n{'Model':<32}{'p50 (ms)':>10}{'p95 (ms)':>10}{'Rows/s':>12}{'Size (KB)':>11}")
+    for r in results:
+        print(f"{r['Model']:<32}{r['Single p50 (ms)']:>10.3f}{r['Single p95 (ms)']:>10.3f}"
+              f"{r['Batch throughput (rows/s)']:>12.0f}{r['Size (KB)']:>11.1f}")
+
+
+def _benchmark_references(reference_paths, X, **benchmark_kwargs):
+    # Shipped models built on another feature set cannot be timed on X and are left out of the table
+    results = []
+    for path in reference_paths:
+        try:
+            results.append(benchmark_onnx_latency(path, X, **benchmark_kwargs))
+        except ValueError as e:
+            print(f"[ONNX] Skipping reference model: {e}")
+    return results
+
+
+def reference_onnx_paths(onnx_dir, source=None, ab_status=None):
+    """Returns the shipped "<SOURCE>_<AB_STATUS>.onnx" models in onnx_dir, optionally for one source/AB status."""
+    pattern = f"{source or '*'}_{ab_status or '*'}.onnx"
+    return sorted(glob.glob(os.path.join(onnx_dir, pattern)))
+
+
+def compare_onnx_latency(onnx_path, reference_paths, X, **benchmark_kwargs):
+    """
+    Benchmarks a newly exported model against the shipped ONNX models and prints a table.
+
+    Parameters:
+    - onnx_path (str): Newly exported model.
+    - reference_paths (list): Shipped models, e.g. from reference_onnx_paths(). Models whose
+      input width differs from X are skipped.
+    - X: Feature matrix used for timing.
+    - benchmark_kwargs: Passed on to benchmark_onnx_latency.
+
+    Returns:
+    - results (list): One benchmark_onnx_latency dict per model, new model first.
+    """
+    results = [benchmark_onnx_latency(onnx_path, X, **benchmark_kwargs)] + _benchmark_references(reference_paths, X, **benchmark_kwargs)
+    _print_benchmarks(results)
+    return results
+
+
+def export_and_benchmark(model, onnx_path, X_holdout, plan=None, reference_paths=(), **benchmark_kwargs):
+    """
+    Exports the trained model to ONNX, checks prediction parity on the hold-out set and
+    reports sklearn vs ONNX Runtime single-row latency, batch throughput and model size.
+
+    Parameters:
+    - model: Fitted model from train_models.
+    - onnx_path (str): Output .onnx file.
+    - X_holdout: Hold-out features in plan column order.
+    - plan (FeaturePlan): Feature plan of the model (fixes the input width and column order).
+    - reference_paths (list): Shipped models to include in the timing table (skipped if their
+      input width differs from X_holdout).
+    - benchmark_kwargs: Passed on to the benchmark functions.
+
+    Returns:
+    - report (dict): "parity" (check_onnx_parity) and "benchmarks" (list of timing dicts).
+    """
+    if plan is not None and hasattr(X_holdout, "columns") and list(X_holdout.columns) != plan.columns:
+        raise ValueError(f"X_holdout columns {list(X_holdout.columns)} do not match the plan columns {plan.columns}.")
+
+    n_features = np.asarray(X_holdout).shape[1]
+    export_model_onnx(model, onnx_path, n_features=n_features, plan=plan)
+    parity = check_onnx_parity(model, onnx_path, X_holdout)
+
+    benchmarks = [benchmark_sklearn_latency(model, X_holdout, **benchmark_kwargs)]
+    benchmarks.append(benchmark_onnx_latency(onnx_path, X_holdout, **benchmark_kwargs))
+    benchmarks += _benchmark_references(reference_paths, X_holdout, **benchmark_kwargs)
+    _print_benchmarks(benchmarks)
+    return {"parity": parity, "benchmarks": benchmarks}
@@ -137,14 +137,18 @@
 
 import numpy as np
 import pandas as pd
-from scipy.integrate import trapz  # For AUC calculation
+from ml_framework.featurePlan import FeaturePlan
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-def calculate_spectral_features(x_train, y_train, wavelength_df, ratio_ranges):
+def calculate_spectral_features(x_train, y_train, wavelength_df, ratio_ranges=None, plan=None):
     """
     Computes power ratios along with additional spectral features: AUC, Peak-to-Trough, STD, Mean Intensity.
 
+    The features are described by a FeaturePlan. The extra statistics use the first 3
+    unique bands in the order they appear in ratio_ranges, and undefined values
+    (zero denominator or zero minimum) are NaN.
+
     Parameters:
     - x_train: Spectral intensity data (numpy array or DataFrame).
     - y_train: Labels corresponding to the data.
@@ -155,77 +159,22 @@ def calculate_spectral_features(x_train, y_train, wavelength_df, ratio_ranges):
           "Ratio 1": ("460-490", "515-540"), 
           "Ratio 2": ("550-680", "515-540")
       }
+    - plan (FeaturePlan): Optional feature plan (e.g. loaded from JSON); takes precedence over ratio_ranges.
 
     Returns:
     - feature_df: DataFrame with calculated spectral features and labels.
     """
-    
-    # Convert spectral data to handle NaN/Inf and scale to integers
-    x_train = np.nan_to_num(x_train * 1000, nan=0, posinf=0, neginf=0).astype(int)
-    
-    # Extract wavelength values
-    wavelengths = wavelength_df
+    if plan is None:
+        if ratio_ranges is None:
+            raise ValueError("Either ratio_ranges or plan must be provided.")
+        plan = FeaturePlan.from_ratio_ranges(ratio_ranges)
 
-    # Identify indices for each range
-    range_indices = {}
-    for key in set(val for pair in ratio_ranges.values() for val in pair):  # Get all unique ranges
-        start, end = map(int, key.split('-'))
-        range_indices[key] = np.where((wavelengths >= start) & (wavelengths <= end))[0]
-
-    # Initialize feature storage
-    features = {key: [] for key in ratio_ranges.keys()}  # Power ratios
-    additional_features = {
-        "AUC_1": [], "AUC_2": [], "AUC_3": [],  # AUC for three ranges
-        "Peak_to_Trough_1": [], "Peak_to_Trough_2": [], "Peak_to_Trough_3": [],  # Peak-to-Trough for three ranges
-        "STD_1": [], "STD_2": [], "STD_3": [],  # Standard deviation for three ranges
-        "Mean_Intensity_1": [], "Mean_Intensity_2": [], "Mean_Intensity_3": []  # Mean intensity for three ranges
-    }
-    labels = []
-
-    # Iterate through each sample in x_train
-    for i, sample in enumerate(x_train):
-        power_values = {}
-
-        # Compute power for each unique range
-        for key, indices in range_indices.items():
-            power_values[key] = np.abs(sample[indices]).sum()
-        
-        # Compute power ratios
-        for ratio_name, (num_range, denom_range) in ratio_ranges.items():
-            numerator = power_values[num_range]
-            denominator = power_values[denom_range]
-            ratio = np.round(numerator / denominator, 2) if denominator != 0 else None
-            features[ratio_name].append(ratio)
-
-        # Compute additional spectral features
-        selected_ranges = list(range_indices.keys())[:3]  # Take first 3 wavelength ranges for extra features
-        
-        for j, key in enumerate(selected_ranges):
-            indices = range_indices[key]
-            spectrum_segment = sample[indices]
-            
-            # AUC (Trapezoidal Integration)
-            auc_value = trapz(spectrum_segment, wavelengths[indices])
-            additional_features[f"AUC_{j+1}"].append(auc_value)
-
-            # Peak-to-Trough Ratio (Max/Min Intensity)
-            peak_to_trough = np.max(spectrum_segment) / np.min(spectrum_segment) if np.min(spectrum_segment) != 0 else None
-            additional_features[f"Peak_to_Trough_{j+1}"].append(peak_to_trough)
-
-            # Standard Deviation
-            std_dev = np.std(spectrum_segment)
-            additional_features[f"STD_{j+1}"].append(std_dev)
-
-            # Mean Intensity
-            mean_intensity = np.mean(spectrum_segment)
-            additional_features[f"Mean_Intensity_{j+1}"].append(mean_intensity)
-
-        labels.append(y_train.iloc[i])
+    # Extract wavelength values
+    wavelengths = np.asarray(wavelength_df, dtype=float).ravel()
 
-    # Create DataFrame with all extracted features
-    feature_df = pd.DataFrame(features)
-    feature_df = pd.concat([feature_df, pd.DataFrame(additional_features)], axis=1)
-    feature_df["Label"] = labels
+    # Compile once per wavelength grid and compute all features in one pass
+    feature_df = plan.execute(x_train, wavelengths)
+    feature_df["Label"] = list(y_train)
     
     return feature_df
 
@@ -0,0 +1,160 @@
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.neighbors import NearestNeighbors
+from imblearn.over_sampling import SMOTE
+from imblearn.combine import SMOTETomek
+from imblearn import FunctionSampler
+
+# Rebalancing strategies accepted by rebalance()
+STRATEGIES = ("smote", "smotetomek", "class_weight", "undersample", "none")
+
+
+def _neighbors(n_neighbors, fast, n_jobs):
+    # kd-tree index in the performance mode; "auto" lets sklearn pick (may fall back to brute force)
+    return NearestNeighbors(n_neighbors=n_neighbors, algorithm="kd_tree" if fast else "auto", n_jobs=n_jobs)
+
+
+def smote(X, y, k_neighbors=5, random_state=42, fast=True, n_jobs=-1):
+    """Oversamples every minority class to the majority count with SMOTE."""
+    sampler = SMOTE(random_state=random_state, k_neighbors=_neighbors(k_neighbors + 1, fast, n_jobs))
+    return sampler.fit_resample(X, y)
+
+
+def _nearest_other(nn, X, start, stop):
+    # Nearest neighbour of rows start:stop other than the row itself
+    idx = nn.kneighbors(X[start:stop], n_neighbors=2, return_distance=False)
+    rows = np.arange(start, stop)
+    # Duplicated points may return another row before the row itself
+    return np.where(idx[:, 0] == rows, idx[:, 1], idx[:, 0])
+
+
+def tomek_links(X, y, chunk_size=10000, n_jobs=-1):
+    """
+    Finds the samples that are part of a Tomek link.
+
+    A Tomek link is a pair of samples of different classes that are each other's
+    nearest neighbour. The 1-NN search runs on one kd-tree, queried in chunks of
+    chunk_size rows on parallel threads (the tree query releases the GIL).
+
+    Parameters:
+    - X (numpy array): Feature matrix.
+    - y (numpy array): Labels.
+    - chunk_size (int): Rows per query chunk.
+    - n_jobs (int): Number of threads (-1 uses all cores).
+
+    Returns:
+    - in_link (numpy array): Boolean mask of the samples that are part of a Tomek link.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    nn = NearestNeighbors(n_neighbors=2, algorithm="kd_tree").fit(X)
+
+    starts = range(0, len(X), chunk_size)
+    chunks = Parallel(n_jobs=min(effective_n_jobs(n_jobs), len(starts)) or 1, prefer="threads")(
+        delayed(_nearest_other)(nn, X, start, min(start + chunk_size, len(X))) for start in starts)
+    nearest = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.intp)
+
+    # Mutual nearest neighbours of different classes
+    return (nearest[nearest] == np.arange(len(X))) & (y[nearest] != y)
+
+
+def stratified_undersample(X, y, random_state=42):
+    """Randomly undersamples every class to the size of the smallest class (row order is kept)."""
+    y_values = np.asarray(y)
+    classes, counts = np.unique(y_values, return_counts=True)
+    rng = np.random.default_rng(random_state)
+    keep = np.sort(np.concatenate([rng.choice(np.flatnonzero(y_values == cls), counts.min(), replace=False) for cls in classes]))
+    return _take(X, keep), _take(y, keep)
+
+
+def _take(values, rows):
+    return values.iloc[rows].reset_index(drop=True) if isinstance(values, (pd.DataFrame, pd.Series)) else np.asarray(values)[rows]
+
+
+def rebalance(X, y, strategy="smotetomek", random_state=42, k_neighbors=5, fast=True, n_jobs=-1, chunk_size=10000,
+              verbose=True):
+    """
+    Rebalances the training set with the selected strategy and prints the time of every stage.
+
+    - "smote": SMOTE oversampling of the minority classes.
+    - "smotetomek": SMOTE, then removal of both samples of every Tomek link.
+    - "class_weight": No resampling; pass class_weight="balanced" to train_models instead.
+    - "undersample": Random undersampling of every class to the smallest class.
+    - "none": Data is returned unchanged.
+
+    With fast=True the neighbour searches use kd-trees and the Tomek links are found
+    in parallel chunks (tomek_links), instead of imblearn's single-threaded search
+    over the full data set. fast=False runs imblearn's SMOTETomek as before.
+
+    Parameters:
+    - X (DataFrame or numpy array): Training features.
+    - y (Series or numpy array): Training labels.
+    - strategy (str): One of STRATEGIES.
+    - random_state (int): Seed of the sampling.
+    - k_neighbors (int): Neighbours used by SMOTE.
+    - fast (bool): Performance mode (kd-tree neighbours, chunked parallel Tomek links).
+    - n_jobs (int): Threads for the neighbour searches.
+    - chunk_size (int): Rows per Tomek query chunk.
+    - verbose (bool): Print the stage timings.
+
+    Returns:
+    - X_res, y_res: Rebalanced features and labels (same types as the input).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Invalid strategy! Choose one of {STRATEGIES}.")
+
+    start = time.time()
+    n_rows = len(X)
+    if strategy in ("none", "class_weight"):
+        X_res, y_res = X, y
+    elif strategy == "undersample":
+        X_res, y_res = stratified_undersample(X, y, random_state=random_state)
+        _log(verbose, f"[Rebalance] Undersampling: {time.time() - start:.2f}s ({n_rows} -> {len(X_res)} rows)")
+    elif strategy == "smotetomek" and not fast:
+        X_res, y_res = SMOTETomek(random_state=random_state).fit_resample(X, y)
+        _log(verbose, f"[Rebalance] SMOTETomek (imblearn): {time.time() - start:.2f}s ({n_rows} -> {len(X_res)} rows)")
+    else:
+        X_res, y_res = smote(X, y, k_neighbors=k_neighbors, random_state=random_state, fast=fast, n_jobs=n_jobs)
+        _log(verbose, f"[Rebalance] SMOTE: {time.time() - start:.2f}s ({n_rows} -> {len(X_res)} rows)")
+
+        if strategy == "smotetomek":
+            stage_start = time.time()
+            keep = np.flatnonzero(~tomek_links(X_res, y_res, chunk_size=chunk_size, n_jobs=n_jobs))
+            n_smote = len(X_res)
+            X_res, y_res = _take(X_res, keep), _take(y_res, keep)
+            _log(verbose, f"[Rebalance] Tomek links: {time.time() - stage_start:.2f}s ({n_smote} -> {len(X_res)} rows)")
+
+    _log(verbose, f"[Rebalance] {strategy}: {time.time() - start:.2f}s total")
+    return X_res, y_res
+
+
+def _log(verbose, message):
+    if verbose:
+        print(message)
+
+
+def make_sampler(strategy="smotetomek", random_state=42, k_neighbors=5, fast=True, n_jobs=-1, chunk_size=10000):
+    """
+    Wraps rebalance() as an imblearn sampler, so it can be the first step of a Pipeline.
+
+    In a pipeline the rebalancing is fitted on the training rows of every CV fold only;
+    the validation rows stay original, and grouped folds (SplitManager.cv_folds) can be
+    passed to train_models on the un-resampled data.
+
+    Parameters:
+    - strategy (str): One of STRATEGIES.
+    - random_state, k_neighbors, fast, n_jobs, chunk_size: See rebalance().
+
+    Returns:
+    - sampler (FunctionSampler), or None for "none" and "class_weight" (nothing to resample).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Invalid strategy! Choose one of {STRATEGIES}.")
+    if strategy in ("none", "class_weight"):
+        return None
+    return FunctionSampler(func=rebalance, validate=False, kw_args={
+        "strategy": strategy, "random_state": random_state, "k_neighbors": k_neighbors, "fast": fast,
+        "n_jobs": n_jobs, "chunk_size": chunk_size, "verbose": False,
+    })
@@ -4,8 +4,67 @@ from scipy.stats import f_oneway
 
 
 import numpy as np
+from scipy import stats
 from scipy.stats import f_oneway
 
+
+def f_oneway_columns(xtrain, ytrain, labels=None, chunk_size=None):
+    """
+    One-way ANOVA of every column at once; same F statistics and p-values as calling
+    scipy.stats.f_oneway per column.
+
+    Group sums and sums of squares of all columns are computed with matrix products
+    (data centered per column for numerical stability, as f_oneway does).
+
+    Parameters:
+        xtrain (np.array): Intensity data (samples × wavelengths); may be a np.memmap.
+        ytrain (np.array): Group label of every sample.
+        labels (list): Groups to compare (default: all unique labels). Samples of other groups are ignored.
+        chunk_size (int): Number of columns processed at once (default: all), for wide or out-of-core data.
+
+    Returns:
+        f_stats (np.array): F statistic of every column.
+        p_values (np.array): P-value of every column.
+    """
+    if hasattr(xtrain, 'values'):
+        xtrain = xtrain.values
+    ytrain = np.asarray(ytrain.values if hasattr(ytrain, 'values') else ytrain)
+    labels = np.unique(ytrain) if labels is None else np.asarray(labels)
+
+    # One-hot group membership (groups × samples) of the samples taking part in the test
+    membership = (ytrain[np.newaxis, :] == labels[:, np.newaxis])
+    rows = np.flatnonzero(membership.any(axis=0))
+    membership = membership[:, rows].astype(np.float64)
+    group_sizes = membership.sum(axis=1)
+    n_samples, n_groups = len(rows), len(labels)
+    dfbn, dfwn = n_groups - 1, n_samples - n_groups
+
+    n_cols = xtrain.shape[1]
+    chunk_size = chunk_size or n_cols
+    f_stats = np.empty(n_cols)
+    for first in range(0, n_cols, chunk_size):
+        x = np.asarray(xtrain[rows, first:first + chunk_size], dtype=np.float64)
+        x = x - x.mean(axis=0)
+
+        group_sums = membership @ x
+        sstot = (x * x).sum(axis=0)
+        ssbn = (group_sums ** 2 / group_sizes[:, np.newaxis]).sum(axis=0) - x.sum(axis=0) ** 2 / n_samples
+        sswn = sstot - ssbn
+        with np.errstate(invalid="ignore", divide="ignore"):
+            f_chunk = (ssbn / dfbn) / (sswn / dfwn)
+
+        # As in f_oneway: if every group is constant, F is NaN when all values are equal
+        # and +inf otherwise (sswn is only rounding noise there)
+        within_constant = np.ones(x.shape[1], dtype=bool)
+        for group in membership.astype(bool):
+            values = x[group]
+            within_constant &= values.max(axis=0) == values.min(axis=0)
+        all_equal = x.max(axis=0) == x.min(axis=0)
+        f_stats[first:first + chunk_size] = np.where(within_constant, np.where(all_equal, np.nan, np.inf), f_chunk)
+
+    return f_stats, stats.f.sf(f_stats, dfbn, dfwn)
+
+
 def anova_significant_peaks(xtrain, ytrain, wavelength_df, alpha=0.05):
 
 
@@ -15,12 +74,7 @@ def anova_significant_peaks(xtrain, ytrain, wavelength_df, alpha=0.05):
         ytrain = ytrain.values
     if hasattr(wavelength_df, 'values'):
         wavelength_df = wavelength_df.values.flatten() 
-    p_values = []
-    for wavelength in range(xtrain.shape[1]):
-        tissue_intensities = xtrain[ytrain == 'Tissue', wavelength]
-        non_tissue_intensities = xtrain[ytrain == 'Non-Tissue', wavelength]
-        f_stat, p_value = f_oneway(tissue_intensities, non_tissue_intensities)
-        p_values.append(p_value)
+    _, p_values = f_oneway_columns(xtrain, ytrain, labels=['Tissue', 'Non-Tissue'])
 
 
    # significant_peaks = np.where(np.array(p_values) < alpha)[0]
@@ -108,15 +162,7 @@ def find_significant_wavelengths(xtrain, ytrain, wavelengths, alpha=0.05):
         ytrain = ytrain.values
     if hasattr(wavelengths, 'values'):
         wavelengths = wavelengths.values.flatten() 
-    p_values = []
-    unique_labels = np.unique(ytrain)
-    
-    for i in range(xtrain.shape[1]):  # Loop over all wavelengths
-        groups = [xtrain[ytrain == label, i] for label in unique_labels]
-        f_stat, p_value = f_oneway(*groups)
-        p_values.append(p_value)
-
-    p_values = np.array(p_values)
+    _, p_values = f_oneway_columns(xtrain, ytrain)  # All wavelengths at once
     significant_wavelengths = wavelengths[p_values < alpha]  # Select wavelengths with p < alpha
     return significant_wavelengths, p_values
 
@@ -141,15 +187,8 @@ def find_roi_anova(xtrain, ytrain, wavelengths, alpha=0.05, min_gap=5):
         ytrain = ytrain.values
     if hasattr(wavelengths, 'values'):
         wavelengths = wavelengths.values.flatten() 
-    # Convert ytrain to NumPy array if it's a pandas Series
-    ytrain = np.array(ytrain)
-    unique_labels = np.unique(ytrain)
-
-    # Perform ANOVA for each wavelength
-    p_values = np.array([
-        f_oneway(*[xtrain[ytrain == label, i] for label in unique_labels])[1]
-        for i in range(xtrain.shape[1])
-    ])
+    # Perform ANOVA for all wavelengths at once
+    _, p_values = f_oneway_columns(xtrain, ytrain)
     
     # Identify significant wavelengths
     significant_wavelengths = wavelengths[p_values < alpha]
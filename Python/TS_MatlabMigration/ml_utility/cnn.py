@@ -46,6 +46,76 @@ def preprocess_labels(Y_train):
     Y_train_numeric = np.where(Y_train == 'Tissue', 1, 0)
     return Y_train_numeric
 
+def add_wavelength_channel(spectra, wavelengths):
+    """
+    Adds the constant wavelength channel to a batch of spectra.
+
+    Parameters:
+        spectra: Intensities of one batch (batch x wavelengths).
+        wavelengths (np.array): Wavelength values (wavelengths,).
+
+    Returns:
+        tf.Tensor: Model input (batch x wavelengths x 2): intensity + wavelength.
+    """
+    spectra = tf.cast(spectra, tf.float32)
+    wavelength_channel = tf.broadcast_to(tf.constant(np.asarray(wavelengths, dtype=np.float32).ravel())[tf.newaxis, :], tf.shape(spectra))
+    return tf.stack([spectra, wavelength_channel], axis=-1)
+
+def make_spectral_dataset(X, y, wavelengths, batch_size=32, shuffle=False, seed=None, shuffle_buffer=10000):
+    """
+    tf.data pipeline for in-memory spectra. The wavelength channel is added per batch
+    instead of being tiled for every sample, and batches are prefetched.
+
+    Parameters:
+        X (np.array or DataFrame): Intensities (samples x wavelengths).
+        y (np.array): Labels (0 or 1).
+        wavelengths (np.array): Wavelength values.
+        batch_size (int): Batch size.
+        shuffle (bool): Reshuffle the samples every epoch (like model.fit(shuffle=True)).
+        seed (int): Shuffle seed.
+        shuffle_buffer (int): Shuffle buffer size.
+
+    Returns:
+        tf.data.Dataset: Batches of (inputs, labels).
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((np.asarray(X, dtype=np.float32), np.asarray(y, dtype=np.int32)))
+    if shuffle:
+        dataset = dataset.shuffle(min(shuffle_buffer, len(X)), seed=seed, reshuffle_each_iteration=True)
+    return _finish_dataset(dataset.batch(batch_size), wavelengths)
+
+def make_generator_dataset(batches, wavelengths, batch_size=32, shuffle_buffer=0, seed=None):
+    """
+    tf.data pipeline for spectra streamed from disk (e.g. iter_spectra_batches on the
+    spectral store), so training memory does not depend on the dataset size.
+
+    Parameters:
+        batches (callable): Returns a new iterator of (spectra, labels) arrays for every epoch.
+        wavelengths (np.array): Wavelength values.
+        batch_size (int): Batch size fed to the model.
+        shuffle_buffer (int): Size of the sample shuffle buffer (0 keeps the stored order).
+        seed (int): Shuffle seed.
+
+    Returns:
+        tf.data.Dataset: Batches of (inputs, labels).
+    """
+    n_wavelengths = len(np.asarray(wavelengths).ravel())
+    dataset = tf.data.Dataset.from_generator(
+        batches,
+        output_signature=(tf.TensorSpec(shape=(None, n_wavelengths), dtype=tf.float32),
+                          tf.TensorSpec(shape=(None,), dtype=tf.int32)),
+    )
+    # Re-batch the (arbitrarily sized) stored batches to the training batch size
+    dataset = dataset.unbatch()
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return _finish_dataset(dataset.batch(batch_size), wavelengths)
+
+def _finish_dataset(dataset, wavelengths):
+    # Build the 2-channel input on parallel CPU threads and keep batches ready ahead of the model
+    dataset = dataset.map(lambda X_batch, y_batch: (add_wavelength_channel(X_batch, wavelengths), y_batch),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
 def visualize_filters(model):
     # Visualize filters of the first convolutional layer (1D convolution)
     filters = model.layers[0].get_weights()[0]
@@ -123,19 +193,36 @@ def display_grad_cam(X, heatmap, wavelengths):
     plt.title('Grad-CAM Visualization for Wavelength Regions')
     plt.show()
     
-def compute_saliency_map(model, X, y):
-    X_tensor = tf.convert_to_tensor(X, dtype=tf.float32)
-    y_tensor = tf.convert_to_tensor(y, dtype=tf.int32)
-    y_tensor = tf.reshape(y_tensor, (-1, 1))  # Reshape to (batch_size, 1) if it's not
-    with tf.GradientTape() as tape:
-        tape.watch(X_tensor)
-        predictions = model(X_tensor)
-        print(predictions.shape)
-        loss = tf.keras.losses.binary_crossentropy(y_tensor, predictions)
+def compute_saliency_map(model, X, y, batch_size=None, wavelengths=None):
+    """
+    Saliency (max absolute input gradient of the loss per wavelength) for every sample.
+
+    Parameters:
+        model (tf.keras.Model): Trained Keras model.
+        X (np.array): Input dataset (samples x wavelengths x channels).
+        y (np.array): Labels (0 or 1).
+        batch_size (int): Samples per gradient tape (default: all at once).
+        wavelengths (np.array): If given, X holds intensities only (samples x wavelengths) and the
+            wavelength channel is added per batch.
 
-    gradients = tape.gradient(loss, X_tensor)
-    saliency_map = tf.reduce_max(tf.abs(gradients), axis=-1)  # Get max gradient across the spectrum
-    return saliency_map.numpy()
+    Returns:
+        np.array: Saliency map (samples x wavelengths).
+    """
+    batch_size = batch_size or len(X)
+    saliency_maps = []
+    for start in range(0, len(X), batch_size):
+        X_batch = np.asarray(X[start:start + batch_size], dtype=np.float32)
+        X_tensor = add_wavelength_channel(X_batch, wavelengths) if wavelengths is not None else tf.convert_to_tensor(X_batch)
+        y_tensor = tf.convert_to_tensor(y[start:start + batch_size], dtype=tf.int32)
+        y_tensor = tf.reshape(y_tensor, (-1, 1))  # Reshape to (batch_size, 1) if it's not
+        with tf.GradientTape() as tape:
+            tape.watch(X_tensor)
+            predictions = model(X_tensor, training=False)
+            loss = tf.keras.losses.binary_crossentropy(y_tensor, predictions)
+
+        gradients = tape.gradient(loss, X_tensor)
+        saliency_maps.append(tf.reduce_max(tf.abs(gradients), axis=-1).numpy())  # Max gradient across channels
+    return np.concatenate(saliency_maps, axis=0)
 
 # def plot_saliency_map(X, saliency_map, wavelengths):
 #     # Debug prints to check the shapes
@@ -237,46 +324,94 @@ def plot_saliency_map(saliency_map, wavelengths, y_train_labels, threshold_perce
     
 
 
-def compute_grad_cam(model, X_input, target_class):
+def build_grad_model(model, layer_name='conv1d_1'):
     """
-    Compute Grad-CAM heatmap for a given sample.
+    Builds the model that returns the activations of the given convolutional layer
+    together with the predictions. Build it once and reuse it for all Grad-CAM batches.
 
     Parameters:
         model (tf.keras.Model): Trained Keras model.
-        X_input (np.array): Single sample input.
-        target_class (int): Class index (0 for Non-Tissue, 1 for Tissue).
+        layer_name (str): Convolutional layer used for Grad-CAM (check `model.summary()`).
 
     Returns:
-        np.array: Grad-CAM heatmap.
+        tf.keras.Model: Gradient model.
     """
-    # Get the last convolutional layer
-    model(X_input)  # Ensure model is called at least once
-    last_conv_layer = model.get_layer('conv1d_1')  # Check layer name from `model.summary()`
-    
-    grad_model = tf.keras.models.Model(
-        [model.input], [last_conv_layer.output, model.output]
-    )
+    last_conv_layer = model.get_layer(layer_name)
+    return tf.keras.models.Model([model.input], [last_conv_layer.output, model.output])
 
-    with tf.GradientTape() as tape:
-        conv_output, predictions = grad_model(X_input)
-        loss = predictions[:, target_class]
 
-    grads = tape.gradient(loss, conv_output)
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1))
+def compute_grad_cam_batch(model, X_data, target_classes, layer_name='conv1d_1', batch_size=256, grad_model=None, wavelengths=None):
+    """
+    Compute Grad-CAM heatmaps for many samples, one gradient tape per batch.
 
-    conv_output = conv_output.numpy()
-    pooled_grads = pooled_grads.numpy()
+    The gradients of each sample's class score are pooled over the positions of that
+    sample only, so every heatmap equals the one compute_grad_cam gives for the sample alone.
+    For a single sigmoid output the score is p for class 1 and 1 - p for class 0.
+
+    Parameters:
+        model (tf.keras.Model): Trained Keras model.
+        X_data (np.array): Input dataset (samples x wavelengths x channels).
+        target_classes (np.array): Class index of every sample (0 for Non-Tissue, 1 for Tissue).
+        layer_name (str): Convolutional layer used for Grad-CAM.
+        batch_size (int): Samples per gradient tape.
+        grad_model (tf.keras.Model): Gradient model from build_grad_model (built here if None).
+        wavelengths (np.array): If given, X_data holds intensities only and the wavelength channel is added per batch.
 
-    for i in range(conv_output.shape[-1]):
-        conv_output[0, :, i] *= pooled_grads[i]
+    Returns:
+        np.array: Grad-CAM heatmaps (samples x conv positions), each normalized to a maximum of 1.
+    """
+    def to_input(X_batch):
+        X_batch = np.asarray(X_batch, dtype=np.float32)
+        return add_wavelength_channel(X_batch, wavelengths) if wavelengths is not None else tf.convert_to_tensor(X_batch)
+
+    if grad_model is None:
+        model(to_input(X_data[:1]))  # Ensure model is called at least once
+        grad_model = build_grad_model(model, layer_name)
+
+    @tf.function(reduce_retracing=True)
+    def heatmap_step(X_batch, targets):
+        with tf.GradientTape() as tape:
+            conv_output, predictions = grad_model(X_batch, training=False)
+            if predictions.shape[-1] == 1:
+                probability = predictions[:, 0]
+                score = tf.where(targets == 1, probability, 1.0 - probability)
+            else:
+                score = tf.gather(predictions, targets, axis=1, batch_dims=1)
+
+        grads = tape.gradient(score, conv_output)
+        pooled_grads = tf.reduce_mean(grads, axis=1, keepdims=True)   # Per sample and channel
+        return tf.reduce_mean(conv_output * pooled_grads, axis=-1)   # Weight all feature maps at once
+
+    target_classes = np.asarray(target_classes, dtype=np.int32).ravel()
+    heatmaps = []
+    for start in range(0, len(X_data), batch_size):
+        X_batch = to_input(X_data[start:start + batch_size])
+        heatmaps.append(heatmap_step(X_batch, tf.convert_to_tensor(target_classes[start:start + batch_size])).numpy())
+
+    heatmaps = np.maximum(np.concatenate(heatmaps, axis=0), 0)  # ReLU
+    max_values = heatmaps.max(axis=1, keepdims=True)
+    return np.divide(heatmaps, max_values, out=np.zeros_like(heatmaps), where=max_values > 0)  # Normalize
+
+
+def compute_grad_cam(model, X_input, target_class, layer_name='conv1d_1'):
+    """
+    Compute Grad-CAM heatmap for a given sample.
 
-    heatmap = np.mean(conv_output, axis=-1)
-    heatmap = np.maximum(heatmap, 0)  # ReLU
-    heatmap /= np.max(heatmap)  # Normalize
+    Parameters:
+        model (tf.keras.Model): Trained Keras model.
+        X_input (np.array): Single sample input.
+        target_class (int): Class index (0 for Non-Tissue, 1 for Tissue).
+        layer_name (str): Convolutional layer used for Grad-CAM.
 
-    return heatmap
+    Returns:
+        np.array: Grad-CAM heatmap.
+    """
+    X_input = np.asarray(X_input)
+    if X_input.ndim == 2:
+        X_input = X_input[np.newaxis]  # Add the batch dimension
+    return compute_grad_cam_batch(model, X_input, [target_class], layer_name=layer_name, batch_size=1)[0]
 
-def compute_grad_cam_for_all(model, X_data, Y_labels):
+def compute_grad_cam_for_all(model, X_data, Y_labels, layer_name='conv1d_1', batch_size=256, wavelengths=None):
     """
     Compute Grad-CAM for all samples and separate by Tissue and Non-Tissue.
 
@@ -284,25 +419,17 @@ def compute_grad_cam_for_all(model, X_data, Y_labels):
         model (tf.keras.Model): Trained Keras model.
         X_data (np.array): Input dataset.
         Y_labels (np.array): Corresponding labels (0 or 1).
+        layer_name (str): Convolutional layer used for Grad-CAM.
+        batch_size (int): Samples per gradient tape.
+        wavelengths (np.array): If given, X_data holds intensities only and the wavelength channel is added per batch.
 
     Returns:
         dict: Dictionary containing Grad-CAM heatmaps for Tissue and Non-Tissue.
     """
-    tissue_grad_cams = []
-    non_tissue_grad_cams = []
-    
-    for i in range(len(X_data)):
-        X_sample = X_data[i]
-        target_class = Y_labels[i]
-        
-        grad_cam = compute_grad_cam(model, X_sample, target_class)
-        
-        if target_class == 1:
-            tissue_grad_cams.append(grad_cam)
-        else:
-            non_tissue_grad_cams.append(grad_cam)
-
-    return {"tissue": tissue_grad_cams, "non_tissue": non_tissue_grad_cams}
+    Y_labels = np.asarray(Y_labels).ravel()
+    heatmaps = compute_grad_cam_batch(model, X_data, Y_labels, layer_name=layer_name, batch_size=batch_size, wavelengths=wavelengths)
+
+    return {"tissue": list(heatmaps[Y_labels == 1]), "non_tissue": list(heatmaps[Y_labels != 1])}
 
 def plot_grad_cam(heatmap, wavelengths, title="Grad-CAM"):
     """
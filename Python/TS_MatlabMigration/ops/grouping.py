@@ -0,0 +1,123 @@
+import numpy as np
+
+
+def group_codes(*keys):
+    """
+    Factorizes one or more key columns into dense integer group codes.
+
+    Groups are numbered in sorted key order, which matches
+    pandas.DataFrame.groupby(...).ngroup() with the default sort=True.
+
+    Parameters:
+    - keys: One or more 1D arrays (or Series) of equal length.
+
+    Returns:
+    - codes (numpy array): Group code for every row (0 .. n_groups-1).
+    - unique_keys (numpy array): Key values of each group (n_groups x n_keys).
+    """
+    if not keys:
+        raise ValueError("At least one key column is required.")
+
+    columns = [np.asarray(key) for key in keys]
+    n_rows = len(columns[0])
+    if any(len(column) != n_rows for column in columns):
+        raise ValueError("All key columns must have the same length.")
+
+    # Lexicographic sort on all keys (last key passed to lexsort is the primary one)
+    order = np.lexsort(columns[::-1])
+
+    # A new group starts wherever any key changes between consecutive sorted rows
+    is_new_group = np.zeros(n_rows, dtype=bool)
+    if n_rows:
+        is_new_group[0] = True
+    for column in columns:
+        sorted_column = column[order]
+        is_new_group[1:] |= sorted_column[1:] != sorted_column[:-1]
+
+    codes = np.empty(n_rows, dtype=np.intp)
+    codes[order] = np.cumsum(is_new_group) - 1
+
+    first_rows = order[is_new_group]
+    unique_keys = np.column_stack([column[first_rows] for column in columns])
+
+    return codes, unique_keys
+
+
+def grouped_reduce(values, codes, n_groups=None, how="nanmean"):
+    """
+    Reduces the rows of a matrix per group with a single sort plus np.add.reduceat pass.
+
+    Parameters:
+    - values (numpy array): Data matrix (rows x features) or 1D vector.
+    - codes (numpy array): Integer group code for every row, e.g. from group_codes().
+    - n_groups (int): Number of groups. Defaults to codes.max() + 1.
+    - how (str): "sum", "mean", "nansum", "nanmean" or "count" (non-NaN count per group).
+
+    Returns:
+    - reduced (numpy array): One row per group (n_groups x features). Groups without
+      rows are NaN for the means and 0 for the sums/counts.
+    """
+    values = np.asarray(values)
+    codes = np.asarray(codes)
+    squeeze = values.ndim == 1
+    if squeeze:
+        values = values[:, np.newaxis]
+    if len(codes) != values.shape[0]:
+        raise ValueError("codes must have one entry per row of values.")
+    if how not in ("sum", "mean", "nansum", "nanmean", "count"):
+        raise ValueError("Invalid how! Choose 'sum', 'mean', 'nansum', 'nanmean' or 'count'.")
+
+    if n_groups is None:
+        n_groups = int(codes.max()) + 1 if len(codes) else 0
+
+    # Sort rows by group so every group is a contiguous block
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    sorted_values = values[order]
+
+    # First row of every non-empty group in the sorted matrix
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(codes) else np.array([], dtype=np.intp)
+    present = sorted_codes[starts]
+
+    skipna = how in ("nansum", "nanmean", "count")
+    if skipna:
+        valid = ~np.isnan(sorted_values) if np.issubdtype(sorted_values.dtype, np.floating) else np.ones(sorted_values.shape, dtype=bool)
+        sorted_values = np.where(valid, sorted_values, 0)
+        counts = np.add.reduceat(valid.astype(np.intp), starts, axis=0) if len(starts) else np.zeros((0, values.shape[1]), dtype=np.intp)
+    else:
+        counts = np.diff(np.r_[starts, len(codes)])[:, np.newaxis]
+
+    out_dtype = np.result_type(values.dtype, np.float64) if how in ("mean", "nanmean") else values.dtype
+    if how == "count":
+        reduced = np.zeros((n_groups, values.shape[1]), dtype=np.intp)
+        reduced[present] = counts
+    else:
+        sums = np.add.reduceat(sorted_values, starts, axis=0) if len(starts) else np.zeros((0, values.shape[1]), dtype=values.dtype)
+        if how in ("sum", "nansum"):
+            reduced = np.zeros((n_groups, values.shape[1]), dtype=out_dtype)
+            reduced[present] = sums
+        else:
+            reduced = np.full((n_groups, values.shape[1]), np.nan, dtype=out_dtype)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                # All-NaN columns of a group end up as 0 / 0 -> NaN, as with np.nanmean
+                reduced[present] = sums / counts
+
+    return reduced[:, 0] if squeeze else reduced
+
+
+def grouped_mean(values, *keys, skipna=True):
+    """
+    Averages the rows of a matrix for every unique combination of the key columns.
+
+    Parameters:
+    - values (numpy array): Data matrix (rows x features).
+    - keys: One or more key columns (e.g. Rotation and Position).
+    - skipna (bool): Ignore NaN values like np.nanmean (default: True).
+
+    Returns:
+    - unique_keys (numpy array): Key values of each group in sorted order (n_groups x n_keys).
+    - means (numpy array): Mean row of each group (n_groups x features).
+    """
+    codes, unique_keys = group_codes(*keys)
+    means = grouped_reduce(values, codes, n_groups=len(unique_keys), how="nanmean" if skipna else "mean")
+    return unique_keys, means
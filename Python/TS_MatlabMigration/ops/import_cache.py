@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# Bump when the processed per-file layout changes so stale cache entries are ignored
+CACHE_VERSION = 1
+
+
+def file_fingerprint(fn):
+    """
+    Cheap fingerprint of a file from its absolute path, size and modification time.
+
+    Parameters:
+    - fn (str): Path to the file.
+
+    Returns:
+    - fingerprint (str): Changes whenever the file is replaced or modified.
+    """
+    stat = os.stat(fn)
+    return f"{os.path.abspath(fn)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def array_digest(arr):
+    """Returns a SHA-1 hex digest of an array's shape, dtype and contents."""
+    arr = np.ascontiguousarray(arr)
+    digest = hashlib.sha1(f"{arr.shape}|{arr.dtype.str}".encode())
+    digest.update(arr.tobytes())
+    return digest.hexdigest()
+
+
+def cache_key(fn, **params):
+    """
+    Builds the cache key of a processed file from its fingerprint and the processing parameters.
+
+    Parameters:
+    - fn (str): Path to the source file.
+    - params: Processing parameters (filter type, filter settings, dark reference digest, ...).
+
+    Returns:
+    - key (str): Hex digest used as the cache file name.
+    """
+    payload = json.dumps({"file": file_fingerprint(fn), "version": CACHE_VERSION, **params}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _to_builtin(value):
+    # numpy scalars are not JSON serializable
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def load_cached_file(cache_dir, key):
+    """
+    Loads a processed file from the cache.
+
+    Parameters:
+    - cache_dir (str): Cache directory.
+    - key (str): Cache key from cache_key().
+
+    Returns:
+    - result (dict or None): Dictionary with spectra, rotation, position and metadata, or None on a cache miss.
+    """
+    path = os.path.join(cache_dir, f"{key}.npz")
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as cached:
+            return {
+                "spectra": cached["spectra"],
+                "rotation": cached["rotation"],
+                "position": cached["position"],
+                "metadata": json.loads(str(cached["metadata"])),
+            }
+    except (OSError, ValueError, KeyError) as e:
+        # Treat unreadable or partial entries as a miss; they are rewritten after reprocessing
+        print(f"[Warning] Ignoring corrupt import cache entry {path}: {e}")
+        return None
+
+
+def save_cached_file(cache_dir, key, result):
+    """
+    Stores a processed file in the cache as an uncompressed .npz archive.
+
+    The archive is written to a temporary file first and moved into place, so
+    concurrent workers never see a partially written entry.
+
+    Parameters:
+    - cache_dir (str): Cache directory (created if missing).
+    - key (str): Cache key from cache_key().
+    - result (dict): Dictionary with spectra, rotation, position and metadata.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.npz")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    metadata = {name: _to_builtin(value) for name, value in result["metadata"].items()}
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            spectra=result["spectra"],
+            rotation=result["rotation"],
+            position=result["position"],
+            metadata=np.array(json.dumps(metadata)),
+        )
+    os.replace(tmp_path, path)
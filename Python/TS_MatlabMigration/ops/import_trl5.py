@@ -2,11 +2,93 @@ import pandas as pd
 import numpy as np
 from scipy.interpolate import interp1d 
 from ops.movmean import moving_mean
+from ops.grouping import grouped_mean
+from ops.import_cache import array_digest, cache_key, load_cached_file, save_cached_file
 import os
+import io
 from scipy.signal import firwin, lfilter
+from joblib import Parallel, delayed
 
 
 class Import:
+
+    # Standard wavelength grid all spectra are interpolated to
+    WAVELENGTH_RANGE = np.linspace(400, 940, 2048)
+
+    # Output column -> attribute in the metadata footer of the export
+    METADATA_FIELDS = {
+        'LightSource': "Light Source Type",
+        'ProbeSize': "Fiber Type",
+        'AimingBeam': "Aiming Beam Status",
+        'TargetType': "Target Type",
+        'TargetNumber': "Target Number",
+        'IntegrationTimeUsed': "Integration Time Used (mS)",
+        'SpectrometerUsed': "Spec Used",
+    }
+
+    # Averaged dark references keyed by (path, modification time)
+    _dark_reference_cache = {}
+
+    @staticmethod
+    def load_dark_reference(darkReference):
+        """
+        Reads the dark reference workbook and averages its 100 samples per wavelength.
+
+        The average is cached per file and modification time, so repeated imports
+        with the same dark reference do not reread the Excel workbook.
+
+        Parameters:
+        - darkReference (str): Path to the dark reference .xlsx file.
+
+        Returns:
+        - dark_reference_avg (numpy array): Averaged dark reference as a row vector (1 x wavelengths).
+        """
+        key = (os.path.abspath(darkReference), os.path.getmtime(darkReference))
+        if key not in Import._dark_reference_cache:
+            # Columns B to CW (rows 7-2074) contain the 100 dark reference samples
+            dark_intensities = pd.read_excel(darkReference, sheet_name=0, usecols="B:CW", skiprows=6, nrows=2074-7+1, header=None)
+
+            # Compute the mean for each row (wavelength)
+            dark_reference_avg = np.mean(dark_intensities.values, axis=1)
+            Import._dark_reference_cache[key] = dark_reference_avg[np.newaxis, :]
+
+        return Import._dark_reference_cache[key]
+
+    @staticmethod
+    def read_export(fn, spectral_skiprows=4, spectral_nrows=2070, spectral_ncols=151, meta_skiprows=2080, meta_nrows=58):
+        """
+        Reads the spectral block and the metadata footer of a TRL5 CSV export from one buffered read.
+
+        Parameters:
+        - fn (str): Path to the CSV export.
+        - spectral_skiprows (int): Lines before the spectral block (Rotation, Position and intensity rows).
+        - spectral_nrows (int): Number of rows in the spectral block.
+        - spectral_ncols (int): Number of columns in the spectral block (wavelength + samples).
+        - meta_skiprows (int): Lines before the metadata footer.
+        - meta_nrows (int): Number of metadata rows.
+
+        Returns:
+        - data (pd.DataFrame): Raw spectral block without header.
+        - metadata_dict (dict): Metadata attribute -> value.
+        """
+        with open(fn, "r") as f:
+            text = f.read()
+
+        def line_offset(n_lines, start=0):
+            # Character offset of the line that follows n_lines newlines after start
+            offset = start
+            for _ in range(n_lines):
+                offset = text.index("\n", offset) + 1
+            return offset
+
+        spectral_start = line_offset(spectral_skiprows)
+        data = pd.read_csv(io.StringIO(text[spectral_start:]), usecols=range(spectral_ncols), nrows=spectral_nrows, header=None)
+
+        meta_start = line_offset(meta_skiprows - spectral_skiprows, spectral_start)
+        meta_data = pd.read_csv(io.StringIO(text[meta_start:]), header=None, nrows=meta_nrows, usecols=[0, 1], names=["Attribute", "Value"])
+        metadata_dict = meta_data.set_index('Attribute')['Value'].to_dict()
+
+        return data, metadata_dict
     
     @staticmethod
     def normalize_spectra(interpolated_intensity, wavelength):
@@ -50,7 +132,141 @@ class Import:
         return filtered_data
     
     @staticmethod
-    def read_csv(ds_location, darkReference, options, filter_type="movemean", sample_rate=None, cutoff_freq=None, numtaps=None):
+    def process_file(fn, dark_reference_avg, filter_type="movemean", sample_rate=None, cutoff_freq=None, numtaps=None):
+        """
+        Processes a single TRL5 CSV export: dark reference subtraction, smoothing,
+        (Rotation, Position) averaging and interpolation to the 400-940 nm grid.
+
+        Parameters:
+        - fn (str): Path to the CSV export.
+        - dark_reference_avg (numpy array): Averaged dark reference (1 x wavelengths).
+        - filter_type (str): "movemean" or "fir".
+        - sample_rate, cutoff_freq, numtaps: FIR filter settings.
+
+        Returns:
+        - result (dict): spectra (groups x 2048), rotation, position and metadata of the file.
+        """
+        # Read spectroscopy data and metadata footer from a single pass over the file
+        data, metadata_dict = Import.read_export(fn)
+        #data.iloc[:2, :] = data.iloc[:2, :].astype(int)
+        # Extract wavelength values and consider only the first 2048 readings for uniformity
+        wavelength = data.iloc[2:, 0].to_frame().T.reset_index(drop=True)
+        wavelength = wavelength.iloc[:, :2048]
+
+        # Remove wavelength column from data
+        data = data.iloc[:, 1:].T.reset_index(drop=True)
+
+        # Extract rotation values
+        Rotation = data.iloc[:, 0].round().astype(int)
+        data.drop(data.columns[0], axis=1, inplace=True)  # Remove first column
+
+        # Extract position values
+        position = data.iloc[:, 0].astype(int)
+        data.drop(data.columns[0], axis=1, inplace=True)  # Remove first column
+
+        # Consider only the first 2048 readings
+        data = data.iloc[:, :2048]
+
+        # Subtract dark reference from each row in data
+        # Ensure dark_reference_avg is the correct shape
+        dark_reference_avg_trimmed = dark_reference_avg[:, :2048]  # Trim to 2048 columns
+
+        # Subtract row-wise
+        data_subtracted = data.to_numpy() - dark_reference_avg_trimmed
+
+        if filter_type == "movemean":
+            # Moving mean settings
+            window_size = 35  # Define window size (3-point moving average)
+            intensities_smooth = moving_mean(data_subtracted, window_size)
+
+        elif filter_type == "fir":
+            intensities_smooth = Import.apply_fir_filter(data_subtracted, sample_rate, cutoff_freq, numtaps)
+
+        else:
+            raise ValueError("Invalid filter_type! Choose 'movemean' or 'fir'.")
+
+        # Average the spectra of every (Rotation, Position) pair in one grouped pass
+        unique_pairs, avg_spectra = grouped_mean(intensities_smooth, Rotation.to_numpy(), position.to_numpy())
+
+        # Extract wavelength and intensity
+        wavelength = wavelength.iloc[0, :].to_numpy()  # Extract the numeric array from the DataFrame
+        intensity = avg_spectra[:, :2048]  # Extract the first 2048 features
+        wavelength = np.array(wavelength, dtype=np.float64)
+
+        # Initialize a matrix to store interpolated intensities
+        interpolated_intensity = np.zeros_like(intensity)
+
+        # Interpolate each row separately
+        for i in range(intensity.shape[0]):
+            interp_func = interp1d(wavelength, intensity[i, :], kind='linear', fill_value="extrapolate")
+            interpolated_intensity[i, :] = interp_func(Import.WAVELENGTH_RANGE)
+
+        # Extract metadata
+        metadata = {column: metadata_dict.get(attribute, "") for column, attribute in Import.METADATA_FIELDS.items()}
+        metadata['FileName'] = fn
+
+        return {
+            "spectra": interpolated_intensity,
+            "rotation": unique_pairs[:, 0],
+            "position": unique_pairs[:, 1],
+            "metadata": metadata,
+        }
+
+    @staticmethod
+    def _import_file(fn, dark_reference_avg, filter_params, cache_dir=None, dark_reference_id=None):
+        # Worker for read_csv: returns (file, result, from_cache, error) and never raises
+        try:
+            key = None
+            if cache_dir is not None:
+                key = cache_key(fn, dark_reference=dark_reference_id, **filter_params)
+                cached = load_cached_file(cache_dir, key)
+                if cached is not None:
+                    return fn, cached, True, None
+
+            result = Import.process_file(fn, dark_reference_avg, **filter_params)
+
+            if key is not None:
+                save_cached_file(cache_dir, key, result)
+            return fn, result, False, None
+
+        except Exception as e:
+            return fn, None, False, e
+
+    @staticmethod
+    def assemble(results):
+        """
+        Builds the combined DataFrame from processed files in one step.
+
+        Parameters:
+        - results (list): Dictionaries returned by process_file().
+
+        Returns:
+        - value (pd.DataFrame): Feature columns, Rotation, Position and metadata columns.
+        """
+        if not results:
+            return pd.DataFrame()
+
+        spectra = np.vstack([result["spectra"] for result in results])
+        lengths = [len(result["spectra"]) for result in results]
+
+        # Rename columns to "Feature 1", "Feature 2", ..., "Feature n"
+        value = pd.DataFrame(spectra, columns=[f"Feature {i+1}" for i in range(spectra.shape[1])])
+
+        # Assign response data (Rotation and Position) to the DataFrame
+        value['Rotation'] = np.concatenate([result["rotation"] for result in results])
+        value['Position'] = np.concatenate([result["position"] for result in results])
+
+        # Repeat each file's metadata for all of its spectra
+        for column in list(Import.METADATA_FIELDS) + ['FileName']:
+            file_values = np.empty(len(results), dtype=object)
+            file_values[:] = [result["metadata"][column] for result in results]
+            value[column] = np.repeat(file_values, lengths)
+
+        return value
+
+    @staticmethod
+    def read_csv(ds_location, darkReference, options, filter_type="movemean", sample_rate=None, cutoff_freq=None, numtaps=None,
+                 n_jobs=1, cache_dir=None):
         """
         Reads CSV files and processes spectroscopy and metadata information.
 
@@ -60,23 +276,28 @@ class Import:
             - FileIndex (int): Index of the files to read, or inf to read all files.
             - SpectrometerType (str): Type of spectrometer ("XL" or "CL").
             - IncludeSubfolders (bool): Whether to include subfolders.
+        n_jobs (int): Number of worker processes (-1 uses all cores, 1 reads serially).
+        cache_dir (str): Directory for per-file processed output. Files whose fingerprint,
+            dark reference and filter settings match a cache entry are not reprocessed.
 
         Returns:
         value (pd.DataFrame): Combined DataFrame of data from all files.
         summary (pd.DataFrame): Summary of metadata.
+        new_wavelength_range (numpy array): Wavelength grid of the feature columns.
         """
-        # Specify the range for dark reference data
-       # dark_reference_range = 'B7:CW2074'  # Columns B to CW contain the 100 dark reference samples
-
-        # Read dark reference intensity data
-        dark_intensities = pd.read_excel(darkReference, sheet_name=0, usecols="B:CW", skiprows=6, nrows=2074-7+1, header=None)
-        dark_reference_avg = np.random.rand(2068, 1)
-       
-        # Compute the average across the 100 columns
-        dark_reference_avg = np.mean(dark_intensities.values, axis=1)  # Compute the mean for each row (wavelength)
-        dark_reference_avg = dark_reference_avg[np.newaxis, :]
-        # Transpose the result (optional if needed as row vector)
-        #dark_reference = dark_reference_avg.T
+        # Averaged dark reference is cached across calls
+        dark_reference_avg = Import.load_dark_reference(darkReference)
+
+        # Resolve filter settings up front so they can be part of the cache key
+        if filter_type == "fir":
+            # Set default FIR parameters if not provided
+            sample_rate = sample_rate or 2047
+            cutoff_freq = cutoff_freq or 10
+            numtaps = numtaps or 101
+        elif filter_type != "movemean":
+            raise ValueError("Invalid filter_type! Choose 'movemean' or 'fir'.")
+        filter_params = {"filter_type": filter_type, "sample_rate": sample_rate, "cutoff_freq": cutoff_freq, "numtaps": numtaps}
+
         # Input validation
         file_index = options.get("FileIndex", float("inf"))
         spectrometer_type = options.get("SpectrometerType", "XL")
@@ -95,148 +316,34 @@ class Import:
         # Determine which files to read
         file_indices = range(len(files)) if file_index == float("inf") else [file_index]
 
-        # Initialize data container
-        value = []
-
-        # Loop through every file
-        for curr_file_idx in file_indices:
-            try:
-                fn = files[curr_file_idx]
-                print(f"Processing file: {fn}")
-
-                # Read spectroscopy data
-                #data = pd.read_csv(fn, skiprows=4, usecols="A:EU2074")
-
-                data = pd.read_csv(fn, skiprows=4, usecols=range(151), nrows=2070, header=None)
-                #data.iloc[:2, :] = data.iloc[:2, :].astype(int)
-                # Extract wavelength values and consider only the first 2048 readings for uniformity
-                wavelength = data.iloc[2:, 0].to_frame().T.reset_index(drop=True)
-                wavelength = wavelength.iloc[:, :2048]
+        dark_reference_id = array_digest(dark_reference_avg) if cache_dir is not None else None
 
-                # Remove wavelength column from data
-                data = data.iloc[:, 1:].T.reset_index(drop=True)
-
-                # Extract rotation values
-                Rotation = data.iloc[:, 0].round().astype(int)
-                data.drop(data.columns[0], axis=1, inplace=True)  # Remove first column
-
-                # Extract position values
-                position = data.iloc[:, 0].astype(int)
-                data.drop(data.columns[0], axis=1, inplace=True)  # Remove first column
-
-                # Consider only the first 2048 readings
-                data = data.iloc[:, :2048]
-
-                # Subtract dark reference from each row in data
-                # Ensure dark_reference_avg is the correct shape
-                dark_reference_avg_trimmed = dark_reference_avg[:, :2048]  # Trim to 2048 columns
-
-                # Subtract row-wise
-                data_subtracted = data.to_numpy() - dark_reference_avg_trimmed
-
-                
-                if filter_type == "movemean":
-                    # Moving mean settings
-                    window_size = 35  # Define window size (3-point moving average)
-                    #data_subtracted_df = pd.DataFrame(data_subtracted)
-                    intensities_smooth = moving_mean(data_subtracted, window_size)
-
-                elif filter_type == "fir":
-                    # Set default FIR parameters if not provided
-                    sample_rate = sample_rate or 2047  # Default 1000 Hz
-                    cutoff_freq = cutoff_freq or 10    # Default 50 Hz
-                    numtaps = numtaps or 101            # Default 35 taps
-
-                   # print(f"Applying FIR Filter (Cutoff = {cutoff_freq} Hz)...")
-                    intensities_smooth = Import.apply_fir_filter(data_subtracted, sample_rate, cutoff_freq, numtaps)
-
-                else:
-                    raise ValueError("Invalid filter_type! Choose 'movemean' or 'fir'.")
-
-                #intensities_smooth = intensities_smooth.to_numpy()
-                # Combine Rotation, Position, and Intensities into one DataFrame
-                combined_data = pd.DataFrame({
-                    'Rotation': Rotation,
-                    'Position': position,
-                })
-                combined_data = pd.concat([combined_data, pd.DataFrame(intensities_smooth)], axis=1)
-
-                # Combine Rotation and Position as unique pairs
-                unique_pairs = combined_data[['Rotation', 'Position']].drop_duplicates().to_numpy()
-
-                # Find group indices for each (Rotation, Position) combination
-                combined_data['Group'] = combined_data.groupby(['Rotation', 'Position']).ngroup()
-
-                # Initialize an array to store the average spectra for each (Rotation, Position)
-                n_features = intensities_smooth.shape[1]  # Number of features (columns in intensities_smooth)
-                avg_spectra = np.full((len(unique_pairs), n_features), np.nan)
-
-                # Calculate the mean spectrum for each unique group
-                for i, group in enumerate(unique_pairs):
-                    # Extract indices for the current group
-                    group_indices = combined_data['Group'] == i
-
-                    # Extract the corresponding spectra for this group
-                    spectra_group = intensities_smooth[group_indices, :]
-
-                    # Compute the mean spectrum for the group
-                    avg_spectra[i, :] = np.nanmean(spectra_group, axis=0)
-
-                # Extract wavelength and intensity
-                wavelength = wavelength.iloc[0, :].to_numpy()  # Extract the numeric array from the DataFrame
-                intensity = avg_spectra[:, :2048]  # Extract the first 2048 features
-                wavelength = np.array(wavelength, dtype=np.float64)
-                # Create a new wavelength range
-                new_wavelength_range = np.linspace(400, 940, 2048)
-
-                # Initialize a matrix to store interpolated intensities
-                interpolated_intensity = np.zeros_like(intensity)
-
-                # Interpolate each row separately
-                for i in range(intensity.shape[0]):
-                    interp_func = interp1d(wavelength, intensity[i, :], kind='linear', fill_value="extrapolate")
-                    interpolated_intensity[i, :] = interp_func(new_wavelength_range)
-                    
-               # normalized_spectra = Import.normalize_spectra(interpolated_intensity, wavelength)
-
-                # Convert interpolated_intensity into a DataFrame and copy it to data
-                data = pd.DataFrame(interpolated_intensity)
-
-                # Rename columns to "Feature 1", "Feature 2", ..., "Feature n"
-                data.columns = [f"Feature {i+1}" for i in range(data.shape[1])]
-
-                # Assign response data (Rotation and Position) to the DataFrame
-                data['Rotation'] = unique_pairs[:, 0]  # Add Rotation
-                data['Position'] = unique_pairs[:, 1]  # Add Position
-
-                # Read metadata from rows 2081 to 2138
-                meta_data = pd.read_csv(fn, header=None, skiprows=2080, nrows=58, usecols=[0, 1], names=["Attribute", "Value"])
-
-               # Extract metadata and assign it to the data
-                metadata_dict = meta_data.set_index('Attribute')['Value'].to_dict()
-                data.loc[:, 'LightSource'] = metadata_dict.get("Light Source Type", "")
-                data.loc[:, 'ProbeSize'] = metadata_dict.get("Fiber Type", "")
-                data.loc[:, 'AimingBeam'] = metadata_dict.get("Aiming Beam Status", "")
-                data.loc[:, 'TargetType'] = metadata_dict.get("Target Type", "")
-                data.loc[:, 'TargetNumber'] = metadata_dict.get("Target Number", "")
-                data.loc[:, 'IntegrationTimeUsed'] = metadata_dict.get("Integration Time Used (mS)", "")
-                data.loc[:, 'SpectrometerUsed'] = metadata_dict.get("Spec Used", "")
-                data.loc[:, 'FileName'] = fn
-
-                # Append to value list
-                value.append(data)
-
-            except Exception as e:
-                print(f'Unable to read from file: {fn}. Error: {e}')
+        # Process every file on a worker pool (joblib runs in-process when n_jobs=1)
+        outputs = Parallel(n_jobs=n_jobs)(
+            delayed(Import._import_file)(files[idx], dark_reference_avg, filter_params, cache_dir, dark_reference_id)
+            for idx in file_indices
+        )
+
+        results = []
+        cached_count = 0
+        for fn, result, from_cache, error in outputs:
+            if error is not None:
+                print(f'Unable to read from file: {fn}. Error: {error}')
                 continue
+            cached_count += from_cache
+            results.append(result)
+
+        print(f"Imported {len(results)} files ({cached_count} from cache)")
 
         # Combine all data into a single DataFrame
-        value = pd.concat(value, ignore_index=True) if value else pd.DataFrame()
+        value = Import.assemble(results)
 
         # Summary of metadata
         meta_data_vars = ["LightSource", "ProbeSize", "AimingBeam", "TargetType",
                           "TargetNumber", "IntegrationTimeUsed", "SpectrometerUsed", "FileName"]
-        summary = value.groupby(meta_data_vars).size().reset_index(name='Count')
-
-        return value, summary, new_wavelength_range
+        if value.empty:
+            summary = pd.DataFrame(columns=meta_data_vars + ['Count'])
+        else:
+            summary = value.groupby(meta_data_vars).size().reset_index(name='Count')
 
+        return value, summary, Import.WAVELENGTH_RANGE.copy()
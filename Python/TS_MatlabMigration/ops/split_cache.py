@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import StratifiedGroupKFold
+from ops.grouping import group_codes
+from ops.import_cache import array_digest
+from ops.splitn import partition_indices
+
+# Bump when the stored split layout changes so stale cache entries are ignored
+SPLIT_CACHE_VERSION = 1
+
+# Spectra of one physical target (e.g. COM 1 / sample 3) must never be on both sides of a split
+GROUP_COLS = ("TargetType", "TargetNumber")
+
+
+def dataset_fingerprint(data, group_cols=GROUP_COLS, label_col="Response"):
+    """
+    Fingerprint of everything a split depends on: row order, index, group keys and labels.
+
+    Parameters:
+    - data (DataFrame): Dataset with the group and label columns.
+    - group_cols (tuple): Columns identifying a group.
+    - label_col (str): Column the folds are stratified on.
+
+    Returns:
+    - fingerprint (str): Hex digest that changes whenever rows, groups or labels change.
+    """
+    hashed = pd.util.hash_pandas_object(data[list(group_cols) + [label_col]], index=True)
+    return array_digest(hashed.to_numpy())
+
+
+def _index_dtype(n_rows):
+    # Smallest integer type that can hold every row position
+    return np.int32 if n_rows < 2 ** 31 else np.int64
+
+
+class SplitManager:
+    """
+    Computes grouped train/test and cross-validation splits once and caches them on disk.
+
+    Splits are stored as compact integer arrays (row positions, or one fold number per
+    row) in .npz files keyed by the dataset fingerprint, the split parameters and the
+    seed, so every run and every search on the same data sees the same splits.
+
+    Example:
+        splits = SplitManager(cache_dir="split_cache", seed=0)
+        train_idx, test_idx = splits.holdout(data, train_percent=80)
+        folds = splits.cv_folds(data.iloc[train_idx], n_splits=5)
+        train_models(X_train, y_train, cv=folds)
+    """
+
+    def __init__(self, cache_dir="split_cache", seed=0, group_cols=GROUP_COLS, label_col="Response"):
+        """
+        Parameters:
+        - cache_dir (str): Folder of the split cache (None disables caching).
+        - seed (int): Seed of every split.
+        - group_cols (tuple): Columns identifying a group (kept on one side of every split).
+        - label_col (str): Column the cross-validation folds are stratified on.
+        """
+        self.cache_dir = cache_dir
+        self.seed = seed
+        self.group_cols = tuple(group_cols)
+        self.label_col = label_col
+
+    def _cache_path(self, data, kind, **params):
+        if not self.cache_dir:
+            return None
+        payload = json.dumps({
+            "kind": kind, "seed": self.seed, "groups": self.group_cols, "label": self.label_col,
+            "data": dataset_fingerprint(data, self.group_cols, self.label_col), "version": SPLIT_CACHE_VERSION, **params,
+        }, sort_keys=True, default=str)
+        return os.path.join(self.cache_dir, f"{kind}_{hashlib.sha1(payload.encode()).hexdigest()}.npz")
+
+    def _load(self, path):
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as cached:
+                return {name: cached[name] for name in cached.files}
+        except (OSError, ValueError) as e:
+            print(f"[Warning] Ignoring corrupt split cache entry {path}: {e}")
+            return None
+
+    def _save(self, path, **arrays):
+        if path is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def groups(self, data):
+        """Returns the integer group code of every row (one code per TargetType + TargetNumber)."""
+        # Factorizing each column first avoids building concatenated key strings
+        codes, _ = group_codes(*(pd.factorize(data[col])[0] for col in self.group_cols))
+        return codes
+
+    def holdout(self, data, train_percent=80):
+        """
+        Grouped train/test split: per TargetType, train_percent of its groups go to training.
+
+        Parameters:
+        - data (DataFrame): Dataset with the group columns.
+        - train_percent (float): Percentage of the groups of every class used for training.
+
+        Returns:
+        - train_idx, test_idx (numpy arrays): Row positions (use data.iloc[...]).
+        """
+        path = self._cache_path(data, "holdout", train_percent=train_percent)
+        cached = self._load(path)
+        if cached is not None:
+            return cached["train"], cached["test"]
+
+        train_idx, test_idx = partition_indices(data, train_percent, random_state=self.seed,
+                                                group_cols=self.group_cols, class_col=self.group_cols[0])
+        dtype = _index_dtype(len(data))
+        train_idx, test_idx = train_idx.astype(dtype), test_idx.astype(dtype)
+        self._save(path, train=train_idx, test=test_idx)
+        return train_idx, test_idx
+
+    def cv_folds(self, data, n_splits=5):
+        """
+        Grouped, stratified cross-validation folds (StratifiedGroupKFold).
+
+        The folds are stored as one fold number per row and returned as the list of
+        (train_idx, test_idx) row positions that train_models and sklearn searches accept
+        as cv. Positions refer to the rows of data in their current order.
+
+        Parameters:
+        - data (DataFrame): Training rows with the group and label columns.
+        - n_splits (int): Number of folds.
+
+        Returns:
+        - folds (list): (train_idx, test_idx) pairs of row positions.
+        """
+        path = self._cache_path(data, "cv", n_splits=n_splits)
+        cached = self._load(path)
+        if cached is not None:
+            fold = cached["fold"]
+        else:
+            splitter = StratifiedGroupKFold(n_splits=n_splits, shuffle=True, random_state=self.seed)
+            fold = np.empty(len(data), dtype=np.int8 if n_splits < 128 else np.int32)
+            for k, (_, test_idx) in enumerate(splitter.split(np.zeros(len(data)), data[self.label_col], self.groups(data))):
+                fold[test_idx] = k
+            self._save(path, fold=fold)
+
+        return [(np.flatnonzero(fold != k), np.flatnonzero(fold == k)) for k in range(n_splits)]
@@ -26,40 +26,91 @@
 import pandas as pd
 import numpy as np
 
-def partition_data_based_on_filenames(data, train_percent):
-    # Loop through every class
-    classes = data['TargetType'].unique()
-
-    train_indices = []
-    test_indices = []
-
-    # Go through each TargetType (COM 1, COM 2, etc.)
-    for cls in classes:
-        # Filter data for the specific target type
-        this_class_mask = data['TargetType'] == cls
-        this_class_data = data[this_class_mask]
-        
-        # Create a combination of TargetType + TargetNumber for unique samples
-        this_class_types = this_class_data['TargetType'] + this_class_data['TargetNumber'].astype(str)
-        
-        # Get the unique combinations of TargetType + TargetNumber
-        unique_class_types = this_class_types.unique()
-        
-        # Calculate number of train samples based on train_percent
-        num_train_samples = int(train_percent / 100 * len(unique_class_types))
-        
-        # Randomly select train samples from the unique combinations
-        train_class_samples = np.random.choice(unique_class_types, num_train_samples, replace=False)
-        
-        # The remaining samples will go to the test set
-        test_class_samples = np.setdiff1d(unique_class_types, train_class_samples)
-        
-        # Add the corresponding indices to train and test sets
-        train_indices.extend(this_class_data[this_class_types.isin(train_class_samples)].index)
-        test_indices.extend(this_class_data[this_class_types.isin(test_class_samples)].index)
-
-    # Split the data into train and test based on indices
-    train_data = data.loc[train_indices]
-    test_data = data.loc[test_indices]
-
-    return train_data, test_data, train_indices, test_indices
\ No newline at end of file
+
+def _factorize_as_str(values):
+    # Codes equal for values with the same string form (1 and "1"), without converting every row to str
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return codes
+    str_codes, _ = pd.factorize(pd.Index(uniques).astype(str))
+    return np.where(codes >= 0, str_codes[codes], -1)
+
+
+def partition_indices(data, train_percent, random_state=None, group_cols=("TargetType", "TargetNumber"),
+                      class_col="TargetType", return_mask=False):
+    """
+    Vectorized grouped train/test partition.
+
+    The group key (TargetType + TargetNumber) is factorized into integer codes once; for
+    every class train_percent of its groups is drawn by code, and rows are assigned
+    through one lookup of their group code. Groups are drawn in order of first
+    appearance, as in partition_data_based_on_filenames, so the same seed selects the
+    same groups. Rows with a missing class or group key are in neither set.
+
+    Parameters:
+    - data (DataFrame): Dataset with the class and group columns.
+    - train_percent (float): Percentage of the groups of every class used for training.
+    - random_state (int): Seed (None uses the global NumPy random state).
+    - group_cols (tuple): Columns that together identify a group.
+    - class_col (str): Column the groups are drawn per.
+    - return_mask (bool): Return boolean row masks instead of row positions.
+
+    Returns:
+    - train, test (numpy arrays): Sorted row positions (use data.iloc[...]), or boolean masks.
+    """
+    rng = np.random if random_state is None else np.random.default_rng(random_state)
+
+    # Factorize the Series directly (no object conversion of string columns), each column once
+    factorized = {col: _factorize_as_str(data[col]) for col in dict.fromkeys((class_col,) + tuple(group_cols))}
+    class_codes = factorized[class_col]
+    column_codes = [factorized[col] for col in group_cols]
+    valid = class_codes >= 0
+    for codes in column_codes:
+        valid &= codes >= 0
+
+    # One integer per row for the whole key, then dense group codes in first-appearance order
+    combined = np.zeros(len(data), dtype=np.int64)
+    for codes in column_codes:
+        combined = combined * (int(codes.max()) + 2 if len(codes) else 1) + (codes + 1)
+    group_codes, _ = pd.factorize(np.where(valid, combined, -1))
+    group_codes = np.where(valid, group_codes, -1)
+    n_groups = int(group_codes.max()) + 1 if valid.any() else 0
+
+    # Class of every group (a group lies in one class because class_col is part of the key)
+    group_class = np.full(n_groups, -1, dtype=np.int64)
+    group_class[group_codes[valid]] = class_codes[valid]
+    first_row = np.full(n_groups, len(data), dtype=np.int64)
+    np.minimum.at(first_row, group_codes[valid], np.flatnonzero(valid))
+
+    is_train_group = np.zeros(n_groups, dtype=bool)
+    for cls in pd.unique(class_codes[valid]):
+        class_groups = np.flatnonzero(group_class == cls)
+        class_groups = class_groups[np.argsort(first_row[class_groups], kind="stable")]
+        num_train_samples = int(train_percent / 100 * len(class_groups))
+        is_train_group[rng.choice(class_groups, num_train_samples, replace=False)] = True
+
+    train_mask = valid & is_train_group[np.maximum(group_codes, 0)]
+    test_mask = valid & ~train_mask
+    if return_mask:
+        return train_mask, test_mask
+    return np.flatnonzero(train_mask), np.flatnonzero(test_mask)
+
+
+def partition_data_based_on_filenames(data, train_percent, random_state=None):
+    """
+    Splits data into train and test sets by TargetType + TargetNumber groups (see partition_indices).
+
+    Returns:
+    - train_data, test_data (DataFrame): Rows of each set, ordered class by class.
+    - train_indices, test_indices (list): Index labels of the rows of each set.
+    """
+    train_idx, test_idx = partition_indices(data, train_percent, random_state=random_state)
+
+    # Keep the original class-by-class row order
+    class_codes = _factorize_as_str(data["TargetType"])
+    train_idx = train_idx[np.argsort(class_codes[train_idx], kind="stable")]
+    test_idx = test_idx[np.argsort(class_codes[test_idx], kind="stable")]
+
+    train_data = data.iloc[train_idx]
+    test_data = data.iloc[test_idx]
+    return train_data, test_data, list(train_data.index), list(test_data.index)
@@ -7,9 +7,10 @@ import numpy as np
 import matplotlib
 matplotlib.use('TkAgg')  # Switches to a more stable backend for VS Code
 from ml_framework.powerRatioFeatures import calculate_spectral_features, plot_power_ratio_histograms
+from ml_framework.featurePlan import FeaturePlan
 from onnxmltools.convert.common.data_types import FloatTensorType
 import yaml
-from processing_module import process_directory, evaluate_onnx_model
+from processing_module import process_directory, evaluate_onnx_model, validate_dtype_policy
 import os
 import sys
 
@@ -59,6 +60,10 @@ def main(config_path=None):
     emission = str(config.get("emission", "")).upper()
     power_ratios = config.get("power_ratios", {})
     ab_status = config.get("ab_status", "AB_OFF").upper()  # New parameter for AB status
+    feature_plan_path = config.get("feature_plan")  # Optional JSON feature plan saved by the training pipeline
+    output_store = config.get("output_store")  # Optional Parquet dataset for processed spectra/features
+    dtype = config.get("dtype", "float64")  # Numeric precision from parsing through normalization
+    validate_dtype = bool(config.get("validate_dtype", False))
 
     print(f"\n[Processing] Source: {source} | Main: {main_folder} | Darkref: {darkref_folder}")
     X_Test, Y_Test, wavelength_df = process_directory(
@@ -67,7 +72,8 @@ def main(config_path=None):
         integration_time=integration_time,
         source=source,
         Reference_Sub=Reference_Sub,
-        emission=emission
+        emission=emission,
+        dtype=dtype
     )
     Y_Test = pd.Series(Y_Test)
     print("Label counts:\n", Y_Test.value_counts())
@@ -89,8 +95,17 @@ def main(config_path=None):
             ratio_ranges[key] = val
         
 
+    # A saved feature plan (from training) takes precedence over power_ratios
+    plan = None
+    if feature_plan_path:
+        if not os.path.isabs(feature_plan_path):
+            feature_plan_path = os.path.join(script_dir, feature_plan_path)
+        plan = FeaturePlan.load(feature_plan_path)
+        ratio_ranges = plan.ratios
+        print(f"[Features] Using feature plan {feature_plan_path}: {plan.columns}")
+
     # Compute power ratio features
-    power_ratio_features_test= calculate_spectral_features(X_Test, Y_Test, wavelength_df, ratio_ranges)
+    power_ratio_features_test= calculate_spectral_features(X_Test, Y_Test, wavelength_df, ratio_ranges, plan=plan)
 
 
         # Strip and rename to standardized names
@@ -103,6 +118,16 @@ def main(config_path=None):
         "ratio_2": "Ratio 2"
     })
 
+    # Persist processed spectra, labels and features (partitioned by source and AB status)
+    if output_store:
+        from spectral_store import write_spectral_store  # pyarrow is only needed when writing a store
+        write_spectral_store(
+            output_store, X_Test, Y_Test, wavelength_df,
+            metadata={"Source": source, "ABStatus": ab_status, "IntegrationTime": integration_time, "Emission": emission},
+            features=power_ratio_features_test,
+        )
+        print(f"[Store] Wrote {len(Y_Test)} spectra to {output_store}")
+
     X_test_knn = power_ratio_features_test.iloc[:, :-1]
     X_test_knn.fillna(X_test_knn.mean(), inplace=True)# First two columns (features)
     y_test_knn = power_ratio_features_test.iloc[:, -1]   # Third column (labels)
@@ -116,6 +141,15 @@ def main(config_path=None):
         label_encoder = LabelEncoder()
         label_encoder.fit(Y_Test)
         evaluate_onnx_model(onnx_model_path, X_test_knn, y_test_knn, label_encoder)
+
+    # Optional: report how far the float32 pipeline deviates from float64
+    if validate_dtype:
+        validate_dtype_policy(
+            main_folder, darkref_folder, integration_time, source, emission, ratio_ranges,
+            Reference_Sub=Reference_Sub,
+            onnx_model_path=onnx_model_path if os.path.exists(onnx_model_path) else None,
+            plan=plan
+        )
     
     
 if __name__ == "__main__":
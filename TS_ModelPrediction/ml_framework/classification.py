@@ -3,16 +3,254 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.svm import SVC
 from xgboost import XGBClassifier
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import GridSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingGridSearchCV)
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV, ParameterGrid, train_test_split, check_cv
+from sklearn.base import clone
+from joblib import Parallel, delayed, cpu_count
+from types import SimpleNamespace
+from scipy.stats import rankdata
+import numpy as np
 from sklearn.metrics import confusion_matrix, accuracy_score
 from ml_utility.metrics import compute_metrics
+from ml_utility.knn import search_knn_index
+from ml_framework.basePipilineTrain import build_pipeline, pipeline_param_grid, CLASSIFIER_STEP
+from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder
+import time
 
-def train_models(X_train, y_train):
+# Resource that successive halving grows for each model family (default: number of training samples)
+HALVING_RESOURCES = {"RandomForest": "n_estimators", "XGBoost": "n_estimators"}
+
+def _classifier_param(model, name):
+    # Classifier parameter name, prefixed when the classifier sits in a preprocessing Pipeline
+    return f"{CLASSIFIER_STEP}__{name}" if isinstance(model, Pipeline) else name
+
+def _build_search(model_name, model, param_grid, search, cv, factor, random_state):
+    """
+    Creates the hyperparameter search for one model family.
+
+    - "grid": exhaustive GridSearchCV.
+    - "halving": HalvingGridSearchCV. RandomForest and XGBoost grow n_estimators up to the
+      largest value of their grid; the other families grow the number of training samples.
+      Each round keeps the best 1/factor of the candidates.
+    """
+    if search == "grid":
+        return GridSearchCV(model, param_grid, cv=cv, scoring='accuracy', n_jobs=-1)
+    if search != "halving":
+        raise ValueError("Invalid search! Choose 'grid' or 'halving'.")
+
+    resource = HALVING_RESOURCES.get(model_name, "n_samples")
+    max_resources = "auto"
+    if resource != "n_samples":
+        resource = _classifier_param(model, resource)
+        # The resource itself is no longer a grid dimension
+        max_resources = max(param_grid[resource])
+        param_grid = {name: values for name, values in param_grid.items() if name != resource}
+
+    return HalvingGridSearchCV(model, param_grid, resource=resource, max_resources=max_resources, factor=factor,
+                               cv=cv, scoring='accuracy', n_jobs=-1, random_state=random_state)
+
+# Families whose estimators are multi-threaded; each of their tasks gets threads_per_task threads
+THREADED_FAMILIES = ("RandomForest", "XGBoost")
+
+def _fit_and_score(model, params, X, y, train_idx, test_idx):
+    # One (family, candidate, fold) task of the concurrent grid search
+    start = time.time()
+    estimator = clone(model).set_params(**params)
+    estimator.fit(X[train_idx], y[train_idx])
+    score = accuracy_score(y[test_idx], estimator.predict(X[test_idx]))
+    return score, time.time() - start
+
+def _refit(model, params, X, y):
+    return clone(model).set_params(**params).fit(X, y)
+
+def _concurrent_grid_search(models, X, y, cv, n_jobs=-1, threads_per_task=1):
+    """
+    Runs the grid searches of all model families as one task graph on a fixed worker pool.
+
+    Every (family, candidate, fold) fit is an independent task. RandomForest and XGBoost
+    tasks use threads_per_task threads each, and the pool has cores // threads_per_task
+    workers, so the machine is never oversubscribed. The expensive families are queued
+    first so the pool stays busy until the end. Candidates are ranked like GridSearchCV
+    (highest mean CV accuracy, first candidate on ties).
+
+    Returns:
+    - searches (dict): Per family an object with best_estimator_, best_params_, best_score_,
+      cv_results_ and fit_time_ (summed task time), like a fitted GridSearchCV.
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    folds = list(check_cv(cv, y, classifier=True).split(X, y))
+    n_cores = cpu_count() if n_jobs in (None, -1) else n_jobs
+    n_workers = max(1, n_cores // threads_per_task)
+
+    # Fix the thread count of the multi-threaded estimators for every task
+    models = {name: (clone(model).set_params(**{_classifier_param(model, "n_jobs"): threads_per_task})
+                     if name in THREADED_FAMILIES else model, grid)
+              for name, (model, grid) in models.items()}
+    candidates = {name: list(ParameterGrid(grid)) for name, (_, grid) in models.items()}
+
+    tasks = [(name, c, f) for name in models for c in range(len(candidates[name])) for f in range(len(folds))]
+    # Most expensive first: threaded ensembles, larger ensembles before smaller ones
+    tasks.sort(key=lambda t: (t[0] not in THREADED_FAMILIES, -candidates[t[0]][t[1]].get(_classifier_param(models[t[0]][0], 'n_estimators'), 0)))
+
+    print(f"Running {len(tasks)} CV fits on {n_workers} workers x {threads_per_task} thread(s)...")
+    results = Parallel(n_jobs=n_workers)(
+        delayed(_fit_and_score)(models[name][0], candidates[name][c], X, y, *folds[f]) for name, c, f in tasks
+    )
+
+    scores = {name: np.full((len(candidates[name]), len(folds)), np.nan) for name in models}
+    fit_times = dict.fromkeys(models, 0.0)
+    for (name, c, f), (score, elapsed) in zip(tasks, results):
+        scores[name][c, f] = score
+        fit_times[name] += elapsed
+
+    best_index = {name: int(np.argmax(scores[name].mean(axis=1))) for name in models}
+    refitted = Parallel(n_jobs=min(n_workers, len(models)))(
+        delayed(_refit)(models[name][0], candidates[name][best_index[name]], X, y) for name in models
+    )
+
+    searches = {}
+    for (name, (model, _)), estimator in zip(models.items(), refitted):
+        mean_scores = scores[name].mean(axis=1)
+        cv_results = {
+            "params": candidates[name],
+            "mean_test_score": mean_scores,
+            "std_test_score": scores[name].std(axis=1),
+            "rank_test_score": rankdata(-mean_scores, method="min").astype(np.int32),
+        }
+        for f in range(len(folds)):
+            cv_results[f"split{f}_test_score"] = scores[name][:, f]
+        searches[name] = SimpleNamespace(
+            best_estimator_=estimator,
+            best_params_=candidates[name][best_index[name]],
+            best_score_=mean_scores[best_index[name]],
+            cv_results_=cv_results,
+            fit_time_=fit_times[name],
+        )
+    return searches
+
+# Tree-structure grid of the early-stopping XGBoost search (histogram tree method);
+# the number of trees is chosen by early stopping instead
+XGB_EARLY_STOPPING_GRID = {
+    'max_depth': [3, 5, 7],
+    'learning_rate': [0.05, 0.1, 0.2],
+    'max_bin': [64, 256],
+    'min_child_weight': [1, 5],
+}
+
+def search_xgboost_early_stopping(X_train, y_train, param_grid=None, cv=5, validation_fraction=0.2,
+                                  early_stopping_rounds=20, max_estimators=1000, random_state=42, n_jobs=-1, fixed_params=None,
+                                  sampler=None):
+    """
+    XGBoost hyperparameter search with early stopping on an inner validation fold.
+
+    For every candidate and CV fold, the training fold is split again into an inner
+    training and validation part. Trees are added (tree_method="hist") until the
+    validation logloss has not improved for early_stopping_rounds rounds, and the
+    early-stopped model is scored on the outer fold. The best candidate is refitted on
+    all training data with the median number of trees its folds stopped at, so the
+    final model has a fixed tree count and exports to ONNX as is.
+
+    Parameters:
+    - X_train, y_train: Training features and encoded labels.
+    - param_grid (dict): Grid of XGBoost parameters (default: XGB_EARLY_STOPPING_GRID).
+    - cv (int, CV splitter or list of (train_idx, test_idx)): Outer cross-validation folds.
+    - validation_fraction (float): Part of each training fold used for early stopping.
+    - early_stopping_rounds (int): Rounds without improvement before training stops.
+    - max_estimators (int): Upper bound on the number of trees.
+    - random_state (int): Seed for the inner split and XGBoost.
+    - n_jobs (int): XGBoost threads.
+    - fixed_params (dict): XGBoost parameters used for every candidate (e.g. scale_pos_weight).
+    - sampler: Resampling applied to the inner training part of every fold only (e.g.
+      ml_framework.rebalance.make_sampler); the early-stopping and outer validation rows stay original.
+
+    Returns:
+    - search: Object with best_estimator_, best_params_ (including n_estimators), best_score_
+      and cv_results_ (with mean_n_estimators), like a fitted GridSearchCV. With a sampler,
+      best_estimator_ is the sampler + XGBoost pipeline of build_pipeline.
+    """
+    X = np.asarray(X_train)
+    y = np.asarray(y_train)
+    folds = list(check_cv(cv, y, classifier=True).split(X, y))
+    candidates = list(ParameterGrid(param_grid or XGB_EARLY_STOPPING_GRID))
+
+    scores = np.zeros((len(candidates), len(folds)))
+    n_trees = np.zeros((len(candidates), len(folds)), dtype=int)
+    start = time.time()
+    for c, params in enumerate(candidates):
+        for f, (train_idx, test_idx) in enumerate(folds):
+            X_inner, X_val, y_inner, y_val = train_test_split(
+                X[train_idx], y[train_idx], test_size=validation_fraction, stratify=y[train_idx], random_state=random_state)
+            if sampler is not None:
+                X_inner, y_inner = clone(sampler).fit_resample(X_inner, y_inner)
+            model = XGBClassifier(tree_method="hist", n_estimators=max_estimators, early_stopping_rounds=early_stopping_rounds,
+                                  eval_metric="logloss", random_state=random_state, n_jobs=n_jobs, **(fixed_params or {}), **params)
+            model.fit(X_inner, y_inner, eval_set=[(X_val, y_val)], verbose=False)
+            # predict() uses the trees up to the best iteration
+            scores[c, f] = accuracy_score(y[test_idx], model.predict(X[test_idx]))
+            n_trees[c, f] = model.best_iteration + 1
+
+    mean_scores = scores.mean(axis=1)
+    best_index = int(np.argmax(mean_scores))
+    best_params = dict(candidates[best_index], n_estimators=int(np.median(n_trees[best_index])))
+    best_estimator = XGBClassifier(tree_method="hist", eval_metric="logloss", random_state=random_state, n_jobs=n_jobs,
+                                   **(fixed_params or {}), **best_params)
+    if sampler is not None:
+        best_estimator = build_pipeline(best_estimator, normalization="none", feature_selection="none", sampler=sampler)
+    best_estimator.fit(X, y)
+    print(f"Early-stopping XGBoost search: {len(candidates)} candidates x {len(folds)} folds in {time.time() - start:.1f}s, "
+          f"{best_params['n_estimators']} trees (max {max_estimators})")
+
+    cv_results = {
+        "params": candidates,
+        "mean_test_score": mean_scores,
+        "std_test_score": scores.std(axis=1),
+        "rank_test_score": rankdata(-mean_scores, method="min").astype(np.int32),
+        "mean_n_estimators": n_trees.mean(axis=1),
+    }
+    for f in range(len(folds)):
+        cv_results[f"split{f}_test_score"] = scores[:, f]
+    return SimpleNamespace(best_estimator_=best_estimator, best_params_=best_params,
+                           best_score_=mean_scores[best_index], cv_results_=cv_results)
+
+def train_models(X_train, y_train, search="grid", cv=5, factor=3, random_state=42, concurrent=False, n_jobs=-1, threads_per_task=1,
+                 normalization="none", feature_selection="none", cache_dir=None, xgb_early_stopping=False,
+                 class_weight=None, knn_index_search=False, sampler=None):
     """
     Trains multiple ML models (KNN, Decision Tree, SVM, XGBoost, Random Forest) 
     with hyperparameter tuning and selects the best model while checking for overfitting.
 
+    Parameters:
+    - X_train, y_train: Training features and labels.
+    - search (str): "grid" (exhaustive GridSearchCV) or "halving" (successive halving, much faster).
+    - cv (int, CV splitter or list of (train_idx, test_idx)): Cross-validation folds. The folds are
+      computed once and shared by all model families, so every family is scored on the same
+      splits. An int creates a StratifiedKFold; grouped folds from ops.split_cache.SplitManager
+      keep all spectra of one target in the same fold.
+    - factor (int): Halving factor (candidates kept per round = 1/factor) for search="halving".
+    - random_state (int): Seed for the halving subsampling.
+    - concurrent (bool): Run the grid searches of all families as one task graph on a shared
+      worker pool instead of one family after another (search="grid" only).
+    - n_jobs (int): Core budget of the concurrent search (-1 uses all cores).
+    - threads_per_task (int): Threads per RandomForest/XGBoost fit in the concurrent search.
+    - normalization (str): "none", "zscore", or "range", fitted inside every CV fold (see build_pipeline).
+    - feature_selection (str): "none", "fscchi2", or "pca", fitted inside every CV fold.
+    - cache_dir (str): Folder where fitted scalers/PCA are memoized per fold, so classifier
+      hyperparameters never refit an identical transformer.
+    - xgb_early_stopping (bool): Tune XGBoost with search_xgboost_early_stopping (hist trees,
+      number of trees from early stopping) instead of the n_estimators grid.
+    - class_weight (str or dict): Class weighting instead of resampling (e.g. "balanced", see
+      ml_framework.rebalance). Applied to DecisionTree and RandomForest, and to XGBoost as
+      scale_pos_weight for binary labels; KNN has no class weights.
+    - knn_index_search (bool): Tune KNN with search_knn_index (one kd-tree per fold and metric,
+      reused for every n_neighbors/weights value) instead of refitting per grid point.
+      Like xgb_early_stopping it supports the sampler, but not normalization/feature_selection.
+    - sampler: Resampling fitted on the training rows of every fold only (e.g.
+      ml_framework.rebalance.make_sampler("smotetomek")). Pass the original, un-resampled
+      training data; validation folds are then scored on original rows, so cv may be
+      grouped folds over those rows.
+
     Returns:
     - Best trained model (avoiding overfitting).
     - Cross-validation results.
@@ -53,23 +291,81 @@ def train_models(X_train, y_train):
         
     }
 
+    # Class weighting instead of resampling; KNN has no class weights
+    xgb_fixed_params = {}
+    if class_weight is not None:
+        models["DecisionTree"][0].set_params(class_weight=class_weight)
+        models["RandomForest"][0].set_params(class_weight=class_weight)
+        if class_weight == "balanced" and len(label_encoder.classes_) == 2:
+            counts = np.bincount(y_train)
+            xgb_fixed_params["scale_pos_weight"] = counts[0] / counts[1]
+            models["XGBoost"][0].set_params(**xgb_fixed_params)
+
+    # Unprefixed grids for the KNN index search, which applies the sampler itself
+    classifier_grids = {name: grid for name, (model, grid) in models.items()}
+
+    # Resampling and preprocessing are part of every candidate, so they are fitted on the training folds only
+    use_pipeline = normalization != "none" or feature_selection != "none" or sampler is not None
+    if use_pipeline:
+        models = {name: (build_pipeline(model, normalization=normalization, feature_selection=feature_selection,
+                                        cache_dir=cache_dir, sampler=sampler), pipeline_param_grid(grid))
+                  for name, (model, grid) in models.items()}
+
+    # Folds are computed once and shared by every model family and search
+    cv = list(check_cv(cv, y_train, classifier=True).split(X_train, y_train))
+
     best_model = None
     best_model_name = None
     best_cv_score = 0
     best_cv_results = None
     best_overfit_penalty = float('inf')
+    search_start = time.time()
+    time_to_best = None
+    summary = []
+
+    if (xgb_early_stopping or knn_index_search) and (normalization != "none" or feature_selection != "none"):
+        raise ValueError("xgb_early_stopping and knn_index_search do not support normalization/feature_selection.")
+
+    searches = None
+    if concurrent:
+        if search != "grid":
+            raise ValueError("concurrent=True runs the exhaustive grid; use search='grid'.")
+        grid_models = {name: entry for name, entry in models.items()
+                       if not (name == "XGBoost" and xgb_early_stopping) and not (name == "KNN" and knn_index_search)}
+        searches = _concurrent_grid_search(grid_models, X_train, y_train, cv, n_jobs=n_jobs, threads_per_task=threads_per_task)
 
     for model_name, (model, param_grid) in models.items():
-        print(f"\nTraining {model_name} with hyperparameter tuning...")
-        grid_search = GridSearchCV(model, param_grid, cv=5, scoring='accuracy', n_jobs=-1)
-        grid_search.fit(X_train, y_train)
+        if model_name == "KNN" and knn_index_search:
+            print(f"\nTraining {model_name} with a reused kd-tree index per fold...")
+            family_start = time.time()
+            grid_search = search_knn_index(X_train, y_train, classifier_grids[model_name], cv=cv, algorithm="kd_tree",
+                                           sampler=sampler)
+            family_time = time.time() - family_start
+        elif model_name == "XGBoost" and xgb_early_stopping:
+            print(f"\nTraining {model_name} with early stopping...")
+            family_start = time.time()
+            grid_search = search_xgboost_early_stopping(X_train, y_train, cv=cv, random_state=random_state,
+                                                        fixed_params=xgb_fixed_params, sampler=sampler)
+            family_time = time.time() - family_start
+        elif searches is not None:
+            # Already fitted in the shared task graph; time is the summed fit time of its tasks
+            print(f"\nResults for {model_name} (concurrent grid search)...")
+            grid_search = searches[model_name]
+            family_time = grid_search.fit_time_
+        else:
+            print(f"\nTraining {model_name} with hyperparameter tuning ({search} search)...")
+            family_start = time.time()
+            grid_search = _build_search(model_name, model, param_grid, search, cv, factor, random_state)
+            grid_search.fit(X_train, y_train)
+            family_time = time.time() - family_start
 
         best_train_acc = grid_search.best_estimator_.score(X_train, y_train)  # Training accuracy
         best_cv_acc = grid_search.best_score_  # Cross-validation accuracy
         overfit_penalty = abs(best_train_acc - best_cv_acc)  # Overfitting measure
 
         print(f"Best parameters for {model_name}: {grid_search.best_params_}")
-        print(f"Train Accuracy: {best_train_acc:.4f} | CV Accuracy: {best_cv_acc:.4f} | Overfit Penalty: {overfit_penalty:.4f}")
+        print(f"Train Accuracy: {best_train_acc:.4f} | CV Accuracy: {best_cv_acc:.4f} | Overfit Penalty: {overfit_penalty:.4f} | Search Time: {family_time:.1f}s")
+        summary.append((model_name, best_cv_acc, family_time))
 
         # Select the best model based on CV accuracy while considering overfitting
         if best_cv_acc > best_cv_score and overfit_penalty < best_overfit_penalty:
@@ -78,8 +374,14 @@ def train_models(X_train, y_train):
             best_model_name = model_name
             best_cv_results = grid_search.cv_results_
             best_overfit_penalty = overfit_penalty
+            time_to_best = time.time() - search_start
 
+    print(f"\n{'Model':<14}{'CV Accuracy':>12}{'Time (s)':>10}")
+    for model_name, cv_acc, family_time in summary:
+        print(f"{model_name:<14}{cv_acc:>12.4f}{family_time:>10.1f}")
     print(f"\nBest Model (Balanced for Overfitting): {best_model_name} with CV Accuracy: {best_cv_score:.4f}")
+    if time_to_best is not None:
+        print(f"Time to best model: {time_to_best:.1f}s | Total search time: {time.time() - search_start:.1f}s")
     return best_model, best_cv_results, best_model_name, best_cv_score, label_encoder  
 
 def evaluate_model(best_model, X_train, y_train, X_test, y_test, best_cv_score, model_name, label_encoder):
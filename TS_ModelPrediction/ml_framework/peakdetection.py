@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from scipy.signal import find_peaks
+from scipy.signal import find_peaks, peak_prominences
 from joblib import Parallel, delayed  # Import joblib for parallelization
 
 # Detect only top peaks based on prominence and distance
@@ -25,14 +25,116 @@ def detect_top_peaks(spectrum, wavelengths, num_peaks=3, prominence=0.02, distan
     
     return top_peaks_wavelengths, top_peaks_intensities
 
+def _to_padded(rows, values, n_rows, fill):
+    # Flat (row, value) pairs sorted by row -> padded (n_rows x max_count) matrix
+    counts = np.bincount(rows, minlength=n_rows)
+    width = counts.max() if len(counts) and counts.max() > 0 else 0
+    padded = np.full((n_rows, width), fill, dtype=np.result_type(values, type(fill)))
+    starts = np.cumsum(counts) - counts
+    padded[rows, np.arange(len(rows)) - starts[rows]] = values
+    return padded, counts
+
+
+def _find_peaks_chunk(x, prominence, distance):
+    # All spectra of the chunk are laid end to end, separated by a gap of +inf samples, and
+    # scipy's compiled peak search runs once over the whole chunk. The gap is wider than
+    # 2 * distance, so peaks of neighbouring spectra never interact in the distance filter,
+    # and the prominence search of every peak stops at the borders of its own spectrum.
+    n_rows, n_cols = x.shape
+    gap = 2 * int(np.ceil(distance or 1)) + 1
+    stride = n_cols + gap
+
+    flat = np.full((n_rows, stride), np.inf)
+    flat[:, :n_cols] = x
+    flat = flat.ravel()
+
+    peaks, _ = find_peaks(flat, distance=distance)
+    peaks = peaks[peaks % stride < n_cols]  # drop the separator plateaus
+    prominences = peak_prominences(flat, peaks)[0]
+    if prominence is not None:
+        keep = prominences >= prominence
+        peaks, prominences = peaks[keep], prominences[keep]
+    return peaks // stride, peaks % stride, prominences
+
+
+def find_peaks_batch(spectra, prominence=0.02, distance=10, chunk_size=1024, n_jobs=1):
+    """
+    Finds peaks in every spectrum, like scipy.signal.find_peaks(spectrum, prominence=..., distance=...).
+
+    Instead of one find_peaks call per spectrum, each chunk of spectra is searched
+    in a single call to scipy's compiled peak finder. Chunks can be processed on
+    several threads.
+
+    Parameters:
+    - spectra (DataFrame or numpy array): Spectra (samples x wavelengths).
+    - prominence (float): Minimum prominence of a peak (None keeps all peaks).
+    - distance (float): Minimum horizontal distance between peaks in samples (None disables the filter).
+    - chunk_size (int): Number of spectra searched per call.
+    - n_jobs (int): Number of threads (-1 uses all cores).
+
+    Returns:
+    - peaks (numpy array): Padded peak table (samples x max peaks), column indices in ascending order, -1 as padding.
+    - prominences (numpy array): Prominence of every peak, NaN as padding.
+    - counts (numpy array): Number of peaks of every spectrum.
+    """
+    x = np.asarray(spectra, dtype=np.float64)
+    if distance is not None and distance < 1:
+        raise ValueError('`distance` must be greater or equal to 1')
+
+    starts = range(0, x.shape[0], chunk_size)
+    results = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(_find_peaks_chunk)(x[first:first + chunk_size], prominence, distance) for first in starts
+    )
+
+    rows = np.concatenate([r + first for (r, _, _), first in zip(results, starts)] or [np.array([], dtype=int)])
+    peaks = np.concatenate([c for _, c, _ in results] or [np.array([], dtype=int)])
+    prominences = np.concatenate([p for _, _, p in results] or [np.array([])])
+
+    peak_table, counts = _to_padded(rows, peaks, x.shape[0], -1)
+    prominence_table, _ = _to_padded(rows, prominences, x.shape[0], np.nan)
+    return peak_table, prominence_table, counts
+
+
+def detect_top_peaks_batch(spectra, wavelengths, num_peaks=3, prominence=0.02, distance=10, chunk_size=1024, n_jobs=1):
+    """
+    Batched detect_top_peaks: the num_peaks most prominent peaks of every spectrum.
+
+    Parameters:
+    - spectra (DataFrame or numpy array): Spectra (samples x wavelengths).
+    - wavelengths: Wavelength values of the spectrum columns.
+    - num_peaks, prominence, distance: As for detect_top_peaks.
+    - chunk_size (int): Number of spectra searched per call.
+    - n_jobs (int): Number of threads (-1 uses all cores).
+
+    Returns:
+    - top_wavelengths (numpy array): samples x num_peaks, most prominent first, NaN where a spectrum has fewer peaks.
+    - top_intensities (numpy array): Intensities at those peaks, NaN as padding.
+    """
+    x = np.asarray(spectra, dtype=np.float64)
+    wavelengths = np.asarray(wavelengths, dtype=np.float64).ravel()
+    peaks, prominences, _ = find_peaks_batch(x, prominence=prominence, distance=distance, chunk_size=chunk_size, n_jobs=n_jobs)
+
+    # Most prominent first; equal prominences keep the order of prominences.argsort()[::-1]
+    order = np.argsort(np.nan_to_num(prominences, nan=-np.inf), axis=1, kind="stable")[:, ::-1][:, :num_peaks]
+    top = np.take_along_axis(peaks, order, axis=1) if peaks.size else np.full((x.shape[0], 0), -1)
+    found = top >= 0
+
+    top_wavelengths = np.full((x.shape[0], num_peaks), np.nan)
+    top_intensities = np.full((x.shape[0], num_peaks), np.nan)
+    rows = np.nonzero(found)[0]
+    top_wavelengths[:, :top.shape[1]][found] = wavelengths[top[found]]
+    top_intensities[:, :top.shape[1]][found] = x[rows, top[found]]
+    return top_wavelengths, top_intensities
+
+
 # Detect peaks across all samples with given prominence and distance
-def detect_peaks_across_samples(spectra, wavelengths, num_peaks=3, prominence=0.02, distance=10):
-    peak_positions = []
-    for index, spectrum in spectra.iterrows():  # iterrows() iterates over DataFrame rows
-        intensities = spectrum.values  # Extract intensities (numeric values) for this spectrum
-        peaks_wavelengths, _ = detect_top_peaks(intensities, wavelengths, num_peaks, prominence, distance)
-        peak_positions.extend(peaks_wavelengths)  # Append corresponding wavelengths of detected peaks
-    return np.array(peak_positions)
+def detect_peaks_across_samples(spectra, wavelengths, num_peaks=3, prominence=0.02, distance=10, n_jobs=-1):
+    """
+    Returns the wavelengths of the top peaks of all spectra as one flat array
+    (per spectrum, most prominent first), using the batched peak detector.
+    """
+    top_wavelengths, _ = detect_top_peaks_batch(spectra, wavelengths, num_peaks, prominence, distance, n_jobs=n_jobs)
+    return top_wavelengths[~np.isnan(top_wavelengths)]
 
 # Plot histogram of detected peak wavelengths
 def plot_peak_histogram(peak_positions, title="Peak Histogram", bin_width=1):
@@ -52,28 +154,72 @@ def get_peak_ranges(peak_positions, tolerance):
         peak_ranges.append((peak - tolerance, peak + tolerance))
     return peak_ranges
 
+def _range_window_matrix(wavelengths, peak_ranges):
+    # Column indices of every range, padded to the widest range (padding points at column 0)
+    indices = [np.where((wavelengths >= start) & (wavelengths <= end))[0] for start, end in peak_ranges]
+    width = max((len(idx) for idx in indices), default=0)
+    window = np.zeros((len(indices), width), dtype=np.intp)
+    valid = np.zeros((len(indices), width), dtype=bool)
+    for r, idx in enumerate(indices):
+        window[r, :len(idx)] = idx
+        valid[r, :len(idx)] = True
+    return window, valid
+
+
+def _range_features(x, wavelengths, window, valid, include_auc):
+    # x: spectra chunk (samples x wavelengths) -> gathered (samples x ranges x width)
+    gathered = x[:, window]
+    counts = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(valid, gathered, 0).sum(axis=2) / counts   # empty ranges -> NaN like np.mean
+    if not include_auc:
+        return means
+
+    # Trapezoid over consecutive points inside each range
+    steps = np.diff(wavelengths[window], axis=1) * (valid[:, 1:] & valid[:, :-1])
+    aucs = ((gathered[:, :, 1:] + gathered[:, :, :-1]) / 2 * steps).sum(axis=2)
+    return np.hstack([means, aucs])
+
+
 # Extract features (average intensity, area under curve) from defined peak ranges
-def extract_features_from_ranges(spectra, wavelengths, peak_ranges, n_jobs=-1):
-    # Precompute wavelength indices for each range to avoid redundant calculations
-    peak_range_indices = []
-    for start, end in peak_ranges:
-        peak_range_indices.append(np.where((wavelengths >= start) & (wavelengths <= end))[0])
-    
-    # Define the feature extraction function for a single spectrum
-    def extract_features_from_single_spectrum(spectrum_values):
-        features = []
-        for indices in peak_range_indices:
-            intensities_in_range = spectrum_values[indices]
-            mean_intensity = np.mean(intensities_in_range)
-            features.append(mean_intensity)
-        return features
-    
-    # Use joblib's Parallel to apply this function to each spectrum in parallel
-    extracted_features = Parallel(n_jobs=n_jobs)(
-        delayed(extract_features_from_single_spectrum)(spectrum.values) for _, spectrum in spectra.iterrows()
-    )
-    
-    return np.array(extracted_features)
+def extract_features_from_ranges(spectra, wavelengths, peak_ranges, n_jobs=-1, include_auc=False, chunk_size=4096):
+    """
+    Computes the mean intensity (and optionally the AUC) of every spectrum in every peak range.
+
+    The ranges are turned into one window-index matrix, so each chunk of spectra needs
+    a single gather and a few reductions. In-memory data is processed in the calling
+    process; memory-mapped (out-of-core) spectra are processed chunk-wise in parallel
+    worker processes.
+
+    Parameters:
+    - spectra (DataFrame, numpy array or np.memmap): Spectra (samples x wavelengths).
+    - wavelengths: Wavelength values of the spectrum columns.
+    - peak_ranges (list): (start, end) wavelength ranges, e.g. from get_peak_ranges.
+    - n_jobs (int): Worker processes for memory-mapped input (-1 uses all cores).
+    - include_auc (bool): Also return the trapezoidal AUC of every range.
+    - chunk_size (int): Spectra per chunk (bounds the size of the gathered array).
+
+    Returns:
+    - features (numpy array): samples x ranges mean intensities, followed by samples x ranges AUCs if include_auc.
+    """
+    wavelengths = np.asarray(wavelengths, dtype=np.float64).ravel()
+    window, valid = _range_window_matrix(wavelengths, peak_ranges)
+
+    out_of_core = isinstance(spectra, np.memmap)
+    x = spectra if out_of_core else np.asarray(spectra, dtype=np.float64)
+    starts = range(0, x.shape[0], chunk_size)
+
+    if out_of_core:
+        # Every worker reads its own slice of the memory-mapped file
+        chunks = Parallel(n_jobs=n_jobs)(
+            delayed(_range_features)(np.asarray(x[first:first + chunk_size], dtype=np.float64), wavelengths, window, valid, include_auc)
+            for first in starts
+        )
+    else:
+        chunks = [_range_features(x[first:first + chunk_size], wavelengths, window, valid, include_auc) for first in starts]
+
+    n_features = len(peak_ranges) * (2 if include_auc else 1)
+    return np.vstack(chunks) if chunks else np.empty((0, n_features))
 
 
 # Function to get tissue and non-tissue samples based on y_train labels
@@ -2,65 +2,81 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.integrate import trapz
+from scipy.integrate import trapezoid
+
+def _band_window(wavelength_df, start_nm, end_nm):
+    # Column slice from the first wavelength >= start_nm to the last wavelength <= end_nm
+    return slice(np.where(wavelength_df >= start_nm)[0][0], np.where(wavelength_df <= end_nm)[0][-1] + 1)
+
+
+def _moving_average_window(x, window, size=5):
+    """
+    Moving average of x[:, window] with the zero padding of np.convolve(..., mode='same').
+
+    Only the window plus size // 2 neighbours on each side is read, instead of
+    smoothing the full spectrum.
+    """
+    n_cols = x.shape[1]
+    half = size // 2
+    lo, hi = window.start - half, window.stop + half
+    padded = np.zeros((x.shape[0], hi - lo), dtype=np.result_type(x.dtype, np.float64))
+    padded[:, max(lo, 0) - lo:min(hi, n_cols) - lo] = x[:, max(lo, 0):min(hi, n_cols)]
+
+    smoothed = np.zeros((x.shape[0], window.stop - window.start), dtype=padded.dtype)
+    for shift in range(size):
+        smoothed += padded[:, shift:shift + smoothed.shape[1]] / size
+    return smoothed
+
 
 # Function to extract features from intensity data
 def extract_features(x_train, wavelength_df, labels):
     """
     Extracts features like power ratios, AUC, standard deviation, and peak-to-trough values from spectral data.
+
+    All spectra are processed at once: every band is sliced once and reused for
+    its statistics, and the 5-point smoothing is only applied around range 1.
     
     Parameters:
     - x_train: Intensity data (spectra).
     - wavelength_df: Corresponding wavelength values.
-    - labels: Tissue/Non-Tissue labels for the spectra.
+    - labels: Tissue/Non-Tissue labels for the spectra (in the row order of x_train).
 
     Returns:
     - features_df: DataFrame containing the extracted features.
     """
+    x = np.asarray(x_train, dtype=float)
+    wavelengths = np.asarray(wavelength_df, dtype=float).ravel()
+
     # Define the ranges for power ratios and features (using the index of the wavelengths)
-    range1_start = np.where(wavelength_df >= 460)[0][0]
-    range1_end = np.where(wavelength_df <= 480)[0][-1]
-    range2_start = np.where(wavelength_df >= 560)[0][0]
-    range2_end = np.where(wavelength_df <= 580)[0][-1]
-    range3_start = np.where(wavelength_df >= 660)[0][0]
-    range3_end = np.where(wavelength_df <= 680)[0][-1]
-    
-    features = []
-    
-    # Loop through each spectrum (row in x_train)
-    for i, spectrum in enumerate(x_train.values):  # Use .values to get the underlying array of intensities
+    range1 = _band_window(wavelengths, 460, 480)
+    range2 = _band_window(wavelengths, 560, 580)
+    range3 = _band_window(wavelengths, 660, 680)
+
+    band1, band2, band3 = x[:, range1], x[:, range2], x[:, range3]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
         # Power Ratios
-        range1_intensity = np.mean(spectrum[range1_start:range1_end+1])
-        range2_intensity = np.mean(spectrum[range2_start:range2_end+1])
-        range3_intensity = np.mean(spectrum[range3_start:range3_end+1])
-        
-        power_ratio1 = range1_intensity / range2_intensity
-        power_ratio2 = range2_intensity / range3_intensity
-        
-        # Additional Features (AUC, Standard Deviation, Peak-to-Trough, etc.)
-        auc_range1 = trapz(spectrum[range1_start:range1_end+1], wavelength_df[range1_start:range1_end+1])
-        auc_range2 = trapz(spectrum[range2_start:range2_end+1], wavelength_df[range2_start:range2_end+1])
-        auc_range3 = trapz(spectrum[range3_start:range3_end+1], wavelength_df[range3_start:range3_end+1])
-        
-        std_range1 = np.std(spectrum[range1_start:range1_end+1])
-        std_range2 = np.std(spectrum[range2_start:range2_end+1])
-        std_range3 = np.std(spectrum[range3_start:range3_end+1])
-        
-        peak_to_trough_range1 = np.max(spectrum[range1_start:range1_end+1]) / np.min(spectrum[range1_start:range1_end+1])
-        peak_to_trough_range2 = np.max(spectrum[range2_start:range2_end+1]) / np.min(spectrum[range2_start:range2_end+1])
-        
-        smoothed_spectrum = np.convolve(spectrum, np.ones(5)/5, mode='same')
-        smoothed_std = np.std(smoothed_spectrum[range1_start:range1_end+1])
-        
-        # Combine features for this spectrum into a list
-        features.append([power_ratio1, power_ratio2, auc_range1, auc_range2, auc_range3,
-                         std_range1, std_range2, std_range3, peak_to_trough_range1, peak_to_trough_range2, smoothed_std, labels[i]])
-    
-    # Convert the list of features into a DataFrame
-    columns = ['Power Ratio 1', 'Power Ratio 2', 'AUC Range 1', 'AUC Range 2', 'AUC Range 3',
-               'STD Range 1', 'STD Range 2', 'STD Range 3', 'Peak-to-Trough Range 1', 
-               'Peak-to-Trough Range 2', 'Smoothed STD', 'Label']
-    features_df = pd.DataFrame(features, columns=columns)
+        range1_intensity = band1.mean(axis=1)
+        range2_intensity = band2.mean(axis=1)
+        range3_intensity = band3.mean(axis=1)
+
+        features = {
+            'Power Ratio 1': range1_intensity / range2_intensity,
+            'Power Ratio 2': range2_intensity / range3_intensity,
+            # Additional Features (AUC, Standard Deviation, Peak-to-Trough, etc.)
+            'AUC Range 1': trapezoid(band1, wavelengths[range1], axis=1),
+            'AUC Range 2': trapezoid(band2, wavelengths[range2], axis=1),
+            'AUC Range 3': trapezoid(band3, wavelengths[range3], axis=1),
+            'STD Range 1': band1.std(axis=1),
+            'STD Range 2': band2.std(axis=1),
+            'STD Range 3': band3.std(axis=1),
+            'Peak-to-Trough Range 1': band1.max(axis=1) / band1.min(axis=1),
+            'Peak-to-Trough Range 2': band2.max(axis=1) / band2.min(axis=1),
+            'Smoothed STD': _moving_average_window(x, range1).std(axis=1),
+        }
+
+    features_df = pd.DataFrame(features)
+    features_df['Label'] = np.asarray(labels)
     
     return features_df
 
@@ -1,18 +1,184 @@
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.model_selection import GridSearchCV
-from metrics import compute_metrics
+import time
+import numpy as np
+from types import SimpleNamespace
+from scipy.stats import rankdata
+from sklearn.neighbors import KNeighborsClassifier, NearestNeighbors
+from sklearn.model_selection import GridSearchCV, ParameterGrid, check_cv
+from sklearn.metrics import accuracy_score
+from sklearn.base import clone
+from ml_utility.metrics import compute_metrics
+from ml_framework.basePipilineTrain import build_pipeline
 
-def train_knn(X_train, y_train):
+# Metrics with identical distances share one index (minkowski defaults to p=2)
+_METRIC_INDEX = {"minkowski": "euclidean", "l2": "euclidean", "l1": "manhattan", "cityblock": "manhattan"}
+
+
+def _vote(neighbor_codes, distances, weights, n_classes):
+    # Class scores of every query row from its neighbour list, like KNeighborsClassifier.predict
+    n_rows, k = neighbor_codes.shape
+    if weights == "uniform":
+        w = np.ones((n_rows, k))
+    elif weights == "distance":
+        with np.errstate(divide="ignore"):
+            w = 1.0 / distances
+        # Rows with an exact match only vote for the matching neighbours
+        exact = np.isinf(w)
+        w = np.where(exact.any(axis=1, keepdims=True), exact.astype(float), w)
+    else:
+        raise ValueError("Invalid weights! Choose 'uniform' or 'distance'.")
+
+    scores = np.zeros((n_rows, n_classes))
+    np.add.at(scores, (np.repeat(np.arange(n_rows), k), neighbor_codes.ravel()), w.ravel())
+    # argmax picks the smallest class on ties, as sklearn's (weighted) mode does
+    return scores.argmax(axis=1)
+
+
+def search_knn_index(X_train, y_train, param_grid=None, cv=5, algorithm="kd_tree", leaf_size=30, sampler=None):
+    """
+    KNN grid search that builds one neighbour index per fold and metric.
+
+    Each index is queried once for the largest n_neighbors of the grid; every
+    n_neighbors/weights combination is then scored by voting over the first k
+    neighbours of that single query instead of refitting and requerying per grid point.
+    Scores match GridSearchCV except for distance ties at the k-th neighbour.
+
+    Parameters:
+    - X_train, y_train: Training features and labels.
+    - param_grid (dict): Grid over n_neighbors, weights and metric (default: the train_knn grid).
+    - cv (int, CV splitter or list of (train_idx, test_idx)): Cross-validation folds.
+    - algorithm (str): "kd_tree", "ball_tree" or "brute".
+    - leaf_size (int): Leaf size of the tree index.
+    - sampler: Resampling applied to the training rows of every fold before the index is
+      built (e.g. ml_framework.rebalance.make_sampler); validation rows stay original.
+
+    Returns:
+    - search: Object with best_estimator_, best_params_, best_score_ and cv_results_,
+      like a fitted GridSearchCV. With a sampler, best_estimator_ is the sampler + KNN
+      pipeline of ml_framework.basePipilineTrain.build_pipeline.
+    """
+    X = np.asarray(X_train, dtype=np.float64)
+    classes, y = np.unique(np.asarray(y_train), return_inverse=True)
+    param_grid = param_grid or {'n_neighbors': [3, 5, 7, 9], 'weights': ['uniform', 'distance']}
+    candidates = list(ParameterGrid(param_grid))
+    folds = list(check_cv(cv, y, classifier=True).split(X, y))
+    max_k = max(params["n_neighbors"] for params in candidates)
+
+    start = time.time()
+    scores = np.zeros((len(candidates), len(folds)))
+    for f, (train_idx, test_idx) in enumerate(folds):
+        X_fit, y_fit = X[train_idx], y[train_idx]
+        if sampler is not None:
+            X_fit, y_fit = clone(sampler).fit_resample(X_fit, y_fit)
+            X_fit, y_fit = np.asarray(X_fit, dtype=np.float64), np.asarray(y_fit)
+        neighbors = {}
+        for c, params in enumerate(candidates):
+            metric = params.get("metric", "minkowski")
+            key = _METRIC_INDEX.get(metric, metric)
+            if key not in neighbors:
+                index = NearestNeighbors(n_neighbors=max_k, algorithm=algorithm, leaf_size=leaf_size, metric=key)
+                index.fit(X_fit)
+                distances, indices = index.kneighbors(X[test_idx])
+                neighbors[key] = (distances, y_fit[indices])
+            distances, codes = neighbors[key]
+            k = params["n_neighbors"]
+            y_pred = _vote(codes[:, :k], distances[:, :k], params.get("weights", "uniform"), len(classes))
+            scores[c, f] = accuracy_score(y[test_idx], y_pred)
+
+    mean_scores = scores.mean(axis=1)
+    best_index = int(np.argmax(mean_scores))
+    best_params = candidates[best_index]
+    best_estimator = KNeighborsClassifier(algorithm=algorithm, leaf_size=leaf_size, **best_params)
+    if sampler is not None:
+        best_estimator = build_pipeline(best_estimator, normalization="none", feature_selection="none", sampler=sampler)
+    best_estimator.fit(X_train, y_train)
+    print(f"KNN index search: {len(candidates)} candidates x {len(folds)} folds in {time.time() - start:.2f}s "
+          f"({len(folds) * len({_METRIC_INDEX.get(p.get('metric', 'minkowski'), p.get('metric', 'minkowski')) for p in candidates})} {algorithm} indexes)")
+
+    cv_results = {
+        "params": candidates,
+        "mean_test_score": mean_scores,
+        "std_test_score": scores.std(axis=1),
+        "rank_test_score": rankdata(-mean_scores, method="min").astype(np.int32),
+    }
+    for f in range(len(folds)):
+        cv_results[f"split{f}_test_score"] = scores[:, f]
+    return SimpleNamespace(best_estimator_=best_estimator, best_params_=best_params,
+                           best_score_=mean_scores[best_index], cv_results_=cv_results)
+
+
+def benchmark_knn_algorithms(X_train, y_train, X_query, n_neighbors=5, weights="uniform", metric="minkowski",
+                             algorithms=("brute", "kd_tree", "ball_tree"), n_single=200):
+    """
+    Compares brute force, kd-tree and ball-tree KNN at prediction time.
+
+    Parameters:
+    - X_train, y_train: Training features and labels.
+    - X_query: Rows to predict (e.g. the test features).
+    - n_neighbors, weights, metric: KNN settings (e.g. best_params_ of the search).
+    - algorithms (tuple): Neighbour algorithms to compare.
+    - n_single (int): Number of single-row predictions timed.
+
+    Returns:
+    - results (list): Per algorithm a dict with fit time, batch predict time, single-row p50 latency
+      and whether the predictions match brute force.
+    """
+    X_train = np.asarray(X_train, dtype=np.float64)
+    X_query = np.asarray(X_query, dtype=np.float64)
+    rows = X_query[np.arange(n_single) % len(X_query)]
+
+    results = []
+    reference = None
+    for algorithm in algorithms:
+        model = KNeighborsClassifier(n_neighbors=n_neighbors, weights=weights, metric=metric, algorithm=algorithm)
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        y_pred = model.predict(X_query)
+        batch_time = time.perf_counter() - start
+
+        single = np.empty(n_single)
+        for i in range(n_single):
+            start = time.perf_counter()
+            model.predict(rows[i:i + 1])
+            single[i] = time.perf_counter() - start
+
+        if reference is None:
+            reference = y_pred
+        results.append({
+            "Algorithm": algorithm,
+            "Fit (ms)": fit_time * 1000,
+            "Batch predict (ms)": batch_time * 1000,
+            "Single p50 (ms)": np.percentile(single, 50) * 1000,
+            "Matches first": bool(np.array_equal(y_pred, reference)),
+        })
+
+    print(f"\n{'Algorithm':<12}{'Fit (ms)':>10}{'Batch (ms)':>12}{'Single p50 (ms)':>17}{'Same preds':>12}")
+    for r in results:
+        print(f"{r['Algorithm']:<12}{r['Fit (ms)']:>10.2f}{r['Batch predict (ms)']:>12.2f}"
+              f"{r['Single p50 (ms)']:>17.3f}{str(r['Matches first']):>12}")
+    return results
+
+
+def train_knn(X_train, y_train, reuse_index=False, algorithm="kd_tree"):
     """
     Trains a KNN model with hyperparameter tuning.
     
+    Parameters:
+    - reuse_index (bool): Use search_knn_index (one tree index per fold) instead of GridSearchCV.
+    - algorithm (str): Neighbour algorithm of the index search.
+
     Returns:
     - Best trained KNN model.
     """
     param_grid = {'n_neighbors': [3, 5, 7, 9], 'weights': ['uniform', 'distance']}
-    knn = KNeighborsClassifier()
-    grid_search = GridSearchCV(knn, param_grid, cv=5, scoring='accuracy')
-    grid_search.fit(X_train, y_train)
+    if reuse_index:
+        grid_search = search_knn_index(X_train, y_train, param_grid, cv=5, algorithm=algorithm)
+    else:
+        knn = KNeighborsClassifier()
+        grid_search = GridSearchCV(knn, param_grid, cv=5, scoring='accuracy')
+        grid_search.fit(X_train, y_train)
     
     print("Best parameters:", grid_search.best_params_)
     return grid_search.best_estimator_
@@ -1,13 +1,55 @@
+import os
+import hashlib
 import numpy as np
 import pywt
 
-def wavelet_transform(X, wavelet="db4", level=4):
-    transformed_data = []
-    
-    for i in range(X.shape[0]):  # Loop through each sample (row)
-        coeffs = pywt.wavedec(X.iloc[i, :], wavelet, level=level)
-        transformed_sample = np.concatenate(coeffs)  # Flatten coefficients
-        transformed_data.append(transformed_sample)
 
-    return np.array(transformed_data)
+def _wavelet_cache_path(cache_dir, X, wavelet, level):
+    # Cache file name from the dataset fingerprint (shape, dtype, contents) and the wavelet settings
+    digest = hashlib.sha1(f"{X.shape}|{X.dtype.str}|{wavelet}|{level}|{pywt.__version__}".encode())
+    digest.update(np.ascontiguousarray(X).tobytes())
+    return os.path.join(cache_dir, f"wavelet_{digest.hexdigest()}.npy")
 
+
+def wavelet_transform(X, wavelet="db4", level=4, cache_dir=None):
+    """
+    Multi-level discrete wavelet decomposition of every spectrum, flattened to one feature row.
+
+    The decomposition runs along axis 1 for the whole matrix at once, and the
+    coefficients [cA_level, cD_level, ..., cD_1] are written into one preallocated array.
+
+    Parameters:
+    - X (DataFrame or numpy array): Spectra (samples x wavelengths).
+    - wavelet (str): Wavelet name (default: "db4").
+    - level (int): Decomposition level.
+    - cache_dir (str): Optional folder; results are cached per dataset fingerprint, wavelet and level.
+
+    Returns:
+    - transformed_data (numpy array): Flattened coefficients (samples x coefficients).
+    """
+    X = np.asarray(X, dtype=np.float64)
+
+    cache_path = None
+    if cache_dir:
+        cache_path = _wavelet_cache_path(cache_dir, X, wavelet, level)
+        if os.path.isfile(cache_path):
+            return np.load(cache_path)
+
+    coeffs = pywt.wavedec(X, wavelet, level=level, axis=1)
+
+    # Preallocate the flattened output and copy every coefficient block into place
+    widths = [c.shape[1] for c in coeffs]
+    transformed_data = np.empty((X.shape[0], sum(widths)), dtype=coeffs[0].dtype)
+    offset = 0
+    for c, width in zip(coeffs, widths):
+        transformed_data[:, offset:offset + width] = c
+        offset += width
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, transformed_data)
+        os.replace(tmp_path, cache_path)
+
+    return transformed_data
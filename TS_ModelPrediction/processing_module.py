@@ -6,8 +6,25 @@ from scipy.interpolate import interp1d
 import onnxruntime as ort
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score, confusion_matrix
 
+# === Numeric dtype policy ===
+def resolve_dtype(dtype):
+    """
+    Validates the numeric dtype used from parsing through normalization.
+
+    Parameters:
+    - dtype: "float32", "float64" (or the numpy equivalents). None means float64.
+
+    Returns:
+    - numpy dtype
+    """
+    dtype = np.dtype(dtype if dtype is not None else np.float64)
+    if dtype not in (np.dtype(np.float32), np.dtype(np.float64)):
+        raise ValueError(f"Invalid dtype: {dtype}. Choose 'float32' or 'float64'.")
+    return dtype
+
+
 # === 1. Read main file ===
-def read_main_file(file_path, integration_time=None):
+def read_main_file(file_path, integration_time=None, dtype=None):
     with open(file_path, 'r') as f:
         lines = [line.strip() for line in f if line.strip()]  
 
@@ -64,6 +81,15 @@ def read_main_file(file_path, integration_time=None):
     else:
         intensities = data_groups
         metadata = meta_groups
+
+    # Convert to arrays of the requested dtype right after parsing
+    if dtype is not None:
+        wavelengths = np.asarray(wavelengths, dtype=dtype)
+        try:
+            intensities = np.array(intensities, dtype=dtype).reshape(len(intensities), -1)
+        except ValueError:
+            # Rows of different lengths stay a list of 1D arrays
+            intensities = [np.asarray(row, dtype=dtype) for row in intensities]
     return wavelengths, intensities, metadata
 
 
@@ -206,8 +232,11 @@ def subtract_background(main_groups, background_avg):
 # === 4. Filtering & preprocessing ===
 def apply_fir_filter(data, sample_rate=None, cutoff_freq=10, numtaps=101):
     nyquist = sample_rate / 2
-    fir_coeff = firwin(numtaps, cutoff_freq / nyquist)
-    return lfilter(fir_coeff, 1.0, data)
+    data = np.asarray(data)
+    # Match the coefficients to float32 input so lfilter does not upcast to float64
+    dtype = data.dtype if data.dtype == np.float32 else np.float64
+    fir_coeff = firwin(numtaps, cutoff_freq / nyquist).astype(dtype)
+    return lfilter(fir_coeff, np.ones(1, dtype=dtype), data)
 
 def interpolate_to_standard(wavelength, intensity, new_range):
     f = interp1d(wavelength, intensity, kind='linear', fill_value="extrapolate")
@@ -237,13 +266,16 @@ def normalize_spectra(interpolated_intensity, wavelength):
 
 
 # === 5. Main processing + merging ===
-def process_directory(main_folder, darkref_folder, integration_time, source, emission, Reference_Sub="darkref"):
+def process_directory(main_folder, darkref_folder, integration_time, source, emission, Reference_Sub="darkref", dtype=None):
     """
     Reference_Sub:
         - "darkref": subtract dark reference file (cached by integration time)
         - "avg": subtract row-wise average intensity
         - "none": no subtraction
+    dtype:
+        - "float64" (default) or "float32": numeric type kept from parsing through normalization
     """
+    dtype = resolve_dtype(dtype)
     folder_path = main_folder
     source_only = source
     all_spectra = []
@@ -271,7 +303,7 @@ def process_directory(main_folder, darkref_folder, integration_time, source, emi
             continue
 
         main_file = os.path.join(folder_path, file)
-        main_wavelengths, main_intensities, metadata = read_main_file(main_file, integration_time=integration_time)
+        main_wavelengths, main_intensities, metadata = read_main_file(main_file, integration_time=integration_time, dtype=dtype)
 
         # Check for empty metadata or insufficient columns
         if not metadata or not metadata[0]:
@@ -292,7 +324,7 @@ def process_directory(main_folder, darkref_folder, integration_time, source, emi
 
         ab_status = meta_row[ab_status_idx]
         file_source = meta_row[source_idx].split()[-1].upper().strip("()")
-        new_wavelength_range = np.linspace(400, 940, len(main_wavelengths))
+        new_wavelength_range = np.linspace(400, 940, len(main_wavelengths), dtype=dtype)
 
         # Skip if source mismatch
         if file_source != source_only:
@@ -317,7 +349,7 @@ def process_directory(main_folder, darkref_folder, integration_time, source, emi
                         main_wavelengths=main_wavelengths,
                         integration_time=int_time
                     )
-                    darkref_cache[int_time] = (background_wl, background_avg)
+                    darkref_cache[int_time] = (background_wl, background_avg.astype(dtype))
                 else:
                     background_wl, background_avg = darkref_cache[int_time]
 
@@ -325,14 +357,14 @@ def process_directory(main_folder, darkref_folder, integration_time, source, emi
 
             elif Reference_Sub.lower() == "avg":
                 row_mean = np.mean(intensity)
-                sub_intensity = np.array(intensity) - row_mean
+                sub_intensity = np.asarray(intensity, dtype=dtype) - row_mean
 
             else:
                 raise ValueError(f"Invalid Reference_Sub: {Reference_Sub}")
 
             # === Preprocessing ===
             filtered = apply_fir_filter(sub_intensity, sample_rate=len(sub_intensity))
-            interpolated = interpolate_to_standard(np.array(main_wavelengths), filtered, new_wavelength_range)
+            interpolated = interpolate_to_standard(main_wavelengths, filtered, new_wavelength_range).astype(dtype, copy=False)
             normalized = normalize_spectra(interpolated, new_wavelength_range)
 
             # flatten normalized (convert from (1, N) -> (N,))
@@ -349,12 +381,89 @@ def process_directory(main_folder, darkref_folder, integration_time, source, emi
     print(f"\n[Filter Summary] Kept: {kept_count}, Skipped: {skipped_count}, Total: {kept_count + skipped_count}")
 
     # === Return all processed data without train/test split ===
-    X = np.array(all_spectra)
+    X = np.array(all_spectra, dtype=dtype)
     y = np.array(all_labels)
 
     return X, y, new_wavelength_range
 
 
+def run_onnx_model(onnx_model_path, X):
+    """
+    Runs an ONNX model on a feature matrix and returns its first output.
+
+    Parameters:
+    - onnx_model_path (str): Path to the .onnx file.
+    - X (DataFrame or numpy array): Feature matrix; converted to float32 (a no-op for float32 input).
+
+    Returns:
+    - y_pred (numpy array): First model output (labels or class probabilities).
+    """
+    X_np = np.ascontiguousarray(np.asarray(X), dtype=np.float32)
+
+    session = ort.InferenceSession(onnx_model_path, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    output_name = session.get_outputs()[0].name
+    return session.run([output_name], {input_name: X_np})[0]
+
+
+def validate_dtype_policy(main_folder, darkref_folder, integration_time, source, emission, ratio_ranges,
+                          Reference_Sub="darkref", onnx_model_path=None, plan=None):
+    """
+    Runs the preprocessing and feature pipeline in float64 and float32 and reports how far
+    the float32 results deviate from the float64 reference.
+
+    Parameters:
+    - main_folder, darkref_folder, integration_time, source, emission, Reference_Sub: As for process_directory.
+    - ratio_ranges (dict): Power ratio definitions passed to calculate_spectral_features.
+    - onnx_model_path (str): Optional ONNX model; when given, predictions are compared as well.
+    - plan (FeaturePlan): Optional feature plan used instead of ratio_ranges.
+
+    Returns:
+    - report (dict): Maximum spectrum, feature (per column) and prediction deviations.
+    """
+    from ml_framework.powerRatioFeatures import calculate_spectral_features
+
+    results = {}
+    for dtype in ("float64", "float32"):
+        X, y, wavelengths = process_directory(main_folder, darkref_folder, integration_time, source, emission,
+                                              Reference_Sub=Reference_Sub, dtype=dtype)
+        features = calculate_spectral_features(X, pd.Series(y), wavelengths, ratio_ranges, plan=plan)
+        features = features.drop(columns=["Label"]).apply(pd.to_numeric, errors="coerce")
+        results[dtype] = (X, features)
+
+    (X64, features64), (X32, features32) = results["float64"], results["float32"]
+    if X64.shape != X32.shape:
+        # Spectra near the low-signal threshold were kept in one path but not the other
+        print(f"[Warning] float32 kept {X32.shape[0]} spectra, float64 kept {X64.shape[0]}; deviations not computed.")
+        return {"rows_float64": X64.shape[0], "rows_float32": X32.shape[0]}
+
+    feature_deviation = (features32 - features64).abs().max()
+    report = {
+        "rows": X64.shape[0],
+        "max_spectrum_deviation": float(np.max(np.abs(X32.astype(np.float64) - X64))) if X64.size else 0.0,
+        "max_feature_deviation": feature_deviation.to_dict(),
+        "max_relative_feature_deviation": ((features32 - features64).abs() / features64.abs().replace(0, np.nan)).max().to_dict(),
+    }
+
+    if onnx_model_path is not None:
+        pred64 = run_onnx_model(onnx_model_path, features64.fillna(features64.mean()))
+        pred32 = run_onnx_model(onnx_model_path, features32.fillna(features32.mean()))
+        labels64 = np.argmax(pred64, axis=1) if pred64.ndim > 1 else pred64
+        labels32 = np.argmax(pred32, axis=1) if pred32.ndim > 1 else pred32
+        report["max_prediction_deviation"] = float(np.max(np.abs(pred32.astype(np.float64) - pred64))) if pred64.size else 0.0
+        report["prediction_mismatches"] = int(np.sum(labels64 != labels32))
+
+    print("\n[Dtype Validation] float32 vs float64")
+    print(f"Max spectrum deviation: {report['max_spectrum_deviation']:.3e}")
+    for name, value in report["max_feature_deviation"].items():
+        print(f"Max deviation {name}: {value:.3e}")
+    if "prediction_mismatches" in report:
+        print(f"Max prediction deviation: {report['max_prediction_deviation']:.3e}")
+        print(f"Prediction mismatches: {report['prediction_mismatches']} / {report['rows']}")
+
+    return report
+
+
 def evaluate_onnx_model(onnx_model_path, X_test, y_test, label_encoder):
     import numpy as np
     import pandas as pd
@@ -366,16 +475,9 @@ def evaluate_onnx_model(onnx_model_path, X_test, y_test, label_encoder):
         X_test = pd.DataFrame(X_test)
 
     X_test.columns = [f"f{i}" for i in range(X_test.shape[1])]
-    X_np = X_test.astype(np.float32).to_numpy()
-
-    X_np = X_test.astype(np.float32).to_numpy()
-
-    session = ort.InferenceSession(onnx_model_path, providers=["CPUExecutionProvider"])
-    input_name = session.get_inputs()[0].name
-    output_name = session.get_outputs()[0].name
 
     # Run inference
-    y_pred = session.run([output_name], {input_name: X_np})[0]
+    y_pred = run_onnx_model(onnx_model_path, X_test)
     y_pred_labels = np.argmax(y_pred, axis=1) if y_pred.ndim > 1 else (y_pred > 0.5).astype(int)
 
     # Encode test labels
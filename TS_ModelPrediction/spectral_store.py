@@ -0,0 +1,205 @@
+import json
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Columns used to partition the store on disk (hive style: Source=XENON/ABStatus=AB_OFF/...)
+PARTITION_COLS = ("Source", "ABStatus")
+
+
+def spectrum_columns(n_wavelengths):
+    """Returns the spectrum column names "Feature 1" ... "Feature n" used throughout the pipeline."""
+    return [f"Feature {i+1}" for i in range(n_wavelengths)]
+
+
+def write_spectral_store(path, spectra, labels, wavelengths, metadata=None, features=None,
+                         partition_cols=PARTITION_COLS, row_group_size=8192, compression="zstd"):
+    """
+    Writes spectra, labels, metadata and engineered features to a partitioned Parquet dataset.
+
+    Spectra and engineered features are stored as float32 columns. Parquet row-group
+    statistics are written so readers can skip row groups, and the dataset is
+    partitioned by light source and AB status.
+
+    Parameters:
+    - path (str): Root directory of the dataset. New files are added next to existing ones.
+    - spectra (numpy array or DataFrame): Spectral intensity data (samples x wavelengths).
+    - labels (array-like): Label of every spectrum.
+    - wavelengths (array-like): Wavelength values of the spectrum columns.
+    - metadata (DataFrame or dict): Per-sample metadata. Scalars in a dict are repeated for every sample.
+      Must provide the partition columns.
+    - features (DataFrame): Engineered features (e.g. from calculate_spectral_features). A "Label" column is ignored.
+    - partition_cols (tuple): Metadata columns used to partition the dataset.
+    - row_group_size (int): Maximum rows per Parquet row group.
+    - compression (str): Parquet compression codec.
+
+    Returns:
+    - table (pa.Table): The table that was written.
+    """
+    spectra = np.asarray(spectra, dtype=np.float32)
+    wavelengths = np.asarray(wavelengths, dtype=np.float64).ravel()
+    n_samples = spectra.shape[0]
+
+    if spectra.ndim != 2 or spectra.shape[1] != len(wavelengths):
+        raise ValueError(f"spectra must be (samples x {len(wavelengths)}) to match the wavelengths, got {spectra.shape}.")
+    labels = np.asarray(labels).ravel()
+    if len(labels) != n_samples:
+        raise ValueError(f"Expected {n_samples} labels, got {len(labels)}.")
+
+    metadata = pd.DataFrame(metadata if metadata is not None else {}, index=pd.RangeIndex(n_samples))
+    missing = [col for col in partition_cols if col not in metadata.columns]
+    if missing:
+        raise ValueError(f"metadata is missing partition columns: {missing}")
+
+    columns = {}
+    for col in metadata.columns:
+        values = metadata[col]
+        # Partition keys and mixed-type metadata (e.g. TargetNumber) are stored as strings
+        columns[col] = pa.array(values.astype(str) if values.dtype == object or col in partition_cols else values)
+    columns["Label"] = pa.array(labels.astype(str))
+
+    if features is not None:
+        features = features.drop(columns=["Label"], errors="ignore").reset_index(drop=True)
+        if len(features) != n_samples:
+            raise ValueError(f"Expected {n_samples} feature rows, got {len(features)}.")
+        for col in features.columns:
+            # None entries (e.g. undefined ratios) become NaN instead of object columns
+            columns[str(col)] = pa.array(pd.to_numeric(features[col], errors="coerce").to_numpy(dtype=np.float32))
+
+    for col, values in zip(spectrum_columns(spectra.shape[1]), spectra.T):
+        if col in columns:
+            raise ValueError(f"Column name collision: {col}")
+        columns[col] = pa.array(values)
+
+    table = pa.table(columns)
+    table = table.replace_schema_metadata({"wavelengths": json.dumps(wavelengths.tolist())})
+
+    partitioning = ds.partitioning(pa.schema([table.schema.field(col) for col in partition_cols]), flavor="hive")
+    file_options = ds.ParquetFileFormat().make_write_options(compression=compression, write_statistics=True)
+    ds.write_dataset(
+        table, path, format="parquet", partitioning=partitioning, file_options=file_options,
+        max_rows_per_group=row_group_size, min_rows_per_group=min(row_group_size, 1024),
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return table
+
+
+def _filter_expression(filters):
+    # {"Source": "XENON", "ABStatus": ["AB_OFF", "AB_ON"]} -> dataset expression
+    expression = None
+    for col, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            term = ds.field(col).isin(list(value))
+        else:
+            term = ds.field(col) == value
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def open_spectral_store(path, partition_cols=PARTITION_COLS):
+    """
+    Opens the Parquet dataset written by write_spectral_store.
+
+    Files written at different times may carry different feature columns, so the
+    dataset schema is unified from all file footers instead of taken from the first file.
+    """
+    partition_schema = pa.schema([(col, pa.string()) for col in partition_cols])
+    partitioning = ds.partitioning(partition_schema, flavor="hive")
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    if len(schemas) > 1:
+        schema = pa.unify_schemas(schemas + [partition_schema])
+        dataset = ds.dataset(path, format="parquet", partitioning=partitioning, schema=schema)
+    return dataset
+
+
+def read_store_wavelengths(dataset):
+    """Returns the wavelength grid stored in the dataset schema."""
+    return np.asarray(json.loads(dataset.schema.metadata[b"wavelengths"]))
+
+
+def read_spectral_store(path, columns=None, filters=None):
+    """
+    Reads selected columns and partitions of the store into a DataFrame.
+
+    Only the requested columns are read, partitions that do not match the filters are
+    skipped, and row groups are pruned with their statistics. Numeric columns are
+    converted without consolidating them into a single block.
+
+    Parameters:
+    - path (str): Root directory of the dataset.
+    - columns (list): Columns to read (default: all).
+    - filters (dict): Column -> value or list of values, e.g. {"Source": "XENON", "ABStatus": "AB_OFF"}.
+
+    Returns:
+    - frame (pd.DataFrame): Selected data.
+    """
+    dataset = open_spectral_store(path)
+    table = dataset.to_table(columns=columns, filter=_filter_expression(filters))
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_spectra(path, filters=None, wavelength_range=None, label_col="Label"):
+    """
+    Reads spectra as a float32 matrix together with their labels.
+
+    Parameters:
+    - path (str): Root directory of the dataset.
+    - filters (dict): Partition/column filters, see read_spectral_store.
+    - wavelength_range (tuple): Optional (start, end) in nm; only those spectrum columns are read.
+    - label_col (str): Column holding the labels.
+
+    Returns:
+    - spectra (numpy array): float32 matrix (samples x selected wavelengths).
+    - labels (numpy array): Labels of the spectra.
+    - wavelengths (numpy array): Wavelengths of the selected columns.
+    """
+    dataset = open_spectral_store(path)
+    wavelengths = read_store_wavelengths(dataset)
+    selected = np.arange(len(wavelengths))
+    if wavelength_range is not None:
+        selected = np.flatnonzero((wavelengths >= wavelength_range[0]) & (wavelengths <= wavelength_range[1]))
+
+    names = [f"Feature {i+1}" for i in selected]
+    table = dataset.to_table(columns=names + [label_col], filter=_filter_expression(filters))
+
+    # Fill the (column-major) matrix column by column straight from the Arrow buffers
+    spectra = np.empty((table.num_rows, len(names)), dtype=np.float32, order="F")
+    for j, name in enumerate(names):
+        offset = 0
+        for chunk in table.column(name).chunks:
+            values = chunk.to_numpy(zero_copy_only=chunk.null_count == 0)
+            spectra[offset:offset + len(values), j] = values
+            offset += len(values)
+
+    labels = table.column(label_col).to_numpy()
+    return spectra, labels, wavelengths[selected]
+
+
+def iter_spectra_batches(path, filters=None, batch_size=8192, label_col="Label"):
+    """
+    Streams spectra and labels from the store in batches, so only one batch is in memory at a time.
+
+    Parameters:
+    - path (str): Root directory of the dataset.
+    - filters (dict): Partition/column filters, see read_spectral_store.
+    - batch_size (int): Maximum rows per batch.
+    - label_col (str): Column holding the labels.
+
+    Yields:
+    - spectra (numpy array): float32 matrix (batch rows x wavelengths).
+    - labels (numpy array): Labels of the batch.
+    """
+    dataset = open_spectral_store(path)
+    names = spectrum_columns(len(read_store_wavelengths(dataset)))
+    for batch in dataset.to_batches(columns=names + [label_col], filter=_filter_expression(filters), batch_size=batch_size):
+        if batch.num_rows == 0:
+            continue
+        spectra = np.empty((batch.num_rows, len(names)), dtype=np.float32)
+        for j, name in enumerate(names):
+            spectra[:, j] = batch.column(j).to_numpy(zero_copy_only=False)
+        yield spectra, batch.column(len(names)).to_numpy(zero_copy_only=False)